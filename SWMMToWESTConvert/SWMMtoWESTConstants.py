@@ -8,6 +8,63 @@ FLOW_PER_PERSON = 0.4  #m3/d as in WEST
 MAX_TANKS = 10
 
 
+MAX_BRANCH_DEPTH = 1 # Levels of branches modelled as tanks in series (1: only the branches of the trunk, 2: also their relevant branches...)
+MIN_BRANCH_FLOW = None # Minimum flow (m3/s, flow used to rank the links) of a relevant connecting pipe to be modelled as a branch. None for no minimum
+BRANCH_WORKERS = 1 # Processes modelling the branches in parallel (1: one after the other, None: one per CPU)
+
+
+PATH_SEARCH_MAX_STEPS = 10**6 #Maximum number of links explored when searching a path between two nodes
+SNAP_MEASUREMENT_NODES = False #Whether measurement nodes draining into a path (but not on it) break the path at the link they drain into
+
+
+STABILISATION_DAYS = 1 #Days at the start of the simulation before the flow is assumed to be stable
+
+
+#Keys of the description of a SWMM binary output (.out)
+OUT_MAGIC = 516114522 #First and last number of a valid .out
+OUT_SUBCATCHMENTS = 'OutSubcatchments'
+OUT_NODES = 'OutNodes'
+OUT_LINKS = 'OutLinks'
+OUT_N_VARS = 'NumberVariables'
+OUT_START = 'StartDate'
+OUT_REPORT_STEP = 'ReportStep'
+OUT_PERIODS = 'Periods'
+OUT_RESULTS_START = 'ResultsStart'
+OUT_PERIOD_SIZE = 'BytesPerPeriod'
+RESULTS_CHUNK_MEMORY = 64 * 1024**2 #bytes, the results are processed in chunks of periods of at most this size, and a SimulationResults keeps at most this size of series in memory
+
+USE_RESULTS_CACHE = False #Reads the link flows from a columnar copy of the .out stored on disk, next to the .out
+RESULTS_CACHE_DIR = '.resultsCache' #Folder created next to the .out to store the cache
+RESULTS_CACHE_MAX_SIZE = 2 * 1024**3 #bytes, the least recently used caches are deleted above this size
+CACHE_FLOWS_FILE = 'linkFlows.npy'
+CACHE_META_FILE = 'meta.json'
+CACHE_SIGNATURE = 'Signature'
+CACHE_LINKS = 'Links'
+CACHE_START = 'Start'
+CACHE_REPORT_STEP = 'ReportStep'
+CACHE_PERIODS = 'Periods'
+CACHE_STATS_FILE = 'linkStats.npy'
+
+STAT_MEAN = 'MeanFlow'
+STAT_MIN = 'MinFlow'
+STAT_MAX = 'MaxFlow'
+STAT_VOLUME = 'Volume'
+STAT_HOUR_PREFIX = 'MeanFlowHour'
+RANK_FLOW = 'RankingFlow'
+HAS_FLOW = 'HasFlow'
+
+#PCSWMM database of the results (.db next to the .inp)
+USE_RESULTS_DB = False #Ranks the links with the maximum flows of the database instead of the mean flows of the .out
+DB_LINK_TABLES = ['Conduits_Results', 'Pumps_Results', 'Orifices_Results', 'Weirs_Results']
+DB_NODE_TABLES = ['Junctions_Results', 'Outfalls_Results', 'Storages_Results']
+DB_SUBCATCHMENT_TABLES = ['Subcatchments_Results']
+DB_NAME = 'Name'
+DB_MAX_FLOW = 'MaxFlow'
+DB_TOTAL_INFLOW = 'TotInflow'
+DB_LATERAL_INFLOW = 'TotLatFlow'
+DB_RUNOFF_VOLUME = 'TotRunoffV'
+
+
 LINKS = "Links"
 LEAVES = "Leaves"
 SUBCATCHMENTS = "Catchments"
@@ -54,9 +111,20 @@ DISCHARGE_PIPE_NAME = 'Name_dischargingPipe'
 
 BREAK_POINT = "BreakPoint"
 PATH = 'PathTankInSeries'
+SUBBRANCHES = 'SubBranches'
 WCATCHMENTS = 'WESTCatchments' 
 TRUNK = 'Trunk'
 
+#Columns of the evaluation of the aggregation parameters (see aggregateNetwork.sweepAggregation)
+SWEEP_PERC_LIM = 'PercLimToBranch'
+SWEEP_MAX_TANKS = 'MaxTanks'
+NUM_TANKS = 'NumberTanks'
+NUM_CATCHMENTS = 'NumberCatchments'
+NUM_BRANCHES = 'NumberBranches'
+NUM_SUBMODELS = 'NumberSubmodels'
+FLOW_SHARE = 'RepresentedFlowShare'
+SWEEP_ERROR = 'Error'
+
 
 # DIST_TO_LEAF = "DistanceToOriginLeaf"
 
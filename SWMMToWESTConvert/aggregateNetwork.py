@@ -1,7 +1,7 @@
 import pandas as pd 
 import numpy as np
-from pyswmm import Output
-from swmm.toolkit.shared_enum import LinkAttribute
+import os, io, sys, contextlib
+from concurrent.futures import ProcessPoolExecutor
 
 
 #Files with constants
@@ -13,167 +13,157 @@ import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
 import SWMMToWESTConvert.convertSWMMToWEST as cw
 import SWMMToWESTConvert.findPaths as fp
 import SWMMToWESTConvert.getNetworkFromSWMM as gnpd
+import SWMMToWESTConvert.networkTopology as nt
 
-def findTrunk(idWRRF:str, outfile:str, links:pd.DataFrame, idTrunkIni:str=None)->pd.DataFrame:
+def findTrunk(idWRRF:str, results:gnpd.SimulationResults, network:nt.Network, idTrunkIni:str=None, predecessors:np.ndarray=None)->pd.DataFrame:
     """
         Finds the trunk of the network. If the start point of the trunk is known then finds the path between that point and the WRRF.
         Otherwise, it selects the path with largest flow, starting from the WRRF.
     Args:
         idWRRF (str): id name of the node in the .inp representing the entrance of the WRRF
-        outfile (str): path of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
-        links (pd.DataFrame): links (pipes, pumps..) of the network
+        results (gnpd.SimulationResults): opened results of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
+        network (nt.Network): links (pipes, pumps..) of the network and their connectivity, with the links table in network.links
         idTrunkIni (str,optional): id name of the most upstream node of the trunk in the .inp. Defaults to None.
+        predecessors (np.ndarray,optional): main upstream link of every node (see fp.getMainFlowPredecessors). Defaults to None (computed).
     Returns:
         pd.Dataframe: each record is a link on the trunk and columns are characteristics, ordered upstream to downstream.
     """    
     if idTrunkIni is None:
-        trunkDF = fp.findMainFlowPath(idWRRF,outfile,links) #Gets the path of the larges flow 
+        trunkDF = fp.findMainFlowPath(idWRRF,results,network,predecessors) #Gets the path of the larges flow 
     else:
-        path = fp.getPathToWRRF(idWRRF,links,[idTrunkIni]) #Get path as a list from leave to WRRF
-        trunkDF = convertListPathtoDF(path[idTrunkIni],links) 
+        path = fp.findPath(idTrunkIni,idWRRF,network) #Get path as a list from leave to WRRF
+        trunkDF = convertListPathtoDF(path,network) 
 
     return trunkDF
 
-def getPipesConnectedToPath(linksMainPath:pd.DataFrame, allLinks:pd.DataFrame) -> pd.DataFrame:
+def convertConnectedPipesToDF(connected:np.ndarray, pathPipes:np.ndarray, network:nt.Network) -> pd.DataFrame:
     """
-        Search for pipes connected to a path.
+        Converts the pipes connected to a path (see nt.Network.getLinksConnectedToPath) into a dataframe.
     Args:
-        linksMainPath (pd.DataFrame): Links in the main path
-        allLinks (pd.DataFrame): All the links of the network
+        connected (np.ndarray): ids of the pipes connected to the path
+        pathPipes (np.ndarray): id of the pipe of the path just before the connection of each of them
+        network (nt.Network): All the links of the network
     Returns:
         pd.DataFrame: pipes connected to the path associated with the pipe just before their connection and the outnode.
     """    
-    linksPathOutNodes = linksMainPath[[SWWM_C.OUT_NODE]] 
-    pipesNotPath = allLinks[~allLinks.index.isin(linksPathOutNodes.index)].copy() #Gets the links that are not in the path
-    assert allLinks.shape[0] == pipesNotPath.shape[0] + linksMainPath.shape[0] ,f"The total number of pipes is the same as the sum of pipes in the path and pipes not in the path"
-
-    #pipesNotPath.to_csv('pipesNotInPath.csv')
-    
-    #Gets links in the network connected to the path (but not part of it)
-    pipesConnected = pipesNotPath[pipesNotPath[SWWM_C.OUT_NODE].isin(linksPathOutNodes[SWWM_C.OUT_NODE])][[SWWM_C.OUT_NODE]].copy()
-    print("There are", pipesConnected.shape[0], "connections to the path")
-
-    #pipesConnected.to_csv('pipesConnected.csv')
-
-    #creates a dataframe with the name of the discharging pipe and one column with the name of the pipe of the trunk before the discharge
-    pipesConnected = pipesConnected.reset_index().set_index([SWWM_C.OUT_NODE]).join(
-                                                                            linksPathOutNodes.reset_index().set_index([SWWM_C.OUT_NODE]),
-                                                                            lsuffix=STW_C.CONNECTED_PIPE_SUFFIX, 
-                                                                            rsuffix=STW_C.TRUNK_PIPE_SUFFIX)
-
-    pipesConnected = pipesConnected.reset_index().set_index(SWWM_C.NAME + STW_C.CONNECTED_PIPE_SUFFIX) #resets the index again to name
+    #one row per discharging pipe with its outnode and the pipe of the trunk before the discharge
+    pipesConnected = pd.DataFrame({SWWM_C.OUT_NODE: network.nodeNames[network.linkOutNode[connected]],
+                                   STW_C.TRUNK_PIPE_NAME: network.linkNames[pathPipes]},
+                                  index=pd.Index(network.linkNames[connected], name=SWWM_C.NAME + STW_C.CONNECTED_PIPE_SUFFIX))
 
     return pipesConnected
 
-def evaluateRelativeBranchInfluence(fileOut:str, branchPipe:str, comparisonPipe:str)->tuple[bool, pd.DataFrame]:
+def hasPathUpstream(links:np.ndarray, network:nt.Network)-> np.ndarray:
     """
-        Obtains the flowrate time series of the two pipes and decide if the brach is relevant or not.
-        If the mean flowrate of the branch is larger than the STW_C.PERC_LIM_TO_BRANCH % of the trunk then is relevant.
+        Checks which links receive other links at their inlet node. The path of a branch starts at the inlet node of its discharging pipe
+        (see modelBranches), so a pipe coming from a leaf has no path to model and is never selected as a branch.
     Args:
-        fileOut (str): Path of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
-        branchPipe (str): name of the pipe discharging into the trunk
-        trunkPipeBeforeBranch (str): trunk pipe just before the discharge of the branch pipe
+        links (np.ndarray): ids of the links
+        network (nt.Network): Links of the network and their connectivity
     Returns:
-        tuple[bool, pd.DataFrame]: true if the branch is relevant, time series of the flow rate of the branch
+        np.ndarray: True for the links with a path upstream
     """
-    #the flow from the connections to the path and the pipe before the discharge
-    dfTS = gnpd.getFlowTimeSeries([branchPipe,comparisonPipe],fileOut) #Gets the timeseries of both pipes (branchPipe, trunkPipeBeforeBranch)
+    inletNodes = network.linkInNode[links]
+    return network.inOffsets[inletNodes + 1] > network.inOffsets[inletNodes]
 
-    meanVals = dfTS.mean() #gets the mean of both flow timeseries
-    meanDischarging = meanVals[branchPipe]
-    limitFlowrate = meanVals[comparisonPipe] * STW_C.PERC_LIM_TO_BRANCH
+def evaluateRelativeBranchInfluence(linkFlows:np.ndarray, branchLinks:np.ndarray, comparisonLinks:np.ndarray, percLimToBranch:float=None)->np.ndarray:
+    """
+        Uses the mean flowrate of the two pipes to decide if the brach is relevant or not.
+        If the mean flowrate of the branch is larger than the percLimToBranch % of the trunk then is relevant.
+        Several branches can be evaluated at once, against one comparison pipe or one comparison pipe each.
+    Args:
+        linkFlows (np.ndarray): Mean flowrate of the links of the network (or the flow used to rank them), aligned with the link ids
+        branchLinks (int|np.ndarray): id of the pipes discharging into the trunk
+        comparisonLinks (int|np.ndarray): id of the trunk pipe just before the discharge of each branch pipe (or of the last pipe of the path)
+        percLimToBranch (float,optional): share of the flow of the comparison pipe over which the branch is relevant. Defaults to STW_C.PERC_LIM_TO_BRANCH.
+    Returns:
+        np.ndarray: true if the branch is relevant, one value per branch
+    """
+    if percLimToBranch is None:
+        percLimToBranch = STW_C.PERC_LIM_TO_BRANCH
 
+    meanDischarging = linkFlows[branchLinks]
+    limitFlowrate = linkFlows[comparisonLinks] * percLimToBranch
 
     relevant = meanDischarging > limitFlowrate
-    tsBranch =  dfTS.drop(columns=[comparisonPipe])
 
-    return relevant, tsBranch
+    return relevant
 
-def selectRelevantBranches(fileOut:str, isTrunk:bool, pipesConnected:pd.DataFrame, endPathLink:str=None)->tuple[pd.DataFrame,pd.DataFrame,pd.DataFrame]:
+def selectRelevantBranches(linkFlows:np.ndarray, linkHasFlow:np.ndarray, isTrunk:bool, branchLinks:np.ndarray, comparisonLinks:np.ndarray, 
+                           percLimToBranch:float=None, hasPath:np.ndarray=None)->tuple[np.ndarray,np.ndarray]:
     """
-        Iterates the DF of connected pipes, selecting the relevant branches and obtaining the ts of the pipes to be modelled as catchments.
+        Selects the relevant branches among the connected pipes and the pipes to be modelled as catchments.
         If the path is the network's trunk only not relevant pipes will be model as catchments.
         If the path is not the trunk then all connected pipes will be model as catchments.
+        The decisions use the ranking of the links aligned with their ids, so no time series is read, and are taken for all the pipes at once.
     Args:
-        fileOut (str): Path of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
+        linkFlows (np.ndarray): Flow used to rank each link (see gnpd.SimulationResults.getLinkRankingArrays)
+        linkHasFlow (np.ndarray): Whether each link has flow
         isTrunk (bool): Whether the path is the trunk of the network or not
-        pipesConnected (pd.DataFrame): Pipes connected to the trunk, with index the name of the pipe and a column with the trunk pipe just 
-                                       before the discharge.
-        endPathLink (str): The last downstream pipe of the path to use for the comparison of the relevant pipes. Default None.
+        branchLinks (np.ndarray): Ids of the pipes connected to the path.
+        comparisonLinks (int|np.ndarray): Id of the path pipe just before the discharge of each connected pipe, or of the last pipe of the path.
+        percLimToBranch (float,optional): Threshold to select the relevant pipes (see evaluateRelativeBranchInfluence). Defaults to STW_C.PERC_LIM_TO_BRANCH.
+        hasPath (np.ndarray,optional): Whether each connected pipe has a path upstream to model (see hasPathUpstream). Defaults to None (all have).
     Returns:
-        tuple[pd.DataFrame,pd.DataFrame,pd.DataFrame]: Time series of the pipes to be modelled as catchments, with name as columns and index the datetime.
-                                               Names of the connected pipes selected as relevant. Index is the name of the discharging pipe, columns are outnode and trunk pipe.
-                                               Pipes in the trunk where a discharging pipe that is going to be modelled as catchment.Index is the name of the discharging pipe, columns are outnode and trunk pipe.
+        tuple[np.ndarray,np.ndarray]: True for the connected pipes selected as relevant. True for the connected pipes to be modelled as catchments.
     """    
-    tsDFCatchments = pd.DataFrame()
-    relevantBranches = []
-
-    for branch, row in pipesConnected.iterrows(): #the index (branch) is the name of the discharging pipe
-
-        if endPathLink is None:
-            trunkPipe = row[STW_C.TRUNK_PIPE_NAME]
-            relevant, tsCurrentBranch = evaluateRelativeBranchInfluence(fileOut, branch, trunkPipe) #Evaluates if its relevant or not
-        else:
-            relevant, tsCurrentBranch = evaluateRelativeBranchInfluence(fileOut, branch, endPathLink)
-            
-        if ((tsCurrentBranch[branch] != 0).any()): #Checks that the values are not all zero
-            if (relevant):
-                relevantBranches.append(branch) 
-            
-            if (not relevant and isTrunk) or (not isTrunk): 
-                if (tsDFCatchments.shape[0] == 0):
-                    tsDFCatchments = tsCurrentBranch
-                else:
-                    tsDFCatchments = tsDFCatchments.join(tsCurrentBranch)
+    relevant = evaluateRelativeBranchInfluence(linkFlows, branchLinks, comparisonLinks, percLimToBranch) #Evaluates if they are relevant or not
+    if hasPath is not None: #pipes coming from a leaf are modelled as catchments
+        relevant &= hasPath
+    if STW_C.MIN_BRANCH_FLOW is not None: #small branches are not modelled in detail even if relevant for their path
+        relevant &= linkFlows[branchLinks] >= STW_C.MIN_BRANCH_FLOW
 
-    print(len(relevantBranches),' relevant branches')
-    print(tsDFCatchments.shape[1]," connections to the path to be converted into catchments") 
+    hasFlow = linkHasFlow[branchLinks] #Checks that the values are not all zero
+    relevantMask = hasFlow & relevant
+    catchmentMask = hasFlow & ~relevant if isTrunk else hasFlow
 
-    pipesWithCatchments = pipesConnected[pipesConnected.index.isin(tsDFCatchments.columns.to_list())]
-    revelantBranchesConnection = pipesConnected[pipesConnected.index.isin(relevantBranches)]
+    print(relevantMask.sum(),' relevant branches')
+    print(catchmentMask.sum()," connections to the path to be converted into catchments") 
 
-    assert len(pipesWithCatchments) == tsDFCatchments.shape[1] ,f"The number of pipes to be converted to catchments is not the same in both DFs"
+    return relevantMask, catchmentMask
 
-    return tsDFCatchments, revelantBranchesConnection, pipesWithCatchments
-
-def selectBranches(fileOut:str, mainPath:pd.DataFrame,links:pd.DataFrame,isTrunk:bool,isRelative:bool=True)-> tuple[pd.DataFrame,pd.DataFrame,pd.DataFrame]:    
+def selectBranches(results:gnpd.SimulationResults, mainPath:pd.DataFrame,network:nt.Network,isTrunk:bool,isRelative:bool=True,
+                   percLimToBranch:float=None)-> tuple[pd.DataFrame,pd.DataFrame]:    
     """
         It decides if it is a pipe connected to the path is relevant.
-        For this, it compares the flow timeseries of the connected pipe and the trunk before the connection. 
+        For this, it compares the mean flow of the connected pipe and the trunk before the connection. 
         If the flow of the pipe is larger than a set limit then it is selected as a branch.
         In case of the trunk, branches should be modeled in detail (tank series) and others just as a catchment.
         In case of a branch, sub relevant branches will be model as catchments in the spot and others aggregated at the next cut point.
     Args:
-        fileOut (str): Path of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
+        results (gnpd.SimulationResults): Opened results of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
         mainPath (pd.DataFrame): links in the main path. Index is the order of the pipe.
-        links (pd.DataFrame): All the links of the network
+        network (nt.Network): All the links of the network
         trunk (bool): Whether the path is the trunk of the network or not.
         isRelative (bool): Whether the selection of the relevant branches is done relative to the flow of the trunk at the joint point or not.
+        percLimToBranch (float,optional): Threshold to select the relevant branches. Defaults to STW_C.PERC_LIM_TO_BRANCH.
     Returns:
-        tuple[pd.DataFrame,pd.DataFrame,pd.DataFrame]: Connected pipes selected as relevant branches. Index is the name of the discharging pipe, columns are outnode and trunk pipe.
-                                            Timeseries of the pipes selected as catchments in columns index is datetime. For istrunk, these are only the not relevant, in other case it is all.
-                                            Pipes selected as catchments. Index is the name of the discharging pipe, columns are outnode and trunk pipe.
+        tuple[pd.DataFrame,pd.DataFrame]: Connected pipes selected as relevant branches. Index is the name of the discharging pipe, columns are outnode and trunk pipe.
+                                          Pipes selected as catchments (for istrunk, these are only the not relevant, in other case it is all). Index is the name of the discharging pipe, columns are outnode and trunk pipe.
     """    
-    pipesConnected = getPipesConnectedToPath(mainPath, links) #Gets the pipes connected to the path
+    pathLinks = network.getLinkIds(mainPath.index)
+    connected, pathPipes = network.getLinksConnectedToPath(pathLinks) #Gets the pipes connected to the path
+    print("There are", len(connected), "connections to the path")
     
-    if isRelative:
-        tsDFCatchments, relevantBranchCon, pipesCatchments = selectRelevantBranches(fileOut, isTrunk, pipesConnected)
-    else:
-        lastPipe = mainPath.iloc[-1].name
-        tsDFCatchments, relevantBranchCon, pipesCatchments = selectRelevantBranches(fileOut, isTrunk, pipesConnected, lastPipe)
+    comparisonLinks = pathPipes if isRelative else pathLinks[-1]
+    linkFlows, linkHasFlow = results.getLinkRankingArrays(network.linkNames)
+    relevantMask, catchmentMask = selectRelevantBranches(linkFlows, linkHasFlow, isTrunk, connected, comparisonLinks, percLimToBranch, 
+                                                         hasPathUpstream(connected, network))
+
+    pipesConnected = convertConnectedPipesToDF(connected, pathPipes, network)
 
-    return relevantBranchCon, tsDFCatchments, pipesCatchments 
+    return pipesConnected[relevantMask], pipesConnected[catchmentMask] 
 
-def convertListPathtoDF(path:list[str], linksNetwork:pd.DataFrame)->pd.DataFrame:
+def convertListPathtoDF(path:list[str], network:nt.Network)->pd.DataFrame:
     """
         Converts a path in list form into a dataframe with the pipes' characteristics maintaining the same order.
     Args:
         path (list[str]): list of names of the pipes in the path
-        linksNetwork (pd.DataFrame): links of the entire network. Index is the link name and columns are their attributes.
+        network (nt.Network): links of the entire network, the attributes are in the table network.links.
     Returns:
         pd.DataFrame: records are the pipes of the path in order, index is the name and columns are the attributes.
     """         
-    return linksNetwork.loc[path].copy()
+    return network.getLinksTable(network.getLinkIds(path))
 
 def getNetworkLookPoints(nElements:dict)->pd.DataFrame:
     """
@@ -197,6 +187,48 @@ def getNetworkLookPoints(nElements:dict)->pd.DataFrame:
 
     return lookPoints
 
+def getUpstreamAccumulation(topology:nt.NetworkTopology, networkLookPoints:pd.DataFrame, splitFlows:pd.Series=None)->tuple[pd.DataFrame,pd.DataFrame]:
+    """
+        Computes in one pass over the network the catchment area, mean DWF and direct inflow baseline upstream of every node and link.
+        At diverging nodes the values are split in proportion to splitFlows (e.g., the mean flow of the links) or to the MaxQ of the links.
+    Args:
+        topology (nt.NetworkTopology): connectivity of the network
+        networkLookPoints (pd.DataFrame): Nodes with flow elements and their characteristics (see getNetworkLookPoints). Index is OutletNode.
+        splitFlows (pd.Series, optional): flow of each link used to split the values, index is the link name. Defaults to None (MaxQ).
+    Returns:
+        tuple[pd.DataFrame,pd.DataFrame]: Accumulated Area, AverageValue and Baseline of each node (index OutletNode) and each link (index Name).
+                                          The nodes of a loop, and the links inside it, have the total of the loop.
+    """
+    columns = [SWWM_C.AREA, SWWM_C.INFLOW_MEAN, SWWM_C.DFLOW_BASELINE]
+    nodeValues = networkLookPoints[columns].groupby(level=0).sum().reindex(topology.nodeNames).fillna(0)
+    linkWeights = None if splitFlows is None else splitFlows.reindex(topology.linkNames).to_numpy(dtype=float)
+
+    nodeTotals, linkTotals = nt.accumulateUpstream(topology, nodeValues.to_numpy(), linkWeights)
+
+    nodesAccumulated = pd.DataFrame(nodeTotals, index=pd.Index(topology.nodeNames, name=SWWM_C.OUT_NODE), columns=columns)
+    linksAccumulated = pd.DataFrame(linkTotals, index=pd.Index(topology.linkNames, name=SWWM_C.NAME), columns=columns)
+
+    return nodesAccumulated, linksAccumulated
+
+def snapNodesToPath(nodes:list[str], pathDF:pd.DataFrame, network:nt.Network)->list[str]:
+    """
+        Replaces each node by the outlet node of the first link of the path it drains into, using the drainage tree of the path 
+        (see fp.DrainageTree). Nodes on the path are kept and nodes that do not drain into the path are left out.
+    Args:
+        nodes (list[str]): Names of the nodes (e.g., where measurements are taken).
+        pathDF (pd.DataFrame): Ordered links on the path with index pipe name.
+        network (nt.Network): Links of the network and their connectivity.
+    Returns:
+        list[str]: Outlet nodes of the path links where the nodes drain, in the order of the nodes given.
+    """    
+    pathLinks = network.getLinkIds(pathDF.index)
+    if len(pathLinks) == 0:
+        return []
+    tree = fp.DrainageTree(network.linkOutNode[pathLinks[-1]], network, pathLinks)
+
+    positions = [tree.getNearestPathLink(network.getNodeId(node), pathLinks) for node in nodes]
+    return [network.nodeNames[network.linkOutNode[pathLinks[position]]] for position in positions if position >= 0]
+
 def getBreakPoints(pathDF: pd.DataFrame, relevantBranches:pd.DataFrame, nodesMeasurement:list[str])->pd.DataFrame:
     """
         Select the links to break the path. These are the links where relevant branches join and where there are nodes where measurements are taken.
@@ -214,27 +246,28 @@ def getBreakPoints(pathDF: pd.DataFrame, relevantBranches:pd.DataFrame, nodesMea
 
     return linksToBreak
 
-def dividePathByBreakPoints(linksPath:pd.DataFrame,linksToBreak:pd.DataFrame)-> tuple[list[pd.DataFrame],list[int]]:
+def dividePathByBreakPoints(linksPath:pd.DataFrame,linksToBreak:pd.DataFrame)-> tuple[list[pd.DataFrame],np.ndarray]:
     """
         Splits the path using the links to break.
     Args:
         linksPath (pd.DataFrame): Links in the path
         linksToBreak (pd.DataFrame): Pipes where the path should be cutted. 
     Returns:
-        tuple[list[pd.DataFrame],list[int]]: Set of pipe sections cutted using the cut points. List of the cut points indexes in the complete path 
+        tuple[list[pd.DataFrame],np.ndarray]: Set of pipe sections cutted using the cut points. Sorted indexes of the cut points in the complete path 
     """   
-    indexCut= linksToBreak.index
-    indexCutLinks = list(indexCut + 1)
+    indexCut = np.sort(linksToBreak.index.to_numpy(dtype=np.int64))
+    sectionStarts = np.concatenate(([0], indexCut + 1))
+    sectionEnds = np.concatenate((indexCut + 1, [len(linksPath)]))
 
-    dfs = [linksPath.iloc[i:j] for i, j in zip([0] + indexCutLinks, indexCutLinks + [len(linksPath)])]
+    dfs = [linksPath.iloc[i:j] for i, j in zip(sectionStarts.tolist(), sectionEnds.tolist())]
     print("Number of resulting sections of the path" , len(dfs))
 
-    return dfs, list(indexCut)
+    return dfs, indexCut
 
 def getPathLookPoints(pathDF:pd.DataFrame, networkLookNodes:pd.DataFrame, pipesCatchments:pd.DataFrame)->pd.DataFrame:
     """
         Filters the network flow elements to obtain the flow elements on the path, and adds the pipes to be modelled as catchments
-        to the look points.
+        to the look points. The pipes discharging after the same pipe of the path are joined by commas, so each pipe of the path keeps one row.
     Args:
         pathDF (pd.DataFrame): Links in the main path with their characteristics, index is the order from upstream to downstream.
         networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
@@ -244,9 +277,9 @@ def getPathLookPoints(pathDF:pd.DataFrame, networkLookNodes:pd.DataFrame, pipesC
     """    
     pathWithLookPoints = pathDF.join(networkLookNodes, on=SWWM_C.OUT_NODE).copy() 
 
-    pipesTS = pipesCatchments.reset_index().set_index(STW_C.TRUNK_PIPE_NAME).rename(columns={STW_C.DISCHARGE_PIPE_NAME:STW_C.MODELED_INPUT})
+    pipesTS = pipesCatchments.reset_index().groupby(STW_C.TRUNK_PIPE_NAME, sort=False)[STW_C.DISCHARGE_PIPE_NAME].agg(','.join)
     
-    pathWithLookPoints = pathWithLookPoints.join(pipesTS.drop(columns=[SWWM_C.OUT_NODE]),on=SWWM_C.NAME)
+    pathWithLookPoints = pathWithLookPoints.join(pipesTS.rename(STW_C.MODELED_INPUT),on=SWWM_C.NAME)
 
     return pathWithLookPoints
 
@@ -280,6 +313,18 @@ def checkUniqueDWFPatterns(lookPointsPath:pd.DataFrame):
     assert len(lookPointsPath[STW_C.BREAK_POINT][groupedPatterns > 1].unique()) == 0,f"Sewer sections with different DWF patterns are trying to be grouped."  
     assert lookPointsPath[SWWM_C.NAME].nunique() == lookPointsPath.shape[0],f"There are duplicate names"
 
+def getSegmentIds(positions:np.ndarray, breaklinks:np.ndarray)-> np.ndarray:
+    """
+        Returns the segment of each position of the path: the number of cut points strictly upstream of it, so the positions between 
+        two consecutive cut points (the downstream one included) share a segment.
+    Args:
+        positions (np.ndarray): positions in the path (i.e., order of the pipes)
+        breaklinks (np.ndarray): sorted indexes of the cut points of the path
+    Returns:
+        np.ndarray: segment id of each position
+    """
+    return np.searchsorted(breaklinks, positions, side='left')
+
 def setAggregationNodes(pathWithLookPoints, breaklinks:list[int])->pd.DataFrame:
     """
         Set the aggregated node to the closest downstream node. In other words, finds the minimum value in breaklinks that is greater than or 
@@ -292,7 +337,10 @@ def setAggregationNodes(pathWithLookPoints, breaklinks:list[int])->pd.DataFrame:
     Returns:
         pd.DataFrame: Look points of the path with the break point at which their values should be aggregated.
     """    
-    pathWithLookPoints[STW_C.BREAK_POINT] = pathWithLookPoints.index.to_series().apply(lambda idx: min((n for n in breaklinks if n >= idx), default= pathWithLookPoints.index[-1]))
+    positions = pathWithLookPoints.index.to_numpy()
+    aggregationPoints = np.append(np.sort(np.asarray(breaklinks, dtype=positions.dtype)), positions[-1]) #the last point collects the rest
+
+    pathWithLookPoints[STW_C.BREAK_POINT] = aggregationPoints[getSegmentIds(positions, aggregationPoints[:-1])]
 
     return pathWithLookPoints
 
@@ -311,14 +359,30 @@ def aggregatePathLookPoints(pathWithLookPoints:pd.DataFrame, breaklinksIndexPath
     checkUniqueDWFPatterns(pathWithLookPoints) #TODO check this!
     
     # Groups by the sections elements to the nearest break point ----------------------------------------------------------
-    pathElements = pathWithLookPoints.groupby([STW_C.BREAK_POINT]).agg({SWWM_C.NAME: 'last',
-                                                                        SWWM_C.AREA:'sum', 
-                                                                        SWWM_C.INFLOW_MEAN: 'sum', 
-                                                                        SWWM_C.INFLOW_PATTERNS: 'first',
-                                                                        SWWM_C.DFLOW_BASELINE: 'sum', 
-                                                                        STW_C.MODELED_INPUT:lambda x: ','.join(str(val) for val in x if pd.notna(val))
-                                                                        }).set_index([SWWM_C.NAME]) 
-    
+    segments, rows = np.unique(pathWithLookPoints[STW_C.BREAK_POINT].to_numpy(), return_inverse=True)
+    nSegments = len(segments)
+
+    lastRows = np.zeros(nSegments, dtype=np.int64)
+    lastRows[rows] = np.arange(len(rows)) #the last write of each segment wins
+    pathElements = pd.DataFrame(index=pd.Index(pathWithLookPoints[SWWM_C.NAME].to_numpy()[lastRows], name=SWWM_C.NAME))
+
+    for column in [SWWM_C.AREA, SWWM_C.INFLOW_MEAN]:
+        pathElements[column] = np.bincount(rows, weights=np.nan_to_num(pathWithLookPoints[column].to_numpy(dtype=float)), minlength=nSegments)
+
+    patterns = pathWithLookPoints[SWWM_C.INFLOW_PATTERNS].to_numpy(dtype=object)
+    withPattern = np.flatnonzero(pd.notna(patterns))
+    patternSegments, firstPattern = np.unique(rows[withPattern], return_index=True)
+    pathElements[SWWM_C.INFLOW_PATTERNS] = pd.Series(patterns[withPattern[firstPattern]], index=patternSegments, dtype=object).reindex(range(nSegments)).to_numpy()
+
+    pathElements[SWWM_C.DFLOW_BASELINE] = np.bincount(rows, weights=np.nan_to_num(pathWithLookPoints[SWWM_C.DFLOW_BASELINE].to_numpy(dtype=float)), minlength=nSegments)
+
+    inputPipes = pathWithLookPoints[STW_C.MODELED_INPUT].to_numpy(dtype=object)
+    withInput = np.flatnonzero(pd.notna(inputPipes))
+    inputs = [[] for _ in range(nSegments)] #only the few rows with a pipe modelled as input are visited
+    for row, pipe in zip(rows[withInput].tolist(), inputPipes[withInput].tolist()):
+        inputs[row].append(str(pipe))
+    pathElements[STW_C.MODELED_INPUT] = [','.join(pipes) for pipes in inputs]
+
     return pathElements
 
 def removeSectionsWithoutFlow(pathDfs:list[pd.DataFrame],initialPathElements:pd.DataFrame) -> list[pd.DataFrame]:
@@ -336,29 +400,34 @@ def removeSectionsWithoutFlow(pathDfs:list[pd.DataFrame],initialPathElements:pd.
     return pathDfs
 
 
-def modelPath(pathDF:pd.DataFrame, isTrunk:bool, links:pd.DataFrame, networkLookNodes:pd.DataFrame, outfile:str,
-               nodeMeasurementFlow:list[str], networkPatterns:dict[list], nTanks:int = 1)->tuple[pd.DataFrame,list[dict],list[dict],int]:
+def modelPath(pathDF:pd.DataFrame, isTrunk:bool, network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults,
+               nodeMeasurementFlow:list[str], networkPatterns:dict[list], nTanks:int = 1, percLimToBranch:float=None, 
+               maxTanks:int=None)->tuple[pd.DataFrame,list[dict],list[dict],int]:
     """
         #Selects the relevant branches of the path, divides the path in sections, aggregates flow elements discharging directly into the path, 
         and creates the models of the tanks in series and catchments to represent the path. 
     Args:
         pathDF (pd.DataFrame): Links in the main path. Index is the order of the pipe.
         isTrunk (bool): True if the path to model is the main trunk of the network.
-        links (pd.DataFrame): Links of the network. Index is the name of the pipe.
+        network (nt.Network): Links of the network and their connectivity.
         networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
-        outfile (str): Path to the .out of the network.
+        results (gnpd.SimulationResults): Opened results (.out) of the network.
         nodeMeasurementFlow (list[str]): List of nodes where field measurements are taken.
         networkPatterns (dict[list]):Patterns of the network. 
         nTanks (int): Number of tanks already in the network.
+        percLimToBranch (float,optional): Threshold to select the relevant branches. Defaults to STW_C.PERC_LIM_TO_BRANCH.
+        maxTanks (int,optional): Maximum number of tanks of each section. Defaults to STW_C.MAX_TANKS.
     Returns:
         tuple[pd.DataFrame,list[dict],list[dict],int]: Connected pipes selected as relevant branches. Index is the name of the discharging pipe, columns are outnode and trunk pipe.
                                                     List of tank series models representing the path.
                                                     List of catchments models representing the path.
                                                     Current number of tanks in the network
     """    
-    relevantBranches, tsPipeCatchments, pipesCatchments = selectBranches(outfile,pathDF,links,isTrunk,False) 
+    relevantBranches, pipesCatchments = selectBranches(results,pathDF,network,isTrunk,False,percLimToBranch) 
 
     #Gets the break points and divides the path in various sections (dfs)  
+    if STW_C.SNAP_MEASUREMENT_NODES: #measurement nodes upstream of the path break it where they drain
+        nodeMeasurementFlow = snapNodesToPath(nodeMeasurementFlow, pathDF, network)
     linksToBreak = getBreakPoints(pathDF, relevantBranches, nodeMeasurementFlow)
     pathDfs, indexbreakLinks = dividePathByBreakPoints(pathDF,linksToBreak) 
 
@@ -366,27 +435,35 @@ def modelPath(pathDF:pd.DataFrame, isTrunk:bool, links:pd.DataFrame, networkLook
     pathWithLookPoints = getPathLookPoints(pathDF, networkLookNodes, pipesCatchments)
     pathElements = aggregatePathLookPoints(pathWithLookPoints,indexbreakLinks) 
 
+    #Hourly flows of all the discharging pipes aggregated as inputs, computed in a single pass over the .out
+    inputs = {pipes: pipes.split(',') for pipes in pathElements[STW_C.MODELED_INPUT] if pipes}
+    inputsFlows = results.getGroupsHourlyFlows(inputs)
+
     #Checks for elements at the initial node of the path and if there are not it removes the first section
     initialPathElements = checkForInitialElements(pathDF.iloc[0],networkLookNodes) 
     pathDfs = removeSectionsWithoutFlow(pathDfs,initialPathElements)
 
     branchModelsTanks, branchModelsCatch, nTanks = cw.getPathElements(pathDfs,pathElements,initialPathElements,
-                                                                        networkPatterns,tsPipeCatchments,pathDF.iloc[0].Name,nTanks)
+                                                                        networkPatterns,inputsFlows,pathDF.iloc[0].Name,nTanks,maxTanks)
 
     return relevantBranches, branchModelsTanks, branchModelsCatch, nTanks
 
-def getTrunkModels(links:pd.DataFrame, networkLookNodes:pd.DataFrame, outfile:str, nodeMeasurementFlow:list[str], 
-                   patterns:dict[list], idWRRF:str, idTrunkIni:str=None)->tuple[list[str],dict[str,list[dict]],pd.DataFrame,int]:
+def getTrunkModels(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                   patterns:dict[list], idWRRF:str, idTrunkIni:str=None, predecessors:np.ndarray=None, percLimToBranch:float=None, 
+                   maxTanks:int=None)->tuple[list[str],dict[str,list[dict]],pd.DataFrame,int]:
     """
         Find the trunk of the model, selects the relevant branches and converts the trunk and the selected branches into WEST models.
     Args:
-        links (pd.DataFrame): Links of the network. Rows are the pipes.
+        network (nt.Network): Links of the network and their connectivity, with the links table (rows are the pipes) in network.links.
         networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
-        outfile (str): Path to the .out of the network.
+        results (gnpd.SimulationResults): Opened results (.out) of the network.
         nodeMeasurementFlow (list[str]): List of nodes where field measurements are taken.
         patterns (dict[list]): Patterns of the network. 
         idWRRF (str): Name in the .inp of the node representing the entrance of the WRRF.
         idTrunkIni (str,optional): Id name of the most upstream node of the trunk in the .inp. Defaults to None.
+        predecessors (np.ndarray,optional): Main upstream link of every node (see fp.getMainFlowPredecessors). Defaults to None (computed).
+        percLimToBranch (float,optional): Threshold to select the relevant branches. Defaults to STW_C.PERC_LIM_TO_BRANCH.
+        maxTanks (int,optional): Maximum number of tanks of each section. Defaults to STW_C.MAX_TANKS.
     Returns:
         tuple[list[str],dict[str,list[dict]],pd.DataFrame,int]: Names of the connecting pipes to the trunk that were selected as branches to model in detail.
                                                         Models representing the trunk with the list of tank series models and a list of catchments models.
@@ -394,9 +471,10 @@ def getTrunkModels(links:pd.DataFrame, networkLookNodes:pd.DataFrame, outfile:st
                                                         Number of tanks created.
     """    
     print("-------------------------------Obtaining and modelling the Trunk -------------------------------------------------")
-    trunkDF = findTrunk(idWRRF,outfile,links,idTrunkIni) #df of the network's trunk
+    trunkDF = findTrunk(idWRRF,results,network,idTrunkIni,predecessors) #df of the network's trunk
 
-    branches, trunkModelsTanks, trunkModelsCatch, nTanks = modelPath(trunkDF,True,links,networkLookNodes,outfile,nodeMeasurementFlow,patterns) 
+    branches, trunkModelsTanks, trunkModelsCatch, nTanks = modelPath(trunkDF,True,network,networkLookNodes,results,nodeMeasurementFlow,patterns,
+                                                                     percLimToBranch=percLimToBranch,maxTanks=maxTanks) 
 
     trunkModels = {} 
     trunkModels[STW_C.PATH] = trunkModelsTanks
@@ -404,65 +482,489 @@ def getTrunkModels(links:pd.DataFrame, networkLookNodes:pd.DataFrame, outfile:st
 
     return branches, trunkModels, trunkDF, nTanks
 
-def getBranchesModels(links:pd.DataFrame, networkLookNodes:pd.DataFrame, outfile:str, nodeMeasurementFlow:list[str], patterns:dict[list],
-                      branches:pd.DataFrame, trunkPath: pd.DataFrame, nTanks:int)->dict[dict]:
+def getBranchesModels(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], patterns:dict[list],
+                      branches:pd.DataFrame, nTanks:int, predecessors:np.ndarray=None, maxDepth:int=None, nWorkers:int=None, 
+                      percLimToBranch:float=None, maxTanks:int=None)->dict[dict]:
     """
-        For each branch it finds the main flow path, selects the relevant branches and then convert them into WEST models
+        For each branch it finds the main flow path, selects the relevant branches and then convert them into WEST models.
+        The relevant branches of a branch are modelled the same way (sub-branches) until maxDepth levels of branches.
     Args:
-        links (pd.DataFrame): Links of the network
+        network (nt.Network): Links of the network and their connectivity, with the links table in network.links.
         networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
-        outfile (str): Path of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
+        results (gnpd.SimulationResults): Opened results of the .out file created by SWMM after running the model with the flowrate timeseries of the pipes
         nodeMeasurementFlow (list[str]): List of nodes where field measurements are taken.
         patterns (dict[list]): Patterns of the network.
-        branches (list[str]): Names  of the connecting pipes to the trunk that were selected as branches to model in detail.
-        trunkPath (pd.DataFrame): Links on the trunk path.
+        branches (pd.DataFrame): Connecting pipes to the trunk that were selected as branches to model in detail. Index is the name of the 
+                                 discharging pipe, columns are outnode and trunk pipe.
         nTanks (int): Number of tanks already created for the trunk.
+        predecessors (np.ndarray,optional): Main upstream link of every node, shared by the paths of all the branches. Defaults to None (computed once).
+        maxDepth (int,optional): Levels of branches to model in detail. Defaults to STW_C.MAX_BRANCH_DEPTH.
+        nWorkers (int,optional): Processes modelling the branches in parallel (see modelBranchesInParallel). Defaults to STW_C.BRANCH_WORKERS.
+        percLimToBranch (float,optional): Threshold to select the relevant sub-branches. Defaults to STW_C.PERC_LIM_TO_BRANCH.
+        maxTanks (int,optional): Maximum number of tanks of each section. Defaults to STW_C.MAX_TANKS.
     Returns:
-        dict[dict]: A dictionary for each branch using as key the name of the pipe discharging into the trunk. A branch dictionary has a list of tank series models and a list of catchments models 
+        dict[dict]: A dictionary for each branch using as key the name of its discharging pipe. A branch dictionary has the trunk pipe where it 
+                    discharges (STW_C.TRUNK_PIPE_NAME), a list of tank series models 
+                    and a list of catchments models, and the dictionary of its sub-branches (same structure) if they were modelled.
     """    
     print("-------------------------------Obtaining and converting the branches --------------------------------------------------")
+    if predecessors is None:
+        predecessors = fp.getMainFlowPredecessors(results.getLinkRankingArrays(network.linkNames)[0], network)
+    if maxDepth is None:
+        maxDepth = STW_C.MAX_BRANCH_DEPTH
+    if nWorkers is None:
+        nWorkers = STW_C.BRANCH_WORKERS if STW_C.BRANCH_WORKERS is not None else os.cpu_count()
+
+    if nWorkers > 1 and len(branches) > 1:
+        branchesModels, nTanks = modelBranchesInParallel(network, networkLookNodes, results, nodeMeasurementFlow, patterns, branches, nTanks, 
+                                                         predecessors, maxDepth, nWorkers, percLimToBranch, maxTanks)
+    else:
+        branchesModels, nTanks = modelBranches(network, networkLookNodes, results, nodeMeasurementFlow, patterns, branches, nTanks, 
+                                               predecessors, maxDepth, set(), percLimToBranch, maxTanks)
+
+    return branchesModels
+
+def modelBranches(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], patterns:dict[list],
+                  branches:pd.DataFrame, nTanks:int, predecessors:np.ndarray, depthLeft:int, modelledBranches:set, percLimToBranch:float=None,
+                  maxTanks:int=None)->tuple[dict[dict],int]:
+    """
+        Models the branches of a path and, recursively, their relevant branches while depthLeft allows it (see getBranchesModels).
+        Each branch is modelled once, the pipes already modelled are kept in modelledBranches. The tanks are numbered depth first.
+    Args:
+        network (nt.Network): Links of the network and their connectivity.
+        networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
+        results (gnpd.SimulationResults): Opened results of the .out file of the network.
+        nodeMeasurementFlow (list[str]): List of nodes where field measurements are taken.
+        patterns (dict[list]): Patterns of the network.
+        branches (pd.DataFrame): Connecting pipes selected as branches. Index is the name of the discharging pipe, columns are outnode and path pipe.
+        nTanks (int): Number of tanks already created.
+        predecessors (np.ndarray): Main upstream link of every node (see fp.getMainFlowPredecessors).
+        depthLeft (int): Levels of branches still to model in detail, including these branches.
+        modelledBranches (set): Names of the discharging pipes of the branches already modelled.
+        percLimToBranch (float,optional): Threshold to select the relevant sub-branches. Defaults to STW_C.PERC_LIM_TO_BRANCH.
+        maxTanks (int,optional): Maximum number of tanks of each section. Defaults to STW_C.MAX_TANKS.
+    Returns:
+        tuple[dict[dict],int]: Models of the branches using as key the name of the discharging pipe, with the path pipe where they discharge. 
+                               Current number of tanks in the network.
+    """    
     branchesModels = {}
 
-    for branch in branches.index:#TODO this only works if there is only one pipe discahrging in that node
+    for branch in branches.index:
+        if branch in modelledBranches:
+            continue
+        modelledBranches.add(branch)
         
         print("--------------------------Obtaining and modelling branch ",branch,"-------------------------------------------")
-        nodeStartBranch = links.loc[branch,SWWM_C.IN_NODE] 
-        nodeConnectingTrunk = links.loc[branch,SWWM_C.OUT_NODE] 
+        nodeStartBranch = network.nodeNames[network.linkInNode[network.linkIds[branch]]] 
 
-        pathDF = fp.findMainFlowPath(nodeStartBranch,outfile,links)
+        pathDF = fp.findMainFlowPath(nodeStartBranch,results,network,predecessors)
 
-        bRelevant, branchModelsTanks, branchModelsCatch, nTanks = modelPath(pathDF, False, links, networkLookNodes, outfile,
-                                                                    nodeMeasurementFlow, patterns, nTanks) 
+        #relevant branches of the branch are left out of its catchments when they are modelled as sub-branches
+        hasSubBranches = depthLeft > 1
+        bRelevant, branchModelsTanks, branchModelsCatch, nTanks = modelPath(pathDF, hasSubBranches, network, networkLookNodes, results,
+                                                                    nodeMeasurementFlow, patterns, nTanks, percLimToBranch, maxTanks) 
 
-        #creates the dictionary inside the dictionary with key the outnode where the branch discharges
-        branchConnection = trunkPath[trunkPath[SWWM_C.OUT_NODE] == nodeConnectingTrunk].Name.iloc[0]
-        branchesModels[branchConnection] = {} 
-        branchesModels[branchConnection][STW_C.PATH] = branchModelsTanks
-        branchesModels[branchConnection][STW_C.WCATCHMENTS] = branchModelsCatch
+        #creates the dictionary inside the dictionary with key the discharging pipe, several branches can discharge at the same path pipe
+        branchesModels[branch] = {} 
+        branchesModels[branch][STW_C.TRUNK_PIPE_NAME] = branches.loc[branch, STW_C.TRUNK_PIPE_NAME]
+        branchesModels[branch][STW_C.PATH] = branchModelsTanks
+        branchesModels[branch][STW_C.WCATCHMENTS] = branchModelsCatch
+
+        if hasSubBranches and not bRelevant.empty:
+            branchesModels[branch][STW_C.SUBBRANCHES], nTanks = modelBranches(network, networkLookNodes, results, nodeMeasurementFlow, 
+                                                                              patterns, bRelevant, nTanks, predecessors, 
+                                                                              depthLeft - 1, modelledBranches, percLimToBranch, maxTanks)
+
+    return branchesModels, nTanks
+
+def renumberTanks(branchesModels:dict[dict], offset:int)-> dict[dict]:
+    """
+        Shifts the indexes of all the tanks of the branches (and their sub-branches) by offset. The models are changed in place.
+    Args:
+        branchesModels (dict[dict]): Models of the branches as returned by modelBranches.
+        offset (int): Number added to every tank index.
+    Returns:
+        dict[dict]: The same models of the branches.
+    """    
+    for branchModels in branchesModels.values():
+        for pipe in branchModels[STW_C.PATH]:
+            pipe[STW_C.TANK_INDEXES] = [index + offset for index in pipe[STW_C.TANK_INDEXES]]
+
+        if STW_C.SUBBRANCHES in branchModels:
+            renumberTanks(branchModels[STW_C.SUBBRANCHES], offset)
 
     return branchesModels
 
-def aggregateAndModelNetwork(networkInp:str, idWRRF:str, nodeMeasurementFlow:list[str],idTrunkIni:str= None)->tuple[dict[str,list[dict]],dict[str,dict]]:  
+#State of the processes modelling the branches in parallel, set once per process by initBranchWorker
+_branchWorker = {}
+
+def getWorkerInitArgs(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                      patterns:dict[list], predecessors:np.ndarray, depth:int)->tuple:
+    """
+        Gathers what the processes of a pool need to model paths of the network (see initBranchWorker). 
+        The link ranking is obtained here so the processes do not compute it again.
+    Args:
+        The arguments of modelBranches, with depth the levels of branches to model in detail.
+    Returns:
+        tuple: Arguments of initBranchWorker.
+    """    
+    return network, networkLookNodes, results.getOpenArgs(), nodeMeasurementFlow, patterns, predecessors, depth
+
+def initBranchWorker(network:nt.Network, networkLookNodes:pd.DataFrame, resultsArgs:dict, nodeMeasurementFlow:list[str], patterns:dict[list], 
+                     predecessors:np.ndarray, depth:int):
+    """
+        Prepares a process of the pool of modelBranchesInParallel or sweepAggregation: opens the .out again, reusing the ranking and the 
+        flow statistics of the links already computed. The parameters of the aggregation are passed to each task, the other settings 
+        are the constants of STW_C in the process.
+    Args:
+        resultsArgs (dict): Arguments to open the results (see gnpd.SimulationResults.getOpenArgs).
+        depth (int): Levels of branches to model in detail.
+        The other arguments are the ones of modelBranches.
+    """    
+    results = gnpd.SimulationResults(**resultsArgs)
+
+    _branchWorker.update(network=network, networkLookNodes=networkLookNodes, results=results, nodeMeasurementFlow=nodeMeasurementFlow, 
+                         patterns=patterns, predecessors=predecessors, depth=depth)
+
+def modelBranchInWorker(branch:pd.DataFrame, percLimToBranch:float, maxTanks:int)-> tuple[dict[dict],int,set,str,str]:
+    """
+        Models one branch and its sub-branches in a process of the pool, numbering its tanks from 0.
+    Args:
+        branch (pd.DataFrame): Row of the branch in the connecting pipes selected as branches.
+        percLimToBranch (float): Threshold to select the relevant sub-branches, None for STW_C.PERC_LIM_TO_BRANCH.
+        maxTanks (int): Maximum number of tanks of each section, None for STW_C.MAX_TANKS.
+    Returns:
+        tuple[dict[dict],int,set,str,str]: Models of the branch (see modelBranches). Number of tanks created. Discharging pipes modelled. 
+                                           Messages printed while modelling it. Warnings and errors written to stderr while modelling it.
+    """    
+    worker = _branchWorker
+    modelledBranches = set()
+    log, errorLog = io.StringIO(), io.StringIO()
+
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(errorLog):
+        branchModels, nTanks = modelBranches(worker['network'], worker['networkLookNodes'], worker['results'], worker['nodeMeasurementFlow'], 
+                                             worker['patterns'], branch, 0, worker['predecessors'], worker['depth'], modelledBranches,
+                                             percLimToBranch, maxTanks)
+
+    return branchModels, nTanks, modelledBranches, log.getvalue(), errorLog.getvalue()
+
+def modelBranchesInParallel(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                            patterns:dict[list], branches:pd.DataFrame, nTanks:int, predecessors:np.ndarray, depth:int, 
+                            nWorkers:int, percLimToBranch:float=None, maxTanks:int=None)->tuple[dict[dict],int]:
+    """
+        Models each branch (with its sub-branches) in a pool of processes with its own numbering of the tanks. The models are then joined in
+        the order of the branches, shifting the tanks of each branch after the ones of the previous branches, so the result and the messages 
+        printed are the same as modelBranches. A branch whose sub-branches were already modelled by a previous branch is modelled again 
+        in this process, as modelBranches does not model a branch twice.
+        The processes do not print: what each branch writes to stdout and stderr (e.g. warnings) is returned with its models and written
+        here in the order of the branches. Only the output written outside Python (e.g. by the SWMM library) is not kept in order.
+    Args:
+        nWorkers (int): Number of processes.
+        The other arguments are the ones of modelBranches, with depth the levels of branches to model in detail.
+    Returns:
+        tuple[dict[dict],int]: Models of the branches using as key the name of the discharging pipe. Current number of tanks in the network.
+    """    
+    branches = branches[~branches.index.duplicated()]
+    initArgs = getWorkerInitArgs(network, networkLookNodes, results, nodeMeasurementFlow, patterns, predecessors, depth)
+
+    with ProcessPoolExecutor(max_workers=min(nWorkers, len(branches)), initializer=initBranchWorker, initargs=initArgs) as pool:
+        futures = [pool.submit(modelBranchInWorker, branches.iloc[[i]], percLimToBranch, maxTanks) for i in range(len(branches))]
+
+        branchesModels = {}
+        modelledBranches = set()
+        for i, future in enumerate(futures):
+            branchModels, nBranchTanks, branchModelled, log, errorLog = future.result()
+
+            if modelledBranches.isdisjoint(branchModelled):
+                print(log, end='')
+                print(errorLog, end='', file=sys.stderr)
+                branchesModels.update(renumberTanks(branchModels, nTanks))
+                modelledBranches |= branchModelled
+                nTanks += nBranchTanks
+            else: 
+                branchModels, nTanks = modelBranches(network, networkLookNodes, results, nodeMeasurementFlow, patterns, branches.iloc[[i]], 
+                                                     nTanks, predecessors, depth, modelledBranches, percLimToBranch, maxTanks)
+                branchesModels.update(branchModels)
+
+    return branchesModels, nTanks
+
+def getModelsSize(trunkModels:dict[list[dict]], branchesModels:dict[dict])-> dict[str,int]:
+    """
+        Counts the elements of the WEST model of the network. Each catchment has a connector and a combiner, and each branch a combiner.
+    Args:
+        trunkModels (dict[list[dict]]): Models of the trunk (see getTrunkModels).
+        branchesModels (dict[dict]): Models of the branches and their sub-branches (see getBranchesModels).
+    Returns:
+        dict[str,int]: Number of tanks, catchments, branches and submodels (sewers, catchments, connectors and combiners).
+    """    
+    size = {STW_C.NUM_TANKS: 0, STW_C.NUM_CATCHMENTS: 0, STW_C.NUM_BRANCHES: 0}
+    paths = [trunkModels] + list(branchesModels.values())
+
+    while paths:
+        path = paths.pop()
+        size[STW_C.NUM_TANKS] += sum(len(pipe[STW_C.TANK_INDEXES]) for pipe in path[STW_C.PATH])
+        size[STW_C.NUM_CATCHMENTS] += len(path[STW_C.WCATCHMENTS])
+
+        subBranches = path.get(STW_C.SUBBRANCHES, {})
+        size[STW_C.NUM_BRANCHES] += len(subBranches)
+        paths.extend(subBranches.values())
+
+    size[STW_C.NUM_BRANCHES] += len(branchesModels)
+    size[STW_C.NUM_SUBMODELS] = size[STW_C.NUM_TANKS] + 3*size[STW_C.NUM_CATCHMENTS] + size[STW_C.NUM_BRANCHES]
+
+    return size
+
+def getRepresentedFlowShare(results:gnpd.SimulationResults, trunkDF:pd.DataFrame, branches:pd.DataFrame)-> float:
+    """
+        Share of the flow at the end of the trunk that enters it through tanks in series, i.e. through the start of the trunk and the
+        branches modelled in detail, instead of through catchments. The flows are the ones used to rank the links.
+    Args:
+        results (gnpd.SimulationResults): Opened results of the .out file of the network.
+        trunkDF (pd.DataFrame): Links in the trunk of the network.
+        branches (pd.DataFrame): Connecting pipes to the trunk selected as branches. Index is the name of the discharging pipe.
+    Returns:
+        float: Represented flow over the flow of the last pipe of the trunk.
+    """    
+    rankFlow = results.getLinkRanking()[STW_C.RANK_FLOW]
+    representedFlow = rankFlow[trunkDF[SWWM_C.NAME].iloc[0]] + rankFlow.reindex(branches.index.unique()).sum()
+
+    return representedFlow / rankFlow[trunkDF[SWWM_C.NAME].iloc[-1]]
+
+def evaluateAggregation(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                        patterns:dict[list], idWRRF:str, idTrunkIni:str, predecessors:np.ndarray, percLimToBranch:float, maxTanks:int,
+                        maxDepth:int=None)->dict:
+    """
+        Models the trunk and the branches with the given threshold to select the branches and maximum number of tanks per section, 
+        without printing, and measures the resulting WEST model. If the network cannot be modelled with these parameters, the error 
+        is returned instead of the measures.
+    Args:
+        network (nt.Network): Links of the network and their connectivity.
+        networkLookNodes (pd.DataFrame): Nodes with flow elements and their characteristics (i.e., Area,...,Baseline). Index is OutletNode.
+        results (gnpd.SimulationResults): Opened results of the .out file of the network.
+        nodeMeasurementFlow (list[str]): List of nodes where field measurements are taken.
+        patterns (dict[list]): Patterns of the network.
+        idWRRF (str): Name in the .inp of the node representing the entrance of the WRRF.
+        idTrunkIni (str): Id name of the most upstream node of the trunk in the .inp. None to find it.
+        predecessors (np.ndarray): Main upstream link of every node (see fp.getMainFlowPredecessors).
+        percLimToBranch (float): Threshold to select the relevant branches (see evaluateRelativeBranchInfluence).
+        maxTanks (int): Maximum number of tanks of each section.
+        maxDepth (int,optional): Levels of branches to model in detail. Defaults to STW_C.MAX_BRANCH_DEPTH.
+    Returns:
+        dict: Parameters used, size of the model (see getModelsSize), share of flow represented (see getRepresentedFlowShare) and error.
+    """    
+    evaluation = {STW_C.SWEEP_PERC_LIM: percLimToBranch, STW_C.SWEEP_MAX_TANKS: maxTanks}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            branches, trunkModels, trunkDF, nTanks = getTrunkModels(network, networkLookNodes, results, nodeMeasurementFlow, patterns, 
+                                                                    idWRRF, idTrunkIni, predecessors, percLimToBranch, maxTanks)
+            branchesModels = getBranchesModels(network, networkLookNodes, results, nodeMeasurementFlow, patterns, branches, nTanks, 
+                                               predecessors, maxDepth, nWorkers=1, percLimToBranch=percLimToBranch, maxTanks=maxTanks)
+    except Exception as error: #the other parameters of the sweep are still evaluated
+        evaluation[STW_C.SWEEP_ERROR] = f"{type(error).__name__}: {error}"
+        return evaluation
+
+    evaluation.update(getModelsSize(trunkModels, branchesModels))
+    evaluation[STW_C.FLOW_SHARE] = getRepresentedFlowShare(results, trunkDF, branches)
+    evaluation[STW_C.SWEEP_ERROR] = None
+
+    return evaluation
+
+def evaluateAggregationInWorker(idWRRF:str, idTrunkIni:str, percLimToBranch:float, maxTanks:int)->dict:
+    """
+        Runs evaluateAggregation in a process of the pool of sweepAggregation.
+    Args:
+        The arguments of evaluateAggregation that change between the evaluations.
+    Returns:
+        dict: Evaluation of the parameters (see evaluateAggregation).
+    """    
+    worker = _branchWorker
+
+    return evaluateAggregation(worker['network'], worker['networkLookNodes'], worker['results'], worker['nodeMeasurementFlow'], 
+                               worker['patterns'], idWRRF, idTrunkIni, worker['predecessors'], percLimToBranch, maxTanks, worker['depth'])
+
+def evaluateAggregations(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                         patterns:dict[list], idWRRF:str, idTrunkIni:str, predecessors:np.ndarray, parameters:list[tuple[float,int]], 
+                         nWorkers:int=None)->pd.DataFrame:
+    """
+        Evaluates each pair of threshold to select the branches and maximum number of tanks per section (see evaluateAggregation), 
+        in a pool of processes if nWorkers > 1.
+    Args:
+        parameters (list[tuple[float,int]]): Pairs of the threshold to select the branches and the maximum number of tanks per section.
+        nWorkers (int,optional): Number of processes. Defaults to STW_C.BRANCH_WORKERS.
+        The other arguments are the ones of evaluateAggregation.
+    Returns:
+        pd.DataFrame: One row per pair of parameters, in the same order, with the columns of evaluateAggregation.
+    """    
+    if nWorkers is None:
+        nWorkers = STW_C.BRANCH_WORKERS if STW_C.BRANCH_WORKERS is not None else os.cpu_count()
+
+    if nWorkers > 1 and len(parameters) > 1:
+        initArgs = getWorkerInitArgs(network, networkLookNodes, results, nodeMeasurementFlow, patterns, predecessors, STW_C.MAX_BRANCH_DEPTH)
+        with ProcessPoolExecutor(max_workers=min(nWorkers, len(parameters)), initializer=initBranchWorker, initargs=initArgs) as pool:
+            percLims, maxTanks = zip(*parameters)
+            evaluations = list(pool.map(evaluateAggregationInWorker, [idWRRF]*len(parameters), [idTrunkIni]*len(parameters), 
+                                        percLims, maxTanks))
+    else:
+        evaluations = [evaluateAggregation(network, networkLookNodes, results, nodeMeasurementFlow, patterns, idWRRF, idTrunkIni, 
+                                           predecessors, percLim, maxTanks) for percLim, maxTanks in parameters]
+
+    return pd.DataFrame(evaluations, columns=[STW_C.SWEEP_PERC_LIM, STW_C.SWEEP_MAX_TANKS, STW_C.NUM_TANKS, STW_C.NUM_CATCHMENTS, 
+                                              STW_C.NUM_BRANCHES, STW_C.NUM_SUBMODELS, STW_C.FLOW_SHARE, STW_C.SWEEP_ERROR])
+
+def getBranchThresholds(results:gnpd.SimulationResults, trunkDF:pd.DataFrame, network:nt.Network)-> np.ndarray:
+    """
+        Values of the threshold to select the branches (see evaluateRelativeBranchInfluence) where the selection of the branches of the trunk changes: the flow of each connected pipe with flow
+        and a path upstream (see hasPathUpstream) over the flow of the last pipe of the trunk (see selectBranches). A threshold selects the pipes with a larger ratio, so the first
+        value (0) selects all of them and the largest value selects none. The flows are the ones used to rank the links, no time series is read.
+    Args:
+        results (gnpd.SimulationResults): Opened results of the .out file of the network.
+        trunkDF (pd.DataFrame): Links in the trunk of the network as returned by findTrunk. Index is the name of the link.
+        network (nt.Network): Links of the network and their connectivity.
+    Returns:
+        np.ndarray: Thresholds sorted from the one selecting more branches to the one selecting none.
+    """    
+    linkFlows, linkHasFlow = results.getLinkRankingArrays(network.linkNames)
+    trunkLinks = network.getLinkIds(trunkDF.index)
+    pipesConnected, _ = network.getLinksConnectedToPath(trunkLinks)
+    pipesConnected = pipesConnected[linkHasFlow[pipesConnected] & hasPathUpstream(pipesConnected, network)] #the pipes that can be branches
+
+    ratios = linkFlows[pipesConnected] / linkFlows[trunkLinks[-1]]
+
+    #the ratio of a pipe does not select it, 0 is added to select also the pipe with the smallest ratio
+    return np.unique(np.append(0.0, ratios[np.isfinite(ratios)]))
+
+def fitsBudget(evaluation:dict, budget:dict[str,int])-> bool:
+    """
+        Checks if an evaluation of the aggregation parameters was modelled and its size is within the budget.
+    Args:
+        evaluation (dict): Evaluation of the parameters (see evaluateAggregation).
+        budget (dict[str,int]): Maximum number of elements by type (STW_C.NUM_TANKS, STW_C.NUM_CATCHMENTS...).
+    Returns:
+        bool: True if the model fits the budget.
+    """    
+    return evaluation[STW_C.SWEEP_ERROR] is None and all(evaluation[key] <= limit for key, limit in budget.items())
+
+def tuneAggregationToBudget(network:nt.Network, networkLookNodes:pd.DataFrame, results:gnpd.SimulationResults, nodeMeasurementFlow:list[str], 
+                            patterns:dict[list], idWRRF:str, idTrunkIni:str, predecessors:np.ndarray, budget:dict[str,int])->tuple[float,int]:
+    """
+        Searches the threshold to select the branches and the maximum number of tanks per section of the largest model of the network 
+        within the budget. 
+        First, the thresholds where the selection of the branches changes (see getBranchThresholds) are scanned from the smallest
+        (the most flow represented in branches) until one fits with one tank per section. Then, every number of tanks per section up to
+        the current STW_C.MAX_TANKS is evaluated for that threshold and the largest that fits is kept. The parameters that cannot be 
+        modelled are skipped, and the size of the model is not assumed to change monotonically with them.
+    Args:
+        budget (dict[str,int]): Maximum number of tanks (STW_C.NUM_TANKS), catchments (STW_C.NUM_CATCHMENTS), branches (STW_C.NUM_BRANCHES)
+                                and/or submodels of the WEST model (STW_C.NUM_SUBMODELS, see getModelsSize).
+        The other arguments are the ones of evaluateAggregation.
+    Raises:
+        ValueError: if the budget has other keys or if no threshold fits the budget with one tank per section.
+    Returns:
+        tuple[float,int]: Threshold to select the branches and maximum number of tanks per section.
+    """    
+    unknown = set(budget) - {STW_C.NUM_TANKS, STW_C.NUM_CATCHMENTS, STW_C.NUM_BRANCHES, STW_C.NUM_SUBMODELS}
+    if unknown:
+        raise ValueError(f"The budget can not limit {sorted(unknown)}.")
+
+    def fits(percLimToBranch:float, maxTanks:int)-> bool:
+        evaluation = evaluateAggregation(network, networkLookNodes, results, nodeMeasurementFlow, patterns, idWRRF, idTrunkIni, 
+                                         predecessors, percLimToBranch, maxTanks)
+        return fitsBudget(evaluation, budget)
+
+    thresholds = getBranchThresholds(results, findTrunk(idWRRF, results, network, idTrunkIni, predecessors), network)
+
+    percLimToBranch = next((float(threshold) for threshold in thresholds if fits(threshold, 1)), None)
+    if percLimToBranch is None:
+        raise ValueError(f"The network can not be modelled within the budget {budget}.")
+
+    maxTanks = max(tanks for tanks in range(1, max(STW_C.MAX_TANKS, 1) + 1) if tanks == 1 or fits(percLimToBranch, tanks))
+
+    return percLimToBranch, maxTanks
+
+def prepareAggregation(networkInp:str, idWRRF:str)->tuple[dict,pd.DataFrame,nt.Network,gnpd.SimulationResults,np.ndarray]:
+    """
+        Reads what is shared by all the models of the network: its elements draining to the WRRF, the look points, the arrays and adjacency
+        of the links, the opened results (.out) and the main upstream link of every node from the flows of all links.
+    Args:
+        networkInp (str): Path of the .inp of the network
+        idWRRF (str): Name in the .inp of the node representing the entrance of the WRRF.
+    Returns:
+        tuple[dict,pd.DataFrame,nt.Network,gnpd.SimulationResults,np.ndarray]: Elements of the network. Look points of the network. 
+                                    Links of the network and their connectivity. Opened results, to be closed by the caller.
+                                    Main upstream link of every node (see fp.getMainFlowPredecessors).
+    """    
+    networkElements, outfile = gnpd.getNetwork(networkInp, idWRRF) #Gets the elements of the network draining to the WRRF 
+    networkLookPoints = getNetworkLookPoints(networkElements) #Joins all important points of the whole network into a df
+    network = nt.Network(networkElements[STW_C.LINKS]) #Arrays and adjacency of the links used by all the path searches
+    nt.reportLoops(network)
+
+    results = gnpd.SimulationResults(outfile, dbFile=gnpd.getResultsDatabaseFile(networkInp)) #the .out is opened once for the whole conversion
+    #main upstream link of every node from the flows of all links, the trunk and the branches paths are read from it
+    predecessors = fp.getMainFlowPredecessors(results.getLinkRankingArrays(network.linkNames)[0], network)
+
+    return networkElements, networkLookPoints, network, results, predecessors
+
+def sweepAggregation(networkInp:str, idWRRF:str, nodeMeasurementFlow:list[str], percLimsToBranch:list[float], maxTanks:list[int],
+                     idTrunkIni:str=None, nWorkers:int=None)->pd.DataFrame:
+    """
+        Evaluates the models of the network for every combination of threshold to select the branches and maximum number of tanks per
+        section. The .inp is parsed
+        and the flow statistics loaded once for all of them, and the combinations are modelled in parallel (see evaluateAggregations).
+    Args:
+        networkInp (str): Path of the .inp of the network
+        idWRRF (str): Name in the .inp of the node representing the entrance of the WRRF.
+        nodeMeasurementFlow (list[str]): List of node names where measurements are taken in the field
+        percLimsToBranch (list[float]): Values of the threshold to select the relevant branches.
+        maxTanks (list[int]): Values of the maximum number of tanks per section.
+        idTrunkIni (str, optional): Id name of the most upstream node of the trunk in the .inp. Defaults to None.
+        nWorkers (int,optional): Number of processes. Defaults to STW_C.BRANCH_WORKERS.
+    Returns:
+        pd.DataFrame: One row per combination with the parameters, the number of tanks, catchments, branches and submodels, 
+                      the share of the flow represented and the error if the combination could not be modelled.
+    """    
+    networkElements, networkLookPoints, network, results, predecessors = prepareAggregation(networkInp, idWRRF)
+    parameters = [(percLim, nTanks) for percLim in percLimsToBranch for nTanks in maxTanks]
+
+    with results:
+        sweep = evaluateAggregations(network, networkLookPoints, results, nodeMeasurementFlow, networkElements[STW_C.T_PATTERNS], 
+                                     idWRRF, idTrunkIni, predecessors, parameters, nWorkers)
+
+    return sweep
+
+def aggregateAndModelNetwork(networkInp:str, idWRRF:str, nodeMeasurementFlow:list[str],idTrunkIni:str= None, 
+                             budget:dict[str,int]=None)->tuple[dict[str,list[dict]],dict[str,dict]]:  
     """
         Converts a detailed network given in the .inp on a list of tank in series and catchments for the trunk, and the same of each important branch.
         It uses the list of measurements flows as additional cut points in the trunk. It aggregates branches by flowrate.
+        If a budget is given, the network is modelled with the threshold to select the branches and the maximum number of tanks per section
+        of the largest model within the budget (see tuneAggregationToBudget) instead of STW_C.PERC_LIM_TO_BRANCH and STW_C.MAX_TANKS.
     Args:
         networkInp (str): Path of the .inp of the network
         idWRRF (str): Name in the .inp of the node representing the entrance of the WRRF.
         nodeMeasurementFlow (list[str]): List of node names where measurements are taken in the field
         idTrunkIni (str, optional): Id name of the most upstream node of the trunk in the .inp. Defaults to None.
+        budget (dict[str,int], optional): Maximum number of tanks, catchments, branches and/or submodels of the WEST model, with the keys 
+                                          STW_C.NUM_TANKS, STW_C.NUM_CATCHMENTS, STW_C.NUM_BRANCHES and STW_C.NUM_SUBMODELS. Defaults to None.
     Returns:
         tuple[dict[str,list[dict]],dict[str,dict]]: A dictionary representing the trunk with the list of tank series models and a list of catchments models.
-                                            A dictonary with a dictionary for each branch. Each branch dictionary has a list of tank series models and a list of catchments models.
+                                            A dictonary with a dictionary for each branch. Each branch dictionary has a list of tank series models and a list of catchments models (see getBranchesModels).
     """    
-    networkElements, outfile = gnpd.getNetwork(networkInp) #Gets all the necesary elements from the network 
-    networkLookPoints = getNetworkLookPoints(networkElements) #Joins all important points of the whole network into a df
+    networkElements, networkLookPoints, network, results, predecessors = prepareAggregation(networkInp, idWRRF)
     
-    branches, trunkModels, trunk, nTanks = getTrunkModels(networkElements[STW_C.LINKS], networkLookPoints, outfile, 
-                                                  nodeMeasurementFlow, networkElements[STW_C.T_PATTERNS], idWRRF, idTrunkIni) 
-
-    branchesModels = getBranchesModels(networkElements[STW_C.LINKS], networkLookPoints, outfile, 
-                                       nodeMeasurementFlow, networkElements[STW_C.T_PATTERNS], branches, trunk, nTanks)
+    percLimToBranch, maxTanks = STW_C.PERC_LIM_TO_BRANCH, STW_C.MAX_TANKS
+    
+    with results:
+        if budget is not None:
+            percLimToBranch, maxTanks = tuneAggregationToBudget(network, networkLookPoints, results, nodeMeasurementFlow, 
+                                                                networkElements[STW_C.T_PATTERNS], idWRRF, idTrunkIni, predecessors, budget)
+            print("The model fits the budget with a limit to branch of ", percLimToBranch, " and ", maxTanks, " maximum tanks")
+
+        branches, trunkModels, trunk, nTanks = getTrunkModels(network, networkLookPoints, results, nodeMeasurementFlow, 
+                                                              networkElements[STW_C.T_PATTERNS], idWRRF, idTrunkIni, predecessors,
+                                                              percLimToBranch, maxTanks) 
+
+        branchesModels = getBranchesModels(network, networkLookPoints, results, nodeMeasurementFlow, networkElements[STW_C.T_PATTERNS], 
+                                           branches, nTanks, predecessors, percLimToBranch=percLimToBranch, maxTanks=maxTanks)
 
     return trunkModels, branchesModels
 
@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from datetime import datetime, timedelta
 
 import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
 import SWMMToWESTConvert.SWMM_InpConstants as SWMM_C
@@ -41,38 +40,34 @@ def convertMeanSWMMFlowToNPeopleWEST(averageDWF:float)->int:
 
     return npeople
 
-def convertTimeSeriesIntoDWF(ts:'pd.Series')->tuple[list[str],float]:
+def convertHourlyFlowsIntoDWF(hourlyFlows:'pd.Series')->tuple[list[str],float]:
     """
-        Calculates the average flow per hour of the day and normalises it using the ts total average flow.
-        Discarts the first day of the ts from the calculation, as it considers the stabilisation period of the flow modeling
+        Normalises the average flow per hour of the day using the total average flow.
     Args:
-        ts (pd.Series): Time series of flows in order (i.e., the first day starts at hour 0 and finises at hour 23).
+        hourlyFlows (pd.Series): Mean flow (STW_C.STAT_MEAN) and mean flow of each hour of the day, in order from hour 0 to 23 
+                                 (e.g., a row from getNetworkFromSWMM.getGroupsHourlyFlows).
     Returns:
-        tuple[list[str],float]: Normalized hourly pattern in strings. Average flow of the time series.
+        tuple[list[str],float]: Normalized hourly pattern in strings. Average flow.
     """    
-    initialDate = ts.index[0]
-    initialDateEvaluation = initialDate + timedelta(days=1) #it assumes that flow gets stable after one day!!
-        
-    dryWeather = ts[initialDateEvaluation:]
-        
-    totalMean = dryWeather.mean()
-    hourly_pattern = dryWeather.groupby(dryWeather.index.hour).mean()
-    
-    assert list(hourly_pattern.index) == list(range(24)) #assumess that the TS is in order 
-        
+    totalMean = hourlyFlows[STW_C.STAT_MEAN]
+    hourly_pattern = hourlyFlows.drop(labels=STW_C.STAT_MEAN)
+
+    assert len(hourly_pattern) == 24 #one value per hour of the day
+
     normalized_HP = hourly_pattern / totalMean
     NHP_stringList = list(map(str, normalized_HP))
 
     return NHP_stringList, totalMean
 
 
-def calculateSewerValues(pipeSection:'pd.DataFrame',shapeType: str)->tuple[float,float,float,int]:
+def calculateSewerValues(pipeSection:'pd.DataFrame',shapeType: str, maxTanks:int=None)->tuple[float,float,float,int]:
     """
         Calcutes the atributes of the tanks in series to represent the sewer section. Using Kalinin-Miljukov.
         Asumes RECT pipes have the same geom 2 than geom 1 TODO
     Args:
         pipeSection (pd.DataFrame): Pipes in the pipe section. rows are pipes and columns the attributes.
         shapeType (str): Shape of the pipe section e.g., circular, rect_closed.
+        maxTanks (int, optional): Maximum number of tanks of the section. Defaults to STW_C.MAX_TANKS.
     Returns:
         tuple[float,float,float,int]: Area of the tanks. Max volumen of the tanks. Retention time of one tank. Number of tanks.
     """    
@@ -85,8 +80,10 @@ def calculateSewerValues(pipeSection:'pd.DataFrame',shapeType: str)->tuple[float
     n1 = length/Lc  
     n = round(n1) if n1 >= 1 else 1
 
-    if n > STW_C.MAX_TANKS:
-        n = STW_C.MAX_TANKS
+    if maxTanks is None:
+        maxTanks = STW_C.MAX_TANKS
+    if n > maxTanks:
+        n = maxTanks
 
     ltank = length/n  #m
     
@@ -111,7 +108,7 @@ def calculateSewerValues(pipeSection:'pd.DataFrame',shapeType: str)->tuple[float
     
     return areaTank, Volmax, k, n
 
-def createSewerWEST(pipeSection:'pd.DataFrame',name:str,shapeType:str,tankIndex:int)-> tuple[dict,int]:
+def createSewerWEST(pipeSection:'pd.DataFrame',name:str,shapeType:str,tankIndex:int,maxTanks:int=None)-> tuple[dict,int]:
     """
         Creates a dictionary with all the required attributes of a sewer section in WEST. 
         A sewer in WEST is represented with various tank in series mmodels with the same characterisitcs.
@@ -120,10 +117,11 @@ def createSewerWEST(pipeSection:'pd.DataFrame',name:str,shapeType:str,tankIndex:
         name (str): Name of the sewer section.
         shapeType (str): Shape of the sewer section e.g. circular, rectangular.
         tankIndex (int): Initial tank series number to be used for the sewer section. E.g. if the entired model already has 20 tank in series, this should be 21.
+        maxTanks (int, optional): Maximum number of tanks of the section. Defaults to STW_C.MAX_TANKS.
     Returns:
         tuple[dict,int]: dictionary representing the sewer section in WEST. The number of tank in series in the sewer section.
     """    
-    areaTank, Volmax, k, n = calculateSewerValues(pipeSection,shapeType)
+    areaTank, Volmax, k, n = calculateSewerValues(pipeSection,shapeType,maxTanks)
         
     pipe = {}
     pipe[STW_C.NAME] = name
@@ -178,13 +176,13 @@ def createCatchmentWEST(name:str, element:dict, timePatterns:dict, isEnd:bool=Tr
     
     return catchment
 
-def createInputWEST(name:str,input:str,tsInputs:'pd.DataFrame',isEnd:bool=True)->dict:
+def createInputWEST(name:str,input:str,inputsFlows:'pd.DataFrame',isEnd:bool=True)->dict:
     """
-        It creates a catchment WEST model (pattern, #people, flow per person) using as input the time series of one or more pipes. 
+        It creates a catchment WEST model (pattern, #people, flow per person) using as input the flow of one or more pipes. 
     Args:
         name (str): Name of the pipe section at which the model should be connected.
-        input (str): Names of the time series/ pipes to be used as input
-        tsInputs (pd.DataFrame): All time series to be converted to inputs in the complete WEST model 
+        input (str): Names of the pipes to be used as input, separated by commas
+        inputsFlows (pd.DataFrame): Mean and hourly mean flows of all the inputs of the path. Index is the input (names of the pipes separated by commas).
         isEnd (bool, optional): True if the catchment should be placed at the end of the pipe section, False otherwise. Defaults to True.
     Returns:
         dict: Catchment WEST model.
@@ -201,9 +199,7 @@ def createInputWEST(name:str,input:str,tsInputs:'pd.DataFrame',isEnd:bool=True)-
     
     #converts the time series into a pattern and number of people
     if input:
-        columns_to_sum = input.split(',') 
-        result_series = tsInputs[columns_to_sum].sum(axis=1) 
-        tPatternP, averageDWF = convertTimeSeriesIntoDWF(result_series)
+        tPatternP, averageDWF = convertHourlyFlowsIntoDWF(inputsFlows.loc[input])
         npeople = convertMeanSWMMFlowToNPeopleWEST(averageDWF)
     
     inputWEST[STW_C.N_PEOPLE] = npeople
@@ -216,7 +212,7 @@ def createInputWEST(name:str,input:str,tsInputs:'pd.DataFrame',isEnd:bool=True)-
     return inputWEST
 
 def getPathElements(dfs:list['pd.DataFrame'],elements:'pd.DataFrame', initialElements:dict,
-                    timePatterns:dict[list],tSDischarging:'pd.DataFrame', firstPipe:str, NTanks:int)->tuple[list[dict],list[dict],int]:
+                    timePatterns:dict[list],inputsFlows:'pd.DataFrame', firstPipe:str, NTanks:int, maxTanks:int=None)->tuple[list[dict],list[dict],int]:
     """
         Converts the pipe sections into list of tank in series models and the flowelements into a list of catchment models.
         The model of each pipe section has the name "initial-final pipe", the slope, diameter, and total length.
@@ -226,9 +222,10 @@ def getPathElements(dfs:list['pd.DataFrame'],elements:'pd.DataFrame', initialEle
         elements (pd.DataFrame): Flow elements of the path.
         initialElements (dict): Flow elements at the initial node of the path.
         timePatterns (dict[list]): Time patterns of the network.
-        tSDischarging (pd.DataFrame): Time series discharging into the path.
+        inputsFlows (pd.DataFrame): Mean and hourly mean flows of the pipes discharging into the path, aggregated by input.
         firstPipe (str): The name of the first pipe of the path.
         NTanks (int): Number of tanks already existent in the network.
+        maxTanks (int, optional): Maximum number of tanks of each pipe section. Defaults to STW_C.MAX_TANKS.
     Returns:
         tuple[list[dict],list[dict],int]: list of tank in series models and catchments models of the path. 
                                           Current number of tanks in the network.
@@ -257,7 +254,7 @@ def getPathElements(dfs:list['pd.DataFrame'],elements:'pd.DataFrame', initialEle
             mostCommonShape = dfClean[SWMM_C.SHAPE].value_counts().idxmax()
             
             #Creates and adds the pipe section to the list
-            sewerSect, n = createSewerWEST(dfClean,name,mostCommonShape,tankIndex) 
+            sewerSect, n = createSewerWEST(dfClean,name,mostCommonShape,tankIndex,maxTanks) 
             pipesSection.append(sewerSect)
             tankIndex += n
                 
@@ -272,11 +269,11 @@ def getPathElements(dfs:list['pd.DataFrame'],elements:'pd.DataFrame', initialEle
         pipeEvaluated = df.iloc[-1][SWMM_C.NAME]
         if pipeEvaluated in elements.index:
             element = elements.loc[pipeEvaluated].copy()
-            catchments = addCatchmentsFromFlowElement(element, timePatterns, tSDischarging, catchments, name, isEnd)
+            catchments = addCatchmentsFromFlowElement(element, timePatterns, inputsFlows, catchments, name, isEnd)
     
     if not dfs:
         element = elements.iloc[0].copy()
-        catchments = addCatchmentsFromFlowElement(element, timePatterns, tSDischarging, catchments, firstPipe)
+        catchments = addCatchmentsFromFlowElement(element, timePatterns, inputsFlows, catchments, firstPipe)
             
     print("----------------------------")
     print("Final number of pipe sections ", len(pipesSection))
@@ -287,14 +284,14 @@ def getPathElements(dfs:list['pd.DataFrame'],elements:'pd.DataFrame', initialEle
                             
     return pipesSection, catchments, tankIndex
 
-def addCatchmentsFromFlowElement(element:'pd.Serie', timePatterns:dict[list], tSDischarging:'pd.DataFrame', 
+def addCatchmentsFromFlowElement(element:'pd.Serie', timePatterns:dict[list], inputsFlows:'pd.DataFrame', 
                                    catchments:list[dict], pipeSectionName:str, isEnd:bool=True)->list[dict]:
     """
         Looks for elements associated to the pipeSectionName and if there are it adds new catchment models to the catchments list.
     Args:
         elements (pd.DataFrame): Flow elements of the path.
         timePatterns (dict[list]): Time patterns of the network.
-        tSDischarging (pd.DataFrame): Time series discharging into the path.
+        inputsFlows (pd.DataFrame): Mean and hourly mean flows of the pipes discharging into the path, aggregated by input.
         catchments (list[dict]): List of catchments in which to add the new catchments models.
         pipeEvaluated (str): Name of the last pipe of the pipe section where the possible flow elements of the section were aggregated.
         pipeSectionName (str): Name of the pipe section being modelled (i.e.,"first pipe - last pipe")
@@ -306,7 +303,7 @@ def addCatchmentsFromFlowElement(element:'pd.Serie', timePatterns:dict[list], tS
 
     #If the ts is not empty it creates an input object
     if tsInput is not None:
-        input = createInputWEST(pipeSectionName, tsInput, tSDischarging, isEnd)
+        input = createInputWEST(pipeSectionName, tsInput, inputsFlows, isEnd)
         catchments.append(input)
     else:
         print("Connected pipe did not have flow")
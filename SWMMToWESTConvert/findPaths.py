@@ -1,182 +1,360 @@
-import SWMMToWESTConvert.SWMM_InpConstants as SWWM_C
+import numpy as np
+
+import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
 import SWMMToWESTConvert.getNetworkFromSWMM as gnfs
+import SWMMToWESTConvert.networkTopology as nt
+
+
+
+class PathNotFoundError(Exception):
+    pass
+
+
+def searchPath(initialNode:int,finalNode:int,topology:'nt.NetworkTopology',maxSteps:int=None)-> list[int]:
+    """
+        Depth first search of a path from the initial node to the final node going downstream. At each node the links are tried by 
+        largest full Q and Geom 1 (Diameter if it is circular pipe) and, when a branch does not reach the final node (outlet or loop), 
+        the search backtracks to the last node with links left to try. Nodes are visited once, so it is linear in the links explored, and 
+        nodes whose component is downstream of the final node in the condensed network (see nt.condenseTopology) are not explored.
+    Args:
+        initialNode (int): id of the node upstream where the path starts
+        finalNode (int): id of the node downstream where the path must finish
+        topology (nt.NetworkTopology): connectivity of the links of the network
+        maxSteps (int, optional): maximum number of links explored. Defaults to STW_C.PATH_SEARCH_MAX_STEPS.
+    Raises:
+        PathNotFoundError: if there is no path between the nodes or if the search explores more than maxSteps links
+    Returns:
+        list[int]: ids of the links of the path, from upstream to downstream
+    """    
+    if maxSteps is None:
+        maxSteps = STW_C.PATH_SEARCH_MAX_STEPS
+
+    if initialNode < 0 or finalNode < 0:
+        raise PathNotFoundError("The initial or the final node is not connected to any link.")
+    if initialNode == finalNode:
+        return []
+
+    visited = {initialNode}
+    pipesPath = []
+    pending = [(initialNode, 0)] #node and position of the next link to try
+    steps = 0
+
+    while pending:
+        node, i = pending[-1]
+        linksOut = topology.getLinksOut(node)
+
+        if i == len(linksOut): #all the links of the node were tried, goes back to the previous decision
+            pending.pop()
+            if pipesPath:
+                pipesPath.pop()
+            continue
+
+        pending[-1] = (node, i + 1)
+        link = int(linksOut[i])
+        nextNode = topology.linkOutNode[link]
+        if topology.components[nextNode] > topology.components[finalNode]: #downstream of the final node in the condensed network
+            continue
+
+        steps += 1
+        if steps > maxSteps:
+            raise PathNotFoundError(f"The search explored more than {maxSteps} links without reaching {topology.nodeNames[finalNode]}.")
+
+        if nextNode in visited: #loop or a part already known not to reach the final node
+            continue
+
+        visited.add(nextNode)
+        pipesPath.append(link)
+        if nextNode == finalNode:
+            return pipesPath
+        pending.append((nextNode, 0))
+
+    raise PathNotFoundError(f"There is no path from {topology.nodeNames[initialNode]} to {topology.nodeNames[finalNode]}.")
+
+def findPath(initialNodeUpstream:str,finalDownstreamNode:str,topology:'nt.NetworkTopology')-> list[str]:
+    """
+        Finds the path from a node to a node downstream, preferring the links with largest full Q and Geom 1. See searchPath.
+    Args:
+        initialNodeUpstream (str): id name of the node upstream where the path starts
+        finalDownstreamNode (str): id name of the node downstream where the path must finish
+        topology (nt.NetworkTopology): connectivity of the links of the network
+    Raises:
+        PathNotFoundError: if there is no path between the nodes
+    Returns:
+        list[str]: names of the links of the path, from upstream to downstream
+    """    
+    initialNode = topology.getNodeId(initialNodeUpstream)
+    finalNode = topology.getNodeId(finalDownstreamNode)
 
+    if initialNode < 0 or finalNode < 0:
+        raise PathNotFoundError(f"There is no path from {initialNodeUpstream} to {finalDownstreamNode}, one of them is not connected to any link.")
 
+    return topology.getLinksNames(searchPath(initialNode, finalNode, topology))
 
-def addLinkToPath(linkAux:'pd.Series',pipesPath:list[str])->tuple[str,list[str]]:
+def getDominantSuccessors(finalNode:int,topology:'nt.NetworkTopology')-> np.ndarray:
     """
-        Adds the link to the path and obtains its nodeout
+        Computes in one pass the dominant downstream successor of every node towards the final node: the link leaving the node with largest 
+        full Q and Geom 1 among those that lead to the final node. Following the successors from any node gives its path to the final node.
     Args:
-        linkAux (pd.Series): link to add to the path and its attributes
-        pipesPath (list[str]): links in the path 
+        finalNode (int): id of the node downstream where the paths must finish
+        topology (nt.NetworkTopology): connectivity of the links of the network
     Returns:
-        tuple[str,list[str]]: Most downstream node of the path. List of pipes in the path
+        np.ndarray: id of the successor link of each node, -1 for the final node and the nodes that do not drain to it.
     """    
-    
-    pipesPath.append(linkAux.name) 
-    
-    nodeAux = linkAux[SWWM_C.OUT_NODE] #Get's the node after the selected link
-    
-    return nodeAux, pipesPath
+    reaches = nt.getNodesUpstream(topology, finalNode)
+
+    #The outgoing links are grouped by node and sorted by preference, so the first valid link of each node is its successor
+    valid = np.flatnonzero(reaches[topology.linkOutNode[topology.outLinks]])
+    owners = topology.linkInNode[topology.outLinks[valid]]
+    nodes, first = np.unique(owners, return_index=True)
 
+    successors = np.full(len(topology.nodeNames), -1, dtype=np.int64)
+    successors[nodes] = topology.outLinks[valid[first]]
+    if finalNode >= 0:
+        successors[finalNode] = -1
 
-def reRoute(nodesDecision:list[str],links:'pd.DataFrame',pipesPath:list[str])->tuple['pd.Series',list[str],list[str]]:
+    return successors
+
+def getSuccessorChildren(successors:np.ndarray,topology:'nt.NetworkTopology')-> tuple[np.ndarray,np.ndarray]:
     """
-        Go to the last node a decision was made, and changes the pipe at the decision. It only reroutes twice 
-        TODO make more general (nodes with 3 pipes)
-        It also updates the path by removing the links added to the path after that node. 
+        Returns the children of each node in the successor tree (the nodes whose successor link ends at it), grouped as a CSR array.
     Args:
-        nodesDecision (list[str]): List of nodes where a decision was made to construct the path.
-        links (pd.DataFrame): Links of the network and their attributes.
-        pipesPath (list[str]): List of pipes in the path already.
+        successors (np.ndarray): successor link of each node from getDominantSuccessors
+        topology (nt.NetworkTopology): connectivity of the links of the network
     Returns:
-        tuple['pd.Series',list[str],list[str]]: The next pipe to be added to the path. 
-                                                The modified path after the reroute.
-                                                The nodes where a decision has been made in the path. 
-    """   
-    #Go to the last node a decision was made
-    linksOut = links[links[SWWM_C.IN_NODE] == nodesDecision.pop()].sort_values(by=[SWWM_C.MAX_Q,SWWM_C.DIAM], ascending=False) 
-    
-    i=0
-    linkDelete = linksOut.iloc[i]
-    #If this is not the first time it reroutes
-    if (not linkDelete.name in pipesPath):
-        i=i+1
-        linkDelete = linksOut.iloc[i]
-        
-    #removes the links in the failed section of the path
-    iToDelete = pipesPath.index(linkDelete.name)
-    del pipesPath[iToDelete:]
-
-    #selects other pipe 
-    linkAux = linksOut.iloc[i+1]
-    
-    return linkAux, pipesPath, nodesDecision
-
-def lookForPath(finalDownstreamNode:str,initialNodeUpstream:str,links:'pd.DataFrame',pipesPath:list[str],
-                nodesDecision:list[str])->tuple[list[str],list[str],str]:
+        tuple[np.ndarray,np.ndarray]: offsets of each node (nodes + 1 values). Ids of the children grouped by node.
+    """    
+    hasSuccessor = np.flatnonzero(successors >= 0)
+    offsets, children = nt.buildAdjacency(topology.linkOutNode[successors[hasSuccessor]], np.arange(len(hasSuccessor)), len(topology.nodeNames))
+
+    return offsets, hasSuccessor[children]
+
+def getNodesOnSuccessorTree(finalNode:int,successors:np.ndarray,topology:'nt.NetworkTopology')-> np.ndarray:
+    """
+        Marks the nodes whose chain of successors ends at the final node. In networks with loops the successors of some nodes 
+        can form a circuit, those nodes are not in the tree.
+    Args:
+        finalNode (int): id of the node downstream where the paths must finish
+        successors (np.ndarray): successor link of each node from getDominantSuccessors
+        topology (nt.NetworkTopology): connectivity of the links of the network
+    Returns:
+        np.ndarray: one boolean per node, True if following its successors reaches the final node
+    """    
+    onTree = np.zeros(len(topology.nodeNames), dtype=bool)
+    if finalNode < 0:
+        return onTree
+
+    offsets, children = getSuccessorChildren(successors, topology)
+
+    onTree[finalNode] = True
+    pending = [finalNode]
+    while pending:
+        node = pending.pop()
+        nodeChildren = children[offsets[node]:offsets[node + 1]]
+        onTree[nodeChildren] = True
+        pending.extend(nodeChildren.tolist())
+
+    return onTree
+
+def getPathFromSuccessors(node:int,successors:np.ndarray,topology:'nt.NetworkTopology')-> list[int]:
     """
-        Obtains a path from the initialNodeUpstream to the finalDownstreamNode selecting at decision points the 
-        link with largest full Q and Geom 1 (Diameter if it is circular pipe). Removes circuits attached to the path.
+        Reads the path of a node of the successor tree, going downstream until the final node.
     Args:
-        finalDownstreamNode (str): id name of the node downstream where the paths must finish. 
-        initialNodeUpstream (str): id name of the node upstream the leaves where the paths starts. 
-        links (pd.DataFrame): Links of the network and their attributes.
-        pipesPath (list[str]): List of pipes in the path already.
-        nodesDecision (list[str]): List of nodes where a decision was made to construct the path.
+        node (int): id of the node where the path starts
+        successors (np.ndarray): successor link of each node from getDominantSuccessors
+        topology (nt.NetworkTopology): connectivity of the links of the network
     Returns:
-        tuple[list[str],list[str],str]: Pipes in the path. 
-                                        Nodes where a decision was made to construct the path. 
-                                        Id name of the node upstream the leaves where the paths starts. 
+        list[int]: ids of the links of the path, from upstream to downstream
     """    
-    endPoint = False
-    
-    while (initialNodeUpstream != finalDownstreamNode) and (not endPoint):
-        
-        #Gets the links out of the node evaluated
-        linksOut = links[links[SWWM_C.IN_NODE] == initialNodeUpstream].copy()
-
-        if(linksOut.shape[0] > 1):
-            nodesDecision.append(initialNodeUpstream) #Saves the last decision of this path
-
-        if linksOut.empty:
-            endPoint = True
-        else:
-            linkOut = linksOut.sort_values(by=[SWWM_C.MAX_Q,SWWM_C.DIAM], ascending=False).iloc[0] #Orders and select the links by largest diameter/full flow 
-
-            #if the link selected was already selected for this iniNode then it is in a loop
-            if linkOut.name in pipesPath:
-                
-                #If it does not have history is because is rerouting coz it went to an outlet
-                if not nodesDecision:
-                    print("Error")
-                else:
-                    linkOut,pipesPath,nodesDecision = reRoute(nodesDecision,links, pipesPath)
-
-            initialNodeUpstream, pipesPath = addLinkToPath(linkOut,pipesPath)
-         
-            
-    return pipesPath, nodesDecision, initialNodeUpstream
+    path = []
+    link = successors[node]
+    while link >= 0:
+        path.append(link)
+        link = successors[topology.linkOutNode[link]]
+
+    return path
+
+class DrainageTree:
+    """
+        Successor tree of the network rooted at a final node (see getDominantSuccessors) labelled with an Euler tour: the nodes upstream 
+        of a node in the tree are the ones whose entry is within the interval [entry, exit) of the node. This gives O(1) upstream tests. 
+        When a path is given its links are forced as successors, so the path is a chain of the tree and the path link that a node drains 
+        into is found by a binary search over the path.
+    """
+    __slots__ = ('topology', 'successors', 'entry', 'exit')
+
+    def __init__(self, finalNode:int, topology:'nt.NetworkTopology', pathLinks:np.ndarray=None):
+        """
+        Args:
+            finalNode (int): id of the root of the tree (e.g., the WRRF or the last node of a path)
+            topology (nt.NetworkTopology): connectivity of the links of the network
+            pathLinks (np.ndarray, optional): ids of the links of a path ending at the final node, from upstream to downstream. Defaults to None.
+        """
+        self.topology = topology
+        self.successors = getDominantSuccessors(finalNode, topology)
+        if pathLinks is not None and len(pathLinks):
+            self.successors[topology.linkInNode[pathLinks]] = pathLinks
+
+        self.entry = np.full(len(topology.nodeNames), -1, dtype=np.int64)
+        self.exit = np.full(len(topology.nodeNames), -1, dtype=np.int64)
+        if finalNode < 0:
+            return
+
+        offsets, children = getSuccessorChildren(self.successors, topology)
+        entry, exit = self.entry, self.exit
+        tour = 0
+        pending = [finalNode]
+        while pending:
+            node = pending.pop()
+            if node >= 0:
+                entry[node] = tour
+                tour += 1
+                pending.append(~node) #closes the interval of the node after its children
+                pending.extend(children[offsets[node]:offsets[node + 1]].tolist())
+            else:
+                exit[~node] = tour
+
+    def isUpstream(self, node:int, downstreamNode:int)-> bool:
+        """
+            Tells if a node drains into another one following the tree (a node is upstream of itself).
+        Args:
+            node (int): id of the node upstream
+            downstreamNode (int): id of the node downstream
+        Returns:
+            bool: True if the node is in the subtree of the downstream node
+        """
+        return node >= 0 and downstreamNode >= 0 and self.entry[node] >= 0 and self.entry[downstreamNode] <= self.entry[node] < self.exit[downstreamNode]
+
+    def getNearestPathLink(self, node:int, pathLinks:np.ndarray)-> int:
+        """
+            Finds the first link of the path, going downstream, whose outlet node is reached by the node. The path must be the one 
+            given to build the tree, so the nodes reached by a node are the ones of a final part of the path (binary search).
+        Args:
+            node (int): id of the node
+            pathLinks (np.ndarray): ids of the links of the path, from upstream to downstream
+        Returns:
+            int: position of the link in the path, -1 if the node does not drain into the path
+        """
+        outNodes = self.topology.linkOutNode[pathLinks]
+        if len(pathLinks) == 0 or not self.isUpstream(node, outNodes[-1]):
+            return -1
+
+        first, last = 0, len(pathLinks) - 1
+        while first < last:
+            middle = (first + last) // 2
+            if self.isUpstream(node, outNodes[middle]):
+                last = middle
+            else:
+                first = middle + 1
 
+        return first
 
 #Could be replaced by using this swmmio.utils.functions.find_network_trace()
-def getPathToWRRF(finalDownstreamNode:str,linksDF:'pd.DataFrame',leaves:list[str])-> dict[list[str]]:
+def getPathToWRRF(finalDownstreamNode:str,topology:'nt.NetworkTopology',leaves:list[str],singlePass:bool=False)-> dict[list[str]]:
     """
         Get all paths from leaves (end nodes or the network) to a specific final node (downstream the leaves), 
         starting at the leave and going downstream to the final node.
+        If singlePass, the dominant successor tree towards the final node is computed once (linear time) and the path of each leave is read 
+        from it. Only leaves whose successors run into a loop are searched one by one (see searchPath).
     Args:
         finalDownstreamNode (str): id name of the node downstream the leaves where the paths must finish.
-        linksDF (pd.DataFrame): links of the network and their attributes
+        topology (nt.NetworkTopology): connectivity of the links of the network
         leaves (list[str]): List of nodes from which the path is wanted to the final node
+        singlePass (bool, optional): whether to use the successor tree, useful for many leaves (i.e., all the leaves of getNodesLeaves). Defaults to False.
     Returns:
         dict[list[str]]: the keys are the leaves and values are list with the pipes of the path going from upstream to downstream.
+                         Leaves without a path to the final node are reported and left out.
     """    
     paths = {}
+    finalNode = topology.getNodeId(finalDownstreamNode)
+
+    if singlePass:
+        successors = getDominantSuccessors(finalNode, topology)
+        onTree = getNodesOnSuccessorTree(finalNode, successors, topology)
+
+        for iniNode in leaves:
+            node = topology.getNodeId(iniNode)
+            if node >= 0 and onTree[node]:
+                paths[iniNode] = topology.getLinksNames(getPathFromSuccessors(node, successors, topology))
+
+        leaves = [iniNode for iniNode in leaves if iniNode not in paths] #the rest are searched one by one
 
     # Repeat for each point
     for iniNode in leaves:
+        try:
+            paths[iniNode] = findPath(iniNode, finalDownstreamNode, topology)
+        except PathNotFoundError as e:
+            print(e)
 
-        pathsAux = []
-        decisionsN = []
-        
-        pathsAux, decisionsN, endNode = lookForPath(finalDownstreamNode,iniNode,linksDF,pathsAux,decisionsN)
-
-        while (endNode != finalDownstreamNode):
+    return paths
 
-            try:
-                linkOut,pathsAux,decisionsN = reRoute(decisionsN,linksDF, pathsAux)
 
-            except Exception as e:
-                print(iniNode, " ", e)
-                paths[iniNode] = pathsAux
-                break
+def getMainFlowPredecessors(meanFlows:np.ndarray,topology:'nt.NetworkTopology')-> np.ndarray:
+    """
+        Computes in one pass the main upstream link of every node: the incoming link with the largest flow (the first one in the order 
+        of the links table if there is a tie). Following the predecessors upstream from a node gives its main flow path.
+    Args:
+        meanFlows (np.ndarray): flow of each link used to rank them (e.g., the mean flow), aligned with the link ids
+        topology (nt.NetworkTopology): connectivity of the links of the network
+    Returns:
+        np.ndarray: id of the main incoming link of each node, -1 if no link discharges into the node and -2 if none of 
+                    its incoming links has a flow.
+    """
+    predecessors = np.full(len(topology.nodeNames), -1, dtype=np.int64)
+    if len(topology.inLinks) == 0:
+        return predecessors
 
-            nodeAux, pathsAux = addLinkToPath(linkOut,pathsAux)
+    nodes = topology.linkOutNode[topology.inLinks]
+    flows = meanFlows[topology.inLinks]
+    missing = np.isnan(flows)
 
-            #Looks for the path again
-            pathsAux,decisionsN,endNode = lookForPath(finalDownstreamNode,nodeAux,linksDF,pathsAux,decisionsN)
+    #sorted by node, then largest flow (missing last) and then order of the links table, so the first link of each node is its predecessor
+    order = np.lexsort((np.arange(len(flows)), missing, -np.where(missing, 0, flows), nodes))
+    first = order[np.flatnonzero(np.r_[True, nodes[order][1:] != nodes[order][:-1]])]
 
-        paths[iniNode] = pathsAux  #Saves the list of pipes
-            
-    return paths
+    predecessors[nodes[first]] = np.where(missing[first], -2, topology.inLinks[first])
 
+    return predecessors
 
-def findMainFlowPath(endNode:str,outPath:str,linksNetwork:'pd.DataFrame')-> 'pd.DataFrame':
+def findMainFlowPath(endNode:str,results:'gnfs.SimulationResults',topology:'nt.NetworkTopology',predecessors:np.ndarray=None)-> 'pd.DataFrame':
     """
-        Selects pipe by pipe going upstream from the end node, selecting the pipe with largest flow.
-        Assumes the pipes direction is correct (outnode is downstream and innode upstream)
+        Selects pipe by pipe going upstream from the end node, selecting the pipe with largest flow (see getMainFlowPredecessors).
+        Assumes the pipes direction is correct (outnode is downstream and innode upstream). In loops, only pipes coming from nodes 
+        that are not yet in the trunk are considered, so the search always ends. The path also ends at a node whose pipes have no flow
+        (i.e., they are not in the ranking of the results).
     Args:
         endNode (str): name of the end node (i.e. WRRF). 
-        outPath (str): path of the .out of the network SWMM model.
-        linksNetwork (pd.DataFrame): all links of the network with name as index and its characteristics and connecting nodes as attributes.
+        results (gnfs.SimulationResults): opened results (.out) of the network SWMM model.
+        topology (nt.NetworkTopology): connectivity of all links of the network, with their characteristics in topology.links.
+        predecessors (np.ndarray, optional): main upstream link of every node, to reuse it for several paths. Defaults to None (computed).
     Returns:
         pd.DataFrame: links selected as part of the trunk with name as index and its characteristics and connecting nodes as attributes. 
                       ordered upstream to downstream.
     """
-    nodeEval = endNode
+    nodeEval = topology.getNodeId(endNode)
+    inTrunk = np.zeros(len(topology.nodeNames), dtype=bool)
     trunk = []
-    trunkDF = None
-
-    try:
-        while nodeEval is not None:
-            previousPipes = linksNetwork[linksNetwork[SWWM_C.OUT_NODE]==nodeEval].copy() #gets all the pipes discharging to the evaluated node
-
-            if previousPipes.shape[0] != 0: 
 
-                dfTSprePipes = gnfs.getFlowTimeSeries(previousPipes.index.to_list(),outPath) #gets the time series of all connected pipes to the node evaluated
-
-                pipeTrunk = dfTSprePipes.mean().idxmax() # Calculate the mean of each pipe and gets the pipe with the largest mean
-
-                trunk.append(pipeTrunk) #adds the selected pipe to the list of the trunk
-
-                nodeEval = previousPipes.loc[pipeTrunk,SWWM_C.IN_NODE] #Gets the  name of the inital node of the pipe selected
-            else:
-                nodeEval = None
-
-        trunkUptoDownstream = trunk[::-1]
-        trunkDF = linksNetwork.loc[trunkUptoDownstream].copy() #gets the attributes of the pipes in the trunk and its ordered downstream to upstream
+    meanFlows = None
+    if predecessors is None:
+        #mean flow of every link computed in one pass (or max flow of the database), aligned with the link ids
+        meanFlows = results.getLinkRankingArrays(topology.linkNames)[0]
+        predecessors = getMainFlowPredecessors(meanFlows, topology)
+
+    while nodeEval >= 0 and predecessors[nodeEval] != -1:
+        inTrunk[nodeEval] = True
+        pipeTrunk = predecessors[nodeEval]
+
+        if pipeTrunk < 0 or inTrunk[topology.linkInNode[pipeTrunk]]: #no flows or the pipe closes a loop, the rest of pipes are compared
+            if meanFlows is None:
+                meanFlows = results.getLinkRankingArrays(topology.linkNames)[0]
+            previousPipes = topology.getLinksIn(nodeEval)
+            #pipes without flow (e.g., missing from the results) can not be compared, the path ends if only those are left
+            previousPipes = previousPipes[~inTrunk[topology.linkInNode[previousPipes]] & ~np.isnan(meanFlows[previousPipes])]
+            if len(previousPipes) == 0:
+                break
+            pipeTrunk = previousPipes[np.argmax(meanFlows[previousPipes])] # gets the connected pipe with the largest mean
 
-    except Exception as e:
-        print("Error finding the main water path: ", e)
+        trunk.append(pipeTrunk) #adds the selected pipe to the list of the trunk
+        nodeEval = topology.linkInNode[pipeTrunk] #Gets the inital node of the pipe selected
 
-    return trunkDF
\ No newline at end of file
+    return topology.links.iloc[trunk[::-1]].copy() #gets the attributes of the pipes in the trunk ordered upstream to downstream
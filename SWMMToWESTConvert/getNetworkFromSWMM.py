@@ -1,19 +1,29 @@
 import swmmio
 import os
+import json
+import shutil
+import hashlib
+import math
+import sqlite3
+from contextlib import closing
+import numpy as np
 import pandas as pd
 from itertools import chain
-from swmm.toolkit.shared_enum import LinkAttribute
-from pyswmm import Output
+from collections import OrderedDict
+from swmm.toolkit.shared_enum import LinkAttribute, NodeAttribute, SubcatchAttribute
 
 import SWMMToWESTConvert.SWMM_InpConstants as SWWM_C
 import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
+import SWMMToWESTConvert.networkTopology as nt
 
 
-def getNetwork(networkFile:str)-> tuple[dict,str]:
+def getNetwork(networkFile:str, idWRRF:str=None)-> tuple[dict,str]:
     """
         Instanciates the network as a swmmio model and gets all the relevant elements of the network.
+        If the WRRF is given, only the elements upstream of it are kept (see pruneNetworkToNode).
     Args:
         networkFile (str): path of the .inp of the network
+        idWRRF (str, optional): name of the node representing the entrance of the WRRF. Defaults to None (the whole network).
     Returns:
         tuple[dict,str]: Dictionary with links, leaves, catchments, DWFs, timepatterns, directflows and timeseries of the network. 
         Path to the .out of the network.
@@ -38,8 +48,46 @@ def getNetwork(networkFile:str)-> tuple[dict,str]:
     nElements[STW_C.DIRECTF] = directWaterFlows
     nElements[STW_C.TIMESERIES] = timeS
 
+    if idWRRF is not None:
+        nElements = pruneNetworkToNode(nElements, idWRRF)
+
     return nElements, outfile
 
+def pruneNetworkToNode(nElements:dict, finalNode:str)-> dict:
+    """
+        Keeps only the part of the network draining to the final node: the links whose outlet node has a path to it and the catchments, 
+        DWFs, direct flows and time series of the nodes upstream. The leaves are computed again on the links kept.
+    Args:
+        nElements (dict): Dictionary with links, leaves, catchments, DWFs, timepatterns, directflows and timeseries of the network.
+        finalNode (str): name of the node downstream (i.e., WRRF)
+    Raises:
+        ValueError: if no link is connected to the final node
+    Returns:
+        dict: Dictionary with the same elements, restricted to the network upstream of the final node.
+    """
+    links = nElements[STW_C.LINKS]
+    topology = nt.NetworkTopology(links)
+    node = topology.getNodeId(finalNode)
+    if node < 0:
+        raise ValueError(f"The node {finalNode} is not connected to any link of the network.")
+
+    upstream = nt.getNodesUpstream(topology, node)
+    upstreamNodes = topology.nodeNames[upstream]
+
+    pruned = dict(nElements)
+    pruned[STW_C.LINKS] = links[upstream[topology.linkOutNode]]
+    pruned[STW_C.LEAVES] = getNodesLeaves(pruned[STW_C.LINKS])
+    pruned[STW_C.SUBCATCHMENTS] = nElements[STW_C.SUBCATCHMENTS][nElements[STW_C.SUBCATCHMENTS][SWWM_C.CATCH_OUT].isin(upstreamNodes)]
+    pruned[STW_C.DWFS] = nElements[STW_C.DWFS][nElements[STW_C.DWFS].index.isin(upstreamNodes)]
+    pruned[STW_C.DIRECTF] = nElements[STW_C.DIRECTF][nElements[STW_C.DIRECTF].index.isin(upstreamNodes)]
+    timeSeriesNames = pruned[STW_C.DIRECTF][SWWM_C.DFLOW_TIMES].dropna().unique()
+    pruned[STW_C.TIMESERIES] = nElements[STW_C.TIMESERIES][nElements[STW_C.TIMESERIES].index.isin(timeSeriesNames)]
+
+    print(pruned[STW_C.LINKS].shape[0], "of", links.shape[0], "links and", pruned[STW_C.SUBCATCHMENTS].shape[0], "of",
+          nElements[STW_C.SUBCATCHMENTS].shape[0], "subcatchments drain to", finalNode)
+
+    return pruned
+
 def getNodesLeaves(links:pd.DataFrame)->list[str]:
     """
         Returns the leaves of the network that are not outlets. Leaves are nodes that do not have pipes connected upstream.
@@ -119,6 +167,163 @@ def getSimulationResultsFile(networkFile:str)-> str:
         raise FileNotFoundError(f"Output file '{outfile}' does not exist. Please run a simulation in SWMM before.")
     return outfile
 
+def getResultsDatabaseFile(networkFile:str)-> str:
+    """
+        Looks for the PCSWMM database of the results (.db) of the inp file passed as parameter. The database is optional.
+    Args:
+        networkFile (str): path of the inp of the network
+    Returns:
+        str: path of the database of the results, or None if there is not one with the same name as the inp
+    """    
+    fileName, extension = os.path.splitext(networkFile)
+    dbFile = f"{fileName}.db"
+
+    return dbFile if os.path.exists(dbFile) else None
+
+def readResultsTableFromDB(dbFile:str, tables:list[str], columns:list[str])-> pd.DataFrame:
+    """
+        Reads summary results of the PCSWMM database with a single SQL query over the tables of one type of element
+        (e.g., STW_C.DB_LINK_TABLES with STW_C.DB_MAX_FLOW, STW_C.DB_NODE_TABLES with STW_C.DB_TOTAL_INFLOW). Tables missing in the database are skipped.
+    Args:
+        dbFile (str): path of the database of the results
+        tables (list[str]): tables to read, all of them must have the columns
+        columns (list[str]): columns to read
+    Raises:
+        ValueError: if none of the tables is in the database
+    Returns:
+        pd.DataFrame: index is the name of the element and columns are the ones requested
+    """    
+    with closing(sqlite3.connect(f"file:{dbFile}?mode=ro", uri=True)) as connection:
+        existing = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        tablesInDB = [table for table in tables if table in existing]
+        if not tablesInDB:
+            raise ValueError(f"The database '{dbFile}' does not have any of the tables {tables}.")
+
+        selected = ', '.join([STW_C.DB_NAME] + columns)
+        query = ' UNION ALL '.join(f"SELECT {selected} FROM {table}" for table in tablesInDB)
+        values = pd.read_sql_query(query, connection, index_col=STW_C.DB_NAME)
+
+    return values
+
+def getOutFileSignature(fileOut:str)-> dict:
+    """
+        Returns the values that identify a version of the .out: its absolute path, size and modification time.
+    Args:
+        fileOut (str): path of the .out of the network
+    Returns:
+        dict: path, size in bytes and modification time in ns of the .out
+    """    
+    stat = os.stat(fileOut)
+
+    return {'path': os.path.abspath(fileOut), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+def getResultsCachePath(fileOut:str, cacheDir:str=None)-> str:
+    """
+        Returns the folder where the cache of the .out is stored. The folder name is a hash of the absolute path of the .out.
+    Args:
+        fileOut (str): path of the .out of the network
+        cacheDir (str, optional): folder with all the caches. Defaults to STW_C.RESULTS_CACHE_DIR next to the .out.
+    Returns:
+        str: path of the cache folder of the .out
+    """    
+    outPath = os.path.abspath(fileOut)
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(outPath), STW_C.RESULTS_CACHE_DIR)
+
+    return os.path.join(cacheDir, hashlib.sha1(outPath.encode()).hexdigest())
+
+def isResultsCacheValid(cachePath:str, signature:dict)-> bool:
+    """
+        Checks that the cache exists and that it was created from the same version of the .out (same path, size and modification time).
+    Args:
+        cachePath (str): folder of the cache of the .out
+        signature (dict): signature of the current .out
+    Returns:
+        bool: True if the cache can be used, False if it is missing or stale.
+    """    
+    metaFile = os.path.join(cachePath, STW_C.CACHE_META_FILE)
+    if not os.path.exists(metaFile) or not os.path.exists(os.path.join(cachePath, STW_C.CACHE_FLOWS_FILE)):
+        return False
+
+    with open(metaFile, 'r') as f:
+        meta = json.load(f)
+
+    return meta[STW_C.CACHE_SIGNATURE] == signature
+
+def buildResultsCache(header:dict, linkView:np.ndarray, cachePath:str, signature:dict):
+    """
+        Converts the link flow block of the .out into a column-major .npy (one contiguous column per link) and a json with the link names 
+        and the time information. The cache is written in a temporary folder and then moved, so an interrupted build is never used.
+    Args:
+        header (dict): description of the .out from readOutFileHeader
+        linkView (np.ndarray): results of the links of the .out from getElementResultsView
+        cachePath (str): folder of the cache of the .out
+        signature (dict): signature of the .out stored with the cache to detect when it gets stale
+    """    
+    tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+    shutil.rmtree(tmpPath, ignore_errors=True)
+    os.makedirs(tmpPath)
+
+    links = list(header[STW_C.OUT_LINKS]) #in the order of their index in the .out
+    nPeriods = header[STW_C.OUT_PERIODS]
+    
+    flows = np.lib.format.open_memmap(os.path.join(tmpPath, STW_C.CACHE_FLOWS_FILE), mode='w+', dtype=np.float32, 
+                                      shape=(nPeriods, len(links)), fortran_order=True)
+    chunk = getChunkPeriods(4*len(links))
+    for t in range(0, nPeriods, chunk): #copies chunks of periods to keep the memory bounded
+        flows[t:t + chunk] = linkView[t:t + chunk, :, LinkAttribute.FLOW_RATE.value]
+    flows.flush()
+    del flows
+
+    meta = {STW_C.CACHE_SIGNATURE: signature, STW_C.CACHE_LINKS: links, STW_C.CACHE_START: str(header[STW_C.OUT_START]),
+            STW_C.CACHE_REPORT_STEP: header[STW_C.OUT_REPORT_STEP], STW_C.CACHE_PERIODS: nPeriods}
+
+    with open(os.path.join(tmpPath, STW_C.CACHE_META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(cachePath, ignore_errors=True)
+    os.replace(tmpPath, cachePath)
+
+def evictResultsCache(cacheDir:str, maxSize:int=None, keep:str=None):
+    """
+        Deletes the least recently used caches of the folder until the total size is below maxSize.
+    Args:
+        cacheDir (str): folder with all the caches
+        maxSize (int, optional): Maximum size in bytes of the folder. Defaults to STW_C.RESULTS_CACHE_MAX_SIZE.
+        keep (str, optional): cache folder that should never be deleted (i.e., the one being used). Defaults to None.
+    """    
+    if maxSize is None:
+        maxSize = STW_C.RESULTS_CACHE_MAX_SIZE
+
+    entries = []
+    for entry in os.scandir(cacheDir):
+        if entry.is_dir():
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+
+    totalSize = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries): #oldest used first
+        if totalSize <= maxSize:
+            break
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+            totalSize -= size
+
+def loadLinkFlowsCache(fileOut:str, cacheDir:str=None)-> tuple[np.ndarray,dict[str,int],pd.DatetimeIndex]:
+    """
+        Returns the link flows of the .out from its cache as a read only memory map. The cache is (re)built if it does not exist or if the .out changed.
+        Columns are contiguous, so the series of a link is a view of the file without any copy.
+    Args:
+        fileOut (str): path of the .out of the network
+        cacheDir (str, optional): folder with all the caches. Defaults to STW_C.RESULTS_CACHE_DIR next to the .out.
+    Returns:
+        tuple[np.ndarray,dict[str,int],pd.DatetimeIndex]: memory mapped array with time as rows and links as columns.
+                                                          Column of each link name. Datetime index of the rows.
+    """    
+    results = SimulationResults(fileOut, cacheDir)
+
+    return results.getLinkFlowsCache(), results.header[STW_C.OUT_LINKS], results.timeIndex
+
 def getsNetworksLinks(inpPath:str)-> pd.DataFrame:
     """
         Gets the links of the network (includes pumps, orifices, pipes..) 
@@ -181,31 +386,738 @@ def getHourlyPatterns(networkFile:str)-> dict[list]:
     
     return patterns
 
-def getFlowTimeSeries(pipes:list[str], fileOut:str)-> pd.DataFrame:
+def getChunkPeriods(bytesPerPeriod:int)-> int:
     """
-        Gets the flow time series of a list of pipes using their name as key.
+        Returns the number of reporting periods processed at once so that a chunk of results uses at most STW_C.RESULTS_CHUNK_MEMORY bytes.
+        Processing the results by chunks of periods keeps the peak memory independent of the length of the simulation.
+    Args:
+        bytesPerPeriod (int): bytes used by the values of one period of the chunk
+    Returns:
+        int: number of periods of each chunk (at least one)
+    """    
+    return max(1, STW_C.RESULTS_CHUNK_MEMORY // max(1, bytesPerPeriod))
+
+def getTimeIndex(start:'datetime', reportStep:int, nPeriods:int)-> pd.DatetimeIndex:
+    """
+        Builds the datetime index of the reporting periods of a simulation without creating a datetime object per period.
+    Args:
+        start (datetime): start of the simulation
+        reportStep (int): report step in seconds
+        nPeriods (int): number of reporting periods
+    Returns:
+        pd.DatetimeIndex: reporting times of the simulation (the first one is one report step after the start)
+    """    
+    step = pd.Timedelta(seconds=reportStep)
+    
+    return pd.date_range(start=pd.Timestamp(start) + step, periods=nPeriods, freq=step)
+
+def decodeOutFileName(name:bytes)-> str:
+    """
+        Decodes the name of an element of the .out. SWMM writes the names with the encoding of the .inp, so names that are not utf-8 are 
+        decoded as latin-1 (e.g., inp files saved in Windows with accents).
+    Args:
+        name (bytes): name of the element as written in the .out
+    Returns:
+        str: name of the element
+    """    
+    try:
+        return name.decode('utf-8')
+    except UnicodeDecodeError:
+        return name.decode('latin-1')
+
+def readOutFileHeader(fileOut:str)-> dict:
+    """
+        Reads the description of a SWMM5 binary output: the names of the elements, the number of variables reported, 
+        the times and the position of the results block. It does not read any result.
     Args:
-        pipes (list[str]): names of the pipes for which to obtain the flow results
         fileOut (str): path of the .out of the network
+    Raises:
+        ValueError: if the file is not a complete SWMM5 binary output or if the simulation had errors
+    Returns:
+        dict: names of the subcatchments, nodes and links (with their index), number of variables of each element type (subcatchments, nodes, 
+              links, system), start date, report step in seconds, number of periods, start and size in bytes of each period of the results block.
+    """    
+    fileSize = os.path.getsize(fileOut)
 
+    with open(fileOut, 'rb') as f:
+        magic, _, _, nSubcatch, nNodes, nLinks, nPolls = np.fromfile(f, dtype='<i4', count=7)
+        f.seek(fileSize - 24)
+        idStart, inputStart, resultsStart, nPeriods, errorCode, magicEnd = np.fromfile(f, dtype='<i4', count=6)
+
+        if magic != STW_C.OUT_MAGIC or magicEnd != STW_C.OUT_MAGIC:
+            raise ValueError(f"'{fileOut}' is not a complete SWMM binary output file.")
+        if errorCode != 0 or nPeriods == 0:
+            raise ValueError(f"The simulation of '{fileOut}' did not finish correctly (error {errorCode}).")
+
+        #Names of the elements, in the order of their index
+        f.seek(idStart)
+        names = []
+        for _ in range(nSubcatch + nNodes + nLinks + nPolls):
+            length = np.fromfile(f, dtype='<i4', count=1)[0]
+            names.append(decodeOutFileName(f.read(length)))
+
+        #Skips the input properties (area of subcatchments, type/invert/depth of nodes, type/offsets/depth/length of links)
+        f.seek(inputStart + 4*(2 + nSubcatch) + 4*(4 + 3*nNodes) + 4*(6 + 5*nLinks))
+        nVars = []
+        for _ in range(4):
+            n = np.fromfile(f, dtype='<i4', count=1)[0]
+            f.seek(4*n, os.SEEK_CUR) #codes of the variables
+            nVars.append(int(n))
+
+        startDate = np.fromfile(f, dtype='<f8', count=1)[0]
+        reportStep = np.fromfile(f, dtype='<i4', count=1)[0]
+
+    header = {}
+    header[STW_C.OUT_SUBCATCHMENTS] = {name: i for i, name in enumerate(names[:nSubcatch])}
+    header[STW_C.OUT_NODES] = {name: i for i, name in enumerate(names[nSubcatch:nSubcatch + nNodes])}
+    header[STW_C.OUT_LINKS] = {name: i for i, name in enumerate(names[nSubcatch + nNodes:nSubcatch + nNodes + nLinks])}
+    header[STW_C.OUT_N_VARS] = nVars
+    header[STW_C.OUT_START] = (pd.Timestamp('1899-12-30') + pd.to_timedelta(startDate, unit='D')).round('s') #SWMM dates are days since 30/12/1899
+    header[STW_C.OUT_REPORT_STEP] = int(reportStep)
+    header[STW_C.OUT_PERIODS] = int(nPeriods)
+    header[STW_C.OUT_RESULTS_START] = int(resultsStart)
+    header[STW_C.OUT_PERIOD_SIZE] = 8 + 4*(nSubcatch*nVars[0] + nNodes*nVars[1] + nLinks*nVars[2] + nVars[3]) #date and values
+
+    return header
+
+def mapOutFileResults(fileOut:str, header:dict)-> np.memmap:
+    """
+        Memory maps the results block of the .out. Each row is a reporting period, with the date (as two float32) followed by the values of
+        the subcatchments, nodes, links and system.
+    Args:
+        fileOut (str): path of the .out of the network
+        header (dict): description of the .out from readOutFileHeader
+    Returns:
+        np.memmap: read only float32 array with periods as rows
+    """    
+    return np.memmap(fileOut, dtype='<f4', mode='r', offset=header[STW_C.OUT_RESULTS_START],
+                     shape=(header[STW_C.OUT_PERIODS], header[STW_C.OUT_PERIOD_SIZE] // 4))
+
+def getElementResultsView(results:np.memmap, header:dict, elementType:str)-> np.ndarray:
+    """
+        Returns the results of one type of element as a 3-D strided view (periods, elements, variables) of the results block, without copying.
+        The series of an element attribute is view[:, elementIndex, attribute].
+    Args:
+        results (np.memmap): results block from mapOutFileResults
+        header (dict): description of the .out from readOutFileHeader
+        elementType (str): STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES or STW_C.OUT_LINKS
+    Returns:
+        np.ndarray: view of the results of all the elements of the type
+    """    
+    elementTypes = [STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES, STW_C.OUT_LINKS]
+    iType = elementTypes.index(elementType)
+    nVars = header[STW_C.OUT_N_VARS]
+    
+    first = 2 + sum(len(header[t]) * nVars[i] for i, t in enumerate(elementTypes[:iType])) #skips the date and the previous element types
+    last = first + len(header[elementType]) * nVars[iType]
+
+    return results[:, first:last].reshape(results.shape[0], len(header[elementType]), nVars[iType])
+
+def getPeriodsSlice(start:'datetime', reportStep:int, nPeriods:int, startTime:'datetime'=None, endTime:'datetime'=None, 
+                    step:'timedelta'=None)-> slice:
+    """
+        Converts a time window and a step into the slice of reporting periods to read, using that the periods are regular.
+    Args:
+        start (datetime): start of the simulation
+        reportStep (int): report step in seconds
+        nPeriods (int): number of reporting periods
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+    Raises:
+        ValueError: if the step is not a multiple of the report step
+    Returns:
+        slice: periods to read
+    """    
+    report = pd.Timedelta(seconds=reportStep)
+    first = pd.Timestamp(start) + report #time of the period 0
+
+    iStart = 0 if startTime is None else min(max(math.ceil((pd.Timestamp(startTime) - first) / report), 0), nPeriods)
+    iEnd = nPeriods if endTime is None else min(max(math.ceil((pd.Timestamp(endTime) - first) / report), 0), nPeriods)
+    
+    stride = 1
+    if step is not None:
+        stride = pd.Timedelta(step) / report
+        if stride < 1 or stride != int(stride):
+            raise ValueError(f"The step {step} must be a multiple of the report step ({reportStep} s).")
+
+    return slice(iStart, iEnd, int(stride))
+
+def getResultsSeriesArray(fileOut:str, elementType:str, names:list[str], attribute:'Enum', startTime:'datetime'=None, 
+                          endTime:'datetime'=None, step:'timedelta'=None)-> tuple[np.ndarray,pd.DatetimeIndex]:
+    """
+        Reads the series of one attribute for many elements of the same type from the memory mapped .out, in chunks of periods.
+        Only the periods within the time window and step are read. See SimulationResults.getSeriesArray.
+    Args:
+        fileOut (str): path of the .out of the network
+        elementType (str): STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES or STW_C.OUT_LINKS
+        names (list[str]): names of the elements
+        attribute (Enum): attribute to read from swmm.toolkit.shared_enum (i.e., SubcatchAttribute, NodeAttribute or LinkAttribute)
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+    Raises:
+        KeyError: if one of the names is not an element of the type in the .out
+    Returns:
+        tuple[np.ndarray,pd.DatetimeIndex]: array with time as rows and the elements as columns, in the same order as names.
+                                            Datetime index shared by all the columns.
+    """    
+    return SimulationResults(fileOut).getSeriesArray(elementType, names, attribute, startTime, endTime, step)
+
+def getLinksFlowArray(pipes:list[str], fileOut:str, startTime:'datetime'=None, endTime:'datetime'=None, 
+                      step:'timedelta'=None)-> tuple[np.ndarray,pd.DatetimeIndex]:
+    """
+        Reads the flow of many links from the memory mapped .out. The values are written in a preallocated array.
+    Args:
+        pipes (list[str]): names of the links for which to obtain the flow results, without duplicates
+        fileOut (str): path of the .out of the network
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+    Returns:
+        tuple[np.ndarray,pd.DatetimeIndex]: array with time as rows and the links as columns, in the same order as pipes.
+                                            Datetime index shared by all the columns.
+    """    
+    return getResultsSeriesArray(fileOut, STW_C.OUT_LINKS, pipes, LinkAttribute.FLOW_RATE, startTime, endTime, step)
+
+def getFlowTimeSeries(pipes:list[str], fileOut:str, startTime:'datetime'=None, endTime:'datetime'=None, 
+                      step:'timedelta'=None)-> pd.DataFrame:
+    """
+        Gets the flow time series of a list of pipes using their name as key. Only the periods within the time window and step are read.
+        See SimulationResults.getFlowTimeSeries.
+    Args:
+        pipes (list[str]): names of the pipes for which to obtain the flow results
+        fileOut (str): path of the .out of the network
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
     Returns:
         pd.DataFrame: time as index and columns are the names of the pipes 
     """    
-    tsDF = None
+    return SimulationResults(fileOut).getFlowTimeSeries(pipes, startTime, endTime, step)
+
+def getNodeTimeSeries(nodes:list[str], fileOut:str, attribute:NodeAttribute=NodeAttribute.TOTAL_INFLOW, startTime:'datetime'=None, 
+                      endTime:'datetime'=None, step:'timedelta'=None)-> pd.DataFrame:
+    """
+        Gets a time series of a list of nodes using their name as key. See SimulationResults.getNodeTimeSeries.
+    Args:
+        nodes (list[str]): names of the nodes for which to obtain the results
+        fileOut (str): path of the .out of the network
+        attribute (NodeAttribute, optional): NodeAttribute.TOTAL_INFLOW, NodeAttribute.LATERAL_INFLOW or NodeAttribute.INVERT_DEPTH.
+                                             Defaults to NodeAttribute.TOTAL_INFLOW.
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+    Returns:
+        pd.DataFrame: time as index and columns are the names of the nodes
+    """    
+    return SimulationResults(fileOut).getNodeTimeSeries(nodes, attribute, startTime, endTime, step)
+
+def getRunoffTimeSeries(subcatchments:list[str], fileOut:str, startTime:'datetime'=None, endTime:'datetime'=None, 
+                        step:'timedelta'=None)-> pd.DataFrame:
+    """
+        Gets the runoff time series of a list of subcatchments using their name as key. See SimulationResults.getRunoffTimeSeries.
+    Args:
+        subcatchments (list[str]): names of the subcatchments for which to obtain the runoff
+        fileOut (str): path of the .out of the network
+        startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+        endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+        step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+    Returns:
+        pd.DataFrame: time as index and columns are the names of the subcatchments
+    """    
+    return SimulationResults(fileOut).getRunoffTimeSeries(subcatchments, startTime, endTime, step)
+
+def getDryWeatherStart(fileOut:str)-> pd.Timestamp:
+    """
+        Returns the first time of the simulation after the stabilisation period of the flow (STW_C.STABILISATION_DAYS after the first report).
+    Args:
+        fileOut (str): path of the .out of the network
+    Returns:
+        pd.Timestamp: first time considered as stable flow
+    """    
+    return SimulationResults(fileOut).getDryWeatherStart()
+
+def getHourColumns()-> list[str]:
+    """
+        Returns the columns with the mean flow of each hour of the day.
+    Returns:
+        list[str]: one column per hour, from 0 to 23.
+    """    
+    return [f"{STW_C.STAT_HOUR_PREFIX}{h}" for h in range(24)]
+
+def getStatisticsColumns()-> list[str]:
+    """
+        Returns the columns of the table of flow statistics of the links.
+    Returns:
+        list[str]: mean, min, max, volume and the mean flow of each hour of the day.
+    """    
+    return [STW_C.STAT_MEAN, STW_C.STAT_MIN, STW_C.STAT_MAX, STW_C.STAT_VOLUME] + getHourColumns()
+
+def computeFlowStatistics(flows:np.ndarray, timeIndex:pd.DatetimeIndex)-> np.ndarray:
+    """
+        Computes in one pass the mean, min, max, volume and the 24-hour mean profile of every column of the flows.
+        The rows are processed in chunks of periods (see getChunkPeriods) keeping running sums, so the memory used does not 
+        depend on the length of the simulation.
+    Args:
+        flows (np.ndarray): flows with time as rows and links as columns (can be a memory map)
+        timeIndex (pd.DatetimeIndex): datetime of the rows, with a constant report step
+    Returns:
+        np.ndarray: one row per link with the values in the order of getStatisticsColumns()
+    """    
+    nPeriods, nLinks = flows.shape
+    reportStep = (timeIndex[1] - timeIndex[0]).total_seconds() if nPeriods > 1 else 0
+
+    sums = np.zeros(nLinks)
+    mins = np.full(nLinks, np.inf)
+    maxs = np.full(nLinks, -np.inf)
+    hourSums = np.zeros((24, nLinks))
+    hourCounts = np.zeros(24)
+
+    chunk = getChunkPeriods(8*nLinks + 8*24)
+    for t in range(0, nPeriods, chunk):
+        block = np.asarray(flows[t:t + chunk], dtype=np.float64)
+        inHour = (timeIndex[t:t + chunk].hour.to_numpy()[:, None] == np.arange(24)).astype(np.float64) #one column per hour of the day
+
+        sums += block.sum(axis=0)
+        mins = np.minimum(mins, block.min(axis=0))
+        maxs = np.maximum(maxs, block.max(axis=0))
+        hourSums += inHour.T @ block
+        hourCounts += inHour.sum(axis=0)
+
+    columns = getStatisticsColumns()
+    position = {column: i for i, column in enumerate(columns)}
+    hourPositions = np.array([position[column] for column in getHourColumns()])
+
+    stats = np.full((nLinks, len(columns)), np.nan)
+    if nPeriods:
+        stats[:, position[STW_C.STAT_MEAN]] = sums / nPeriods
+        stats[:, position[STW_C.STAT_MIN]] = mins
+        stats[:, position[STW_C.STAT_MAX]] = maxs
+    stats[:, position[STW_C.STAT_VOLUME]] = sums * reportStep
+    withValues = np.flatnonzero(hourCounts)
+    stats[:, hourPositions[withValues]] = (hourSums[withValues] / hourCounts[withValues, None]).T
+
+    return stats
+
+def getLinkFlowStatistics(fileOut:str, cacheDir:str=None)-> pd.DataFrame:
+    """
+        Returns the table of flow statistics of all the links of the .out, computed in one pass over the link flow block.
+        See SimulationResults.getLinkFlowStatistics.
+    Args:
+        fileOut (str): path of the .out of the network
+        cacheDir (str, optional): folder with all the caches. Defaults to STW_C.RESULTS_CACHE_DIR next to the .out.
+    Returns:
+        pd.DataFrame: index is the link name and columns are the mean, min, max, volume and the mean flow of each hour of the day.
+    """    
+    return SimulationResults(fileOut, cacheDir).getLinkFlowStatistics()
+
+def getGroupsHourlyFlows(fileOut:str, groups:dict[str,list[str]], startTime:'datetime'=None)-> pd.DataFrame:
+    """
+        Returns the mean flow and the mean flow of each hour of the day of the total flow of groups of links. 
+        See SimulationResults.getGroupsHourlyFlows.
+    Args:
+        fileOut (str): path of the .out of the network
+        groups (dict[str,list[str]]): names of the links of each group, with the name of the group as key. A group can be a single link.
+        startTime (datetime, optional): first time to use (inclusive). Defaults to None (the end of the stabilisation period, see getDryWeatherStart).
+    Returns:
+        pd.DataFrame: index is the name of the group and columns are the mean flow and the mean flow of each hour of the day.
+    """    
+    return SimulationResults(fileOut).getGroupsHourlyFlows(groups, startTime)
+
+
+class SimulationResults:
+    """
+        Results of a SWMM simulation opened once. The header of the .out is decoded and its results block memory mapped when the object is 
+        created, and the last series read are kept in memory (least recently used are dropped first), so all the steps of a conversion 
+        share the same handle instead of opening the .out again.
+    """
+
+    def __init__(self, fileOut:str, cacheDir:str=None, maxMemory:int=None, dbFile:str=None, linkRanking:pd.DataFrame=None, 
+                 flowStats:pd.DataFrame=None):
+        """
+        Args:
+            fileOut (str): path of the .out of the network
+            cacheDir (str, optional): folder with all the caches on disk. Defaults to STW_C.RESULTS_CACHE_DIR next to the .out.
+            maxMemory (int, optional): maximum bytes of the series kept in memory. Defaults to STW_C.RESULTS_CHUNK_MEMORY.
+            dbFile (str, optional): path of the PCSWMM database of the same results, used to rank the links if STW_C.USE_RESULTS_DB. 
+                                    Defaults to None.
+            linkRanking (pd.DataFrame, optional): ranking of the links already obtained for the same results (see getLinkRanking). 
+                                                  Defaults to None (obtained when needed).
+            flowStats (pd.DataFrame, optional): flow statistics of the links already computed for the same results (see getLinkFlowStatistics).
+                                                Defaults to None (computed when needed).
+        Raises:
+            ValueError: if the file is not a complete SWMM5 binary output or if the simulation had errors
+        """        
+        self.fileOut = fileOut
+        self.cacheDir = cacheDir
+        self.dbFile = dbFile
+        self.maxMemory = STW_C.RESULTS_CHUNK_MEMORY if maxMemory is None else maxMemory
+
+        self.header = readOutFileHeader(fileOut)
+        self.results = mapOutFileResults(fileOut, self.header)
+        self.timeIndex = getTimeIndex(self.header[STW_C.OUT_START], self.header[STW_C.OUT_REPORT_STEP], self.header[STW_C.OUT_PERIODS])
+
+        self.seriesCache = OrderedDict() #(elementType, attribute, periods, name) -> values
+        self.seriesCacheBytes = 0
+        self.flowsCache = None
+        self.flowStats = flowStats
+        self.linkRanking = linkRanking
+        self.rankingArrays = None #(linkNames, flows, hasFlow) of the last network, see getLinkRankingArrays
+
+    def __enter__(self):
+        return self
 
-    for p in pipes:
+    def __exit__(self, *args):
+        self.close()
 
-        #Gets the timeseries of the flow from the connections to the path and the pipe before the discharge
-        with Output(fileOut) as out:
-            tsEval = out.link_series(p, LinkAttribute.FLOW_RATE) # time series as dictionary with time as key
-       
-            #Convert the dictionaries into dataframes
-            dfEval = pd.DataFrame.from_dict(tsEval, orient='index',columns=[p]) # dataframe of the time series 
+    def close(self):
+        """
+            Releases the memory maps and the series kept in memory.
+        """        
+        self.results = None
+        self.flowsCache = None
+        self.seriesCache.clear()
+        self.seriesCacheBytes = 0
 
-            if tsDF is None:
-                tsDF = dfEval
+    def getOpenArgs(self)-> dict:
+        """
+            Arguments to open the same results again (e.g., in another process) without ranking the links or computing their statistics again.
+        Returns:
+            dict: keyword arguments of SimulationResults.
+        """        
+        return {'fileOut': self.fileOut, 'cacheDir': self.cacheDir, 'maxMemory': self.maxMemory, 'dbFile': self.dbFile, 
+                'linkRanking': self.getLinkRanking(), 'flowStats': self.flowStats}
+
+    def getElementResultsView(self, elementType:str)-> np.ndarray:
+        """
+            Returns the results of one type of element as a 3-D strided view (periods, elements, variables) of the results block.
+        Args:
+            elementType (str): STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES or STW_C.OUT_LINKS
+        Returns:
+            np.ndarray: view of the results of all the elements of the type
+        """        
+        return getElementResultsView(self.results, self.header, elementType)
+
+    def getPeriodsSlice(self, startTime:'datetime'=None, endTime:'datetime'=None, step:'timedelta'=None)-> slice:
+        """
+            Converts a time window and a step into the slice of reporting periods of the simulation.
+        Args:
+            startTime (datetime, optional): first time (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods, a multiple of the report step. Defaults to None (every period).
+        Returns:
+            slice: periods within the window
+        """        
+        return getPeriodsSlice(self.header[STW_C.OUT_START], self.header[STW_C.OUT_REPORT_STEP], self.header[STW_C.OUT_PERIODS], 
+                               startTime, endTime, step)
+
+    def getDryWeatherStart(self)-> pd.Timestamp:
+        """
+            Returns the first time of the simulation after the stabilisation period of the flow (STW_C.STABILISATION_DAYS after the first report).
+        Returns:
+            pd.Timestamp: first time considered as stable flow
+        """        
+        return self.timeIndex[0] + pd.Timedelta(days=STW_C.STABILISATION_DAYS)
+
+    def getLinkFlowsCache(self)-> np.ndarray:
+        """
+            Returns the link flows from the cache on disk as a read only memory map, with the links in the order of the .out. 
+            The first call (re)builds the cache if it does not exist or if the .out changed.
+        Returns:
+            np.ndarray: memory mapped array with time as rows and links as columns.
+        """        
+        if self.flowsCache is None:
+            signature = getOutFileSignature(self.fileOut)
+            cachePath = getResultsCachePath(self.fileOut, self.cacheDir)
+
+            if not isResultsCacheValid(cachePath, signature):
+                print("Creating the cache of the flows of", self.fileOut)
+                buildResultsCache(self.header, self.getElementResultsView(STW_C.OUT_LINKS), cachePath, signature)
+                evictResultsCache(os.path.dirname(cachePath), keep=cachePath)
             else:
-                tsDF = tsDF.join(dfEval)
+                os.utime(cachePath) #marks the cache as recently used for the eviction
+
+            self.flowsCache = np.load(os.path.join(cachePath, STW_C.CACHE_FLOWS_FILE), mmap_mode='r')
+
+        return self.flowsCache
+
+    def getCachedSeries(self, key:tuple, names:list[str], readSeries:'Callable')-> np.ndarray:
+        """
+            Returns the series of the names from the series kept in memory, reading the missing ones in bulk with readSeries.
+            The least recently used series are dropped when the ones kept use more than maxMemory bytes, so long simulations keep fewer series.
+        Args:
+            key (tuple): element type, attribute and periods of the series
+            names (list[str]): names of the elements
+            readSeries (Callable): function that receives a list of names and returns their values with time as rows
+        Returns:
+            np.ndarray: array with time as rows and the elements as columns, in the same order as names.
+        """        
+        missing = [name for name in dict.fromkeys(names) if key + (name,) not in self.seriesCache]
+        if missing:
+            newValues = readSeries(missing)
+            for j, name in enumerate(missing):
+                series = np.ascontiguousarray(newValues[:, j])
+                self.seriesCache[key + (name,)] = series
+                self.seriesCacheBytes += series.nbytes
+
+        values = np.empty((len(range(*key[-3:])), len(names)))
+        for j, name in enumerate(names):
+            self.seriesCache.move_to_end(key + (name,)) #most recently used at the end
+            values[:, j] = self.seriesCache[key + (name,)]
+
+        while self.seriesCacheBytes > self.maxMemory and self.seriesCache:
+            _, series = self.seriesCache.popitem(last=False)
+            self.seriesCacheBytes -= series.nbytes
+
+        return values
+
+    def getSeriesArray(self, elementType:str, names:list[str], attribute:'Enum', startTime:'datetime'=None, endTime:'datetime'=None, 
+                       step:'timedelta'=None)-> tuple[np.ndarray,pd.DatetimeIndex]:
+        """
+            Reads the series of one attribute for many elements of the same type from the memory mapped .out, in chunks of periods.
+            Only the periods within the time window and step are read, and only the series that are not already in memory.
+        Args:
+            elementType (str): STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES or STW_C.OUT_LINKS
+            names (list[str]): names of the elements
+            attribute (Enum): attribute to read from swmm.toolkit.shared_enum (i.e., SubcatchAttribute, NodeAttribute or LinkAttribute)
+            startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+        Raises:
+            KeyError: if one of the names is not an element of the type in the .out
+        Returns:
+            tuple[np.ndarray,pd.DatetimeIndex]: array with time as rows and the elements as columns, in the same order as names.
+                                                Datetime index shared by all the columns.
+        """        
+        periods = self.getPeriodsSlice(startTime, endTime, step)
+
+        def readSeries(missing:list[str])-> np.ndarray:
+            indexes = [self.header[elementType][n] for n in missing]
+            view = self.getElementResultsView(elementType)[periods] #still a view, nothing is read
+            values = np.empty((view.shape[0], len(missing)))
+            chunk = getChunkPeriods(4*len(missing))
+            for t in range(0, view.shape[0], chunk):
+                values[t:t + chunk] = view[t:t + chunk, indexes, attribute.value]
+            return values
+
+        key = (elementType, attribute.value, periods.start, periods.stop, periods.step)
+        values = self.getCachedSeries(key, names, readSeries)
+
+        return values, self.timeIndex[periods]
+
+    def getTimeSeries(self, elementType:str, names:list[str], attribute:'Enum', startTime:'datetime'=None, endTime:'datetime'=None, 
+                      step:'timedelta'=None)-> pd.DataFrame:
+        """
+            Gets the series of one attribute for many elements of the same type using their name as key. See getSeriesArray.
+        Args:
+            elementType (str): STW_C.OUT_SUBCATCHMENTS, STW_C.OUT_NODES or STW_C.OUT_LINKS
+            names (list[str]): names of the elements
+            attribute (Enum): attribute to read from swmm.toolkit.shared_enum (i.e., SubcatchAttribute, NodeAttribute or LinkAttribute)
+            startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+        Raises:
+            KeyError: if one of the names is not an element of the type in the .out
+        Returns:
+            pd.DataFrame: time as index and columns are the names of the elements, without duplicates
+        """        
+        uniqueNames = list(dict.fromkeys(names)) #removes duplicates keeping the order
+        values, timeIndex = self.getSeriesArray(elementType, uniqueNames, attribute, startTime, endTime, step)
+
+        return pd.DataFrame(values, index=timeIndex, columns=uniqueNames)
+
+    def getNodeTimeSeries(self, nodes:list[str], attribute:NodeAttribute=NodeAttribute.TOTAL_INFLOW, startTime:'datetime'=None, 
+                          endTime:'datetime'=None, step:'timedelta'=None)-> pd.DataFrame:
+        """
+            Gets a time series of a list of nodes (e.g., measurement points or look points) directly, without going through their adjacent pipes.
+        Args:
+            nodes (list[str]): names of the nodes for which to obtain the results
+            attribute (NodeAttribute, optional): NodeAttribute.TOTAL_INFLOW, NodeAttribute.LATERAL_INFLOW or NodeAttribute.INVERT_DEPTH.
+                                                 Defaults to NodeAttribute.TOTAL_INFLOW.
+            startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+        Returns:
+            pd.DataFrame: time as index and columns are the names of the nodes
+        """        
+        return self.getTimeSeries(STW_C.OUT_NODES, nodes, attribute, startTime, endTime, step)
+
+    def getRunoffTimeSeries(self, subcatchments:list[str], startTime:'datetime'=None, endTime:'datetime'=None, 
+                            step:'timedelta'=None)-> pd.DataFrame:
+        """
+            Gets the runoff time series of a list of subcatchments.
+        Args:
+            subcatchments (list[str]): names of the subcatchments for which to obtain the runoff
+            startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+        Returns:
+            pd.DataFrame: time as index and columns are the names of the subcatchments
+        """        
+        return self.getTimeSeries(STW_C.OUT_SUBCATCHMENTS, subcatchments, SubcatchAttribute.RUNOFF_RATE, startTime, endTime, step)
+
+    def getFlowTimeSeries(self, pipes:list[str], startTime:'datetime'=None, endTime:'datetime'=None, step:'timedelta'=None)-> pd.DataFrame:
+        """
+            Gets the flow time series of a list of pipes using their name as key. Only the periods within the time window and step are read.
+            If STW_C.USE_RESULTS_CACHE the columns are sliced from the cache on disk, otherwise they are read in bulk from the .out.
+        Args:
+            pipes (list[str]): names of the pipes for which to obtain the flow results
+            startTime (datetime, optional): first time to read (inclusive). Defaults to None (first period).
+            endTime (datetime, optional): last time to read (exclusive). Defaults to None (last period included).
+            step (timedelta, optional): time between the periods read, a multiple of the report step. Defaults to None (every period).
+        Returns:
+            pd.DataFrame: time as index and columns are the names of the pipes 
+        """        
+        uniquePipes = list(dict.fromkeys(pipes)) #removes duplicates keeping the order
+
+        if STW_C.USE_RESULTS_CACHE:
+            periods = self.getPeriodsSlice(startTime, endTime, step)
+            flowsCache = self.getLinkFlowsCache()
+            linkIndex = self.header[STW_C.OUT_LINKS]
+
+            key = (STW_C.OUT_LINKS, LinkAttribute.FLOW_RATE.value, periods.start, periods.stop, periods.step)
+            flows = self.getCachedSeries(key, uniquePipes, lambda missing: flowsCache[periods, [linkIndex[p] for p in missing]].astype(np.float64))
+            timeIndex = self.timeIndex[periods]
+        else:
+            return self.getTimeSeries(STW_C.OUT_LINKS, uniquePipes, LinkAttribute.FLOW_RATE, startTime, endTime, step)
+
+        return pd.DataFrame(flows, index=timeIndex, columns=uniquePipes)
+
+    def getLinkFlowStatistics(self)-> pd.DataFrame:
+        """
+            Returns the table of flow statistics of all the links, computed in one pass over the link flow block and kept in memory.
+            If STW_C.USE_RESULTS_CACHE, the table is also stored with the cache of the .out and only computed again when the .out changes.
+        Returns:
+            pd.DataFrame: index is the link name and columns are the mean, min, max, volume and the mean flow of each hour of the day.
+        """        
+        if self.flowStats is None:
+            if STW_C.USE_RESULTS_CACHE:
+                flows = self.getLinkFlowsCache() #(re)builds the cache folder before looking for the statistics
+                statsFile = os.path.join(getResultsCachePath(self.fileOut, self.cacheDir), STW_C.CACHE_STATS_FILE)
+                
+                if os.path.exists(statsFile):
+                    stats = np.load(statsFile)
+                else:
+                    stats = computeFlowStatistics(flows, self.timeIndex)
+                    #written in a temporary file and then moved, so an interrupted write is never loaded
+                    tmpFile = f"{statsFile}.{os.getpid()}.tmp"
+                    with open(tmpFile, 'wb') as f:
+                        np.save(f, stats)
+                    os.replace(tmpFile, statsFile)
+            else:
+                flows = self.getElementResultsView(STW_C.OUT_LINKS)[:, :, LinkAttribute.FLOW_RATE.value]
+                stats = computeFlowStatistics(flows, self.timeIndex)
+
+            names = pd.Index(list(self.header[STW_C.OUT_LINKS]), name=SWWM_C.NAME)
+            self.flowStats = pd.DataFrame(stats, index=names, columns=getStatisticsColumns())
+
+        return self.flowStats
+
+    def getLinkRankingFromDB(self)-> pd.DataFrame:
+        """
+            Returns the ranking of the links from the maximum flows of the PCSWMM database, without reading the results of the .out.
+            The database is not used if it is older than the .out or if it does not have all the links of the .out.
+        Returns:
+            pd.DataFrame: index is the link name and columns are the flow to rank the link and whether it has flow. None if the database can not be used.
+        """        
+        if os.path.getmtime(self.dbFile) < os.path.getmtime(self.fileOut):
+            print("The database", self.dbFile, "is older than the .out, the .out is used to rank the links")
+            return None
+
+        maxFlows = readResultsTableFromDB(self.dbFile, STW_C.DB_LINK_TABLES, [STW_C.DB_MAX_FLOW])[STW_C.DB_MAX_FLOW]
+        missing = set(self.header[STW_C.OUT_LINKS]).difference(maxFlows.index)
+        if missing:
+            print("The database", self.dbFile, "does not have", len(missing), "links of the .out, the .out is used to rank the links")
+            return None
+
+        return pd.DataFrame({STW_C.RANK_FLOW: maxFlows, STW_C.HAS_FLOW: maxFlows != 0})
+
+    def getLinkRanking(self)-> pd.DataFrame:
+        """
+            Returns the flow used to rank the links when selecting the trunk, the main path of the branches and the relevant branches.
+            If STW_C.USE_RESULTS_DB and there is a PCSWMM database, it is the maximum flow of its tables (answered with SQL, the .out is not read). 
+            Otherwise, it is the mean flow of the flow statistics of the .out.
+        Returns:
+            pd.DataFrame: index is the link name and columns are the flow to rank the link and whether it has flow (values that are not all zero).
+        """        
+        if self.linkRanking is None:
+            if STW_C.USE_RESULTS_DB and self.dbFile is not None:
+                self.linkRanking = self.getLinkRankingFromDB()
+
+            if self.linkRanking is None:
+                flowStats = self.getLinkFlowStatistics()
+                self.linkRanking = pd.DataFrame({STW_C.RANK_FLOW: flowStats[STW_C.STAT_MEAN], 
+                                                 STW_C.HAS_FLOW: (flowStats[[STW_C.STAT_MIN, STW_C.STAT_MAX]] != 0).any(axis=1)})
+
+        return self.linkRanking
+
+    def getLinkRankingArrays(self, linkNames:np.ndarray)-> tuple[np.ndarray,np.ndarray]:
+        """
+            Returns the ranking of the links (see getLinkRanking) as arrays aligned with the link ids of a network. The arrays of the last 
+            links given are kept, so the paths of the same network share them.
+        Args:
+            linkNames (np.ndarray): name of each link id (e.g., the linkNames of a networkTopology.Network)
+        Returns:
+            tuple[np.ndarray,np.ndarray]: flow to rank each link (NaN if it is not in the results) and whether it has flow.
+        """        
+        if self.rankingArrays is None or self.rankingArrays[0] is not linkNames:
+            linkRanking = self.getLinkRanking().reindex(linkNames)
+            self.rankingArrays = (linkNames, linkRanking[STW_C.RANK_FLOW].to_numpy(dtype=float), 
+                                  linkRanking[STW_C.HAS_FLOW].to_numpy(dtype=bool, na_value=False))
+
+        return self.rankingArrays[1:]
+
+    def getGroupsHourlyFlows(self, groups:dict[str,list[str]], startTime:'datetime'=None)-> pd.DataFrame:
+        """
+            Walks the link flows of the .out once, in chunks of periods (see getChunkPeriods), keeping for each group of links the running sums 
+            and counts of its total flow by hour of the day. The memory used does not depend on the length of the simulation.
+        Args:
+            groups (dict[str,list[str]]): names of the links of each group, with the name of the group as key. A group can be a single link.
+            startTime (datetime, optional): first time to use (inclusive). Defaults to None (the end of the stabilisation period, see getDryWeatherStart).
+        Raises:
+            KeyError: if a link is not in the .out
+            ValueError: if there are hours of the day without values after startTime
+        Returns:
+            pd.DataFrame: index is the name of the group and columns are the mean flow and the mean flow of each hour of the day.
+        """    
+        if not groups:
+            return pd.DataFrame(columns=[STW_C.STAT_MEAN] + getHourColumns())
+
+        if startTime is None:
+            startTime = self.getDryWeatherStart()
+
+        #Each column of the membership matrix adds the links of one group
+        links = list(dict.fromkeys(chain.from_iterable(groups.values())))
+        columnOfLink = {link: i for i, link in enumerate(links)}
+        membership = np.zeros((len(links), len(groups)))
+        for j, members in enumerate(groups.values()):
+            for link in members:
+                membership[columnOfLink[link], j] += 1
+
+        periods = self.getPeriodsSlice(startTime)
+        linkView = self.getElementResultsView(STW_C.OUT_LINKS)[periods]
+        indexes = [self.header[STW_C.OUT_LINKS][link] for link in links]
+
+        #Hour of each period from the second of the day of the first period and the step, without building the time index
+        firstTime = self.timeIndex[periods.start] if linkView.shape[0] else pd.Timestamp(startTime)
+        firstSecond = firstTime.hour*3600 + firstTime.minute*60 + firstTime.second
+        stepSeconds = self.header[STW_C.OUT_REPORT_STEP] * periods.step
+
+        hourSums = np.zeros((24, len(groups)))
+        hourCounts = np.zeros(24)
+        chunk = getChunkPeriods(4*len(links) + 8*len(groups))
+        for t in range(0, linkView.shape[0], chunk):
+            groupFlows = linkView[t:t + chunk, indexes, LinkAttribute.FLOW_RATE.value] @ membership
+            hours = ((firstSecond + np.arange(t, t + groupFlows.shape[0]) * stepSeconds) // 3600) % 24
+
+            np.add.at(hourSums, hours, groupFlows)
+            hourCounts += np.bincount(hours, minlength=24)
+
+        if (hourCounts == 0).any():
+            raise ValueError(f"There are not values for all the hours of the day after {startTime} in '{self.fileOut}'.")
+
+        hourlyFlows = pd.DataFrame(hourSums.T / hourCounts, index=list(groups), columns=getHourColumns())
+        hourlyFlows.insert(0, STW_C.STAT_MEAN, hourSums.sum(axis=0) / hourCounts.sum())
 
-    return tsDF
-        
\ No newline at end of file
+        return hourlyFlows
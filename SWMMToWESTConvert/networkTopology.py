@@ -0,0 +1,451 @@
+import numpy as np
+import pandas as pd
+
+import SWMMToWESTConvert.SWMM_InpConstants as SWWM_C
+import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
+
+
+def getLinksColumn(links:pd.DataFrame, column:str)-> np.ndarray:
+    """
+        Returns a numeric attribute of the links as an array aligned with the rows of the links table.
+    Args:
+        links (pd.DataFrame): links of the network and their attributes
+        column (str): name of the column in the links table
+    Returns:
+        np.ndarray: value of each link, NaN if the column is missing
+    """
+    if column not in links:
+        return np.full(len(links), np.nan)
+    return links[column].to_numpy(dtype=float)
+
+def getPreferenceOrder(maxQ:np.ndarray, geom1:np.ndarray)-> np.ndarray:
+    """
+        Returns the positions of the links ordered by largest full Q and then largest Geom 1 (Diameter if it is circular pipe),
+        the order used to choose between the links leaving a node. Missing values go last and ties keep the order of the links.
+    Args:
+        maxQ (np.ndarray): full Q of each link
+        geom1 (np.ndarray): Geom 1 of each link
+    Returns:
+        np.ndarray: positions of the links in the order of preference
+    """
+    #np.lexsort is stable and uses the last key as the primary one
+    return np.lexsort((-np.nan_to_num(geom1), np.isnan(geom1), -np.nan_to_num(maxQ), np.isnan(maxQ)))
+
+def buildAdjacency(linkNodes:np.ndarray, linkOrder:np.ndarray, nNodes:int)-> tuple[np.ndarray,np.ndarray]:
+    """
+        Builds a CSR adjacency: the links of node n are adjacentLinks[offsets[n]:offsets[n+1]], in the order given by linkOrder.
+    Args:
+        linkNodes (np.ndarray): node id of each link (i.e., its inlet node for the outgoing links or its outlet node for the incoming ones)
+        linkOrder (np.ndarray): link ids in the order they should have within each node
+        nNodes (int): number of nodes
+    Returns:
+        tuple[np.ndarray,np.ndarray]: offsets of each node (nNodes + 1 values). Link ids grouped by node.
+    """
+    adjacentLinks = linkOrder[np.argsort(linkNodes[linkOrder], kind='stable')]
+    offsets = np.zeros(nNodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(linkNodes, minlength=nNodes), out=offsets[1:])
+
+    return offsets, adjacentLinks
+
+def gatherAdjacency(offsets:np.ndarray, adjacentLinks:np.ndarray, nodes:np.ndarray)-> np.ndarray:
+    """
+        Returns the links of several nodes of a CSR adjacency at once, without a Python loop over the nodes.
+    Args:
+        offsets (np.ndarray): offsets of each node (see buildAdjacency)
+        adjacentLinks (np.ndarray): link ids grouped by node
+        nodes (np.ndarray): ids of the nodes
+    Returns:
+        np.ndarray: ids of the links of the nodes, grouped by node
+    """
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    groupStarts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+    return adjacentLinks[groupStarts + np.arange(counts.sum())]
+
+def getStronglyConnectedComponents(outOffsets:np.ndarray, outLinks:np.ndarray, linkOutNode:np.ndarray)-> np.ndarray:
+    """
+        Finds the strongly connected components of the network (iterative Tarjan's algorithm, linear in nodes and links). Nodes in the same
+        loop share a component and a node out of any loop is a component by itself. The components are numbered in topological order, so 
+        a link always goes from a component to itself or to one with a larger number.
+    Args:
+        outOffsets (np.ndarray): offsets of the outgoing links of each node (see buildAdjacency)
+        outLinks (np.ndarray): outgoing link ids grouped by node
+        linkOutNode (np.ndarray): outlet node id of each link
+    Returns:
+        np.ndarray: component of each node
+    """
+    nNodes = len(outOffsets) - 1
+    offsets = outOffsets.tolist()
+    successors = linkOutNode[outLinks].tolist()
+
+    order = [-1] * nNodes #discovery order of the nodes
+    low = [0] * nNodes #lowest discovery order reachable from the node without leaving the stack
+    onStack = [False] * nNodes
+    components = np.full(nNodes, -1, dtype=np.int64)
+    stack = []
+    nVisited = 0
+    nComponents = 0
+
+    for root in range(nNodes):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = nVisited
+        nVisited += 1
+        stack.append(root)
+        onStack[root] = True
+        pending = [(root, offsets[root])] #node and position of the next link to follow
+
+        while pending:
+            node, i = pending[-1]
+            if i < offsets[node + 1]:
+                pending[-1] = (node, i + 1)
+                nextNode = successors[i]
+                if order[nextNode] < 0:
+                    order[nextNode] = low[nextNode] = nVisited
+                    nVisited += 1
+                    stack.append(nextNode)
+                    onStack[nextNode] = True
+                    pending.append((nextNode, offsets[nextNode]))
+                elif onStack[nextNode]:
+                    low[node] = min(low[node], order[nextNode])
+                continue
+
+            pending.pop()
+            if pending:
+                parent = pending[-1][0]
+                low[parent] = min(low[parent], low[node])
+
+            if low[node] == order[node]: #the node is the root of a component, its members are on top of the stack
+                while True:
+                    member = stack.pop()
+                    onStack[member] = False
+                    components[member] = nComponents
+                    if member == node:
+                        break
+                nComponents += 1
+
+    #Tarjan's algorithm closes the downstream components first
+    return nComponents - 1 - components
+
+
+class NetworkTopology:
+    """
+        Connectivity of the links of the network built once from the links table. Nodes and links have integer ids (their position in
+        nodeNames and linkNames) and the links leaving or arriving at a node are read from CSR arrays, so each step of a traversal costs O(degree).
+        The outgoing links of a node are sorted by preference (see getPreferenceOrder) and the incoming ones keep the order of the links table.
+        The loops of the network are found once as strongly connected components (see getStronglyConnectedComponents).
+    """
+    __slots__ = ('links', 'linkNames', 'linkIds', 'nodeNames', 'nodeIds', 'linkInNode', 'linkOutNode',
+                 'outOffsets', 'outLinks', 'inOffsets', 'inLinks', 'components')
+
+    def __init__(self, links:pd.DataFrame, linkOrder:np.ndarray=None):
+        """
+        Args:
+            links (pd.DataFrame): links of the network with the name as index and the inlet and outlet nodes, MaxQ and Geom1 as columns
+            linkOrder (np.ndarray, optional): positions of the links in the order of preference. Defaults to None (getPreferenceOrder 
+                                              of the MaxQ and Geom1 columns).
+        """
+        if linkOrder is None:
+            linkOrder = getPreferenceOrder(getLinksColumn(links, SWWM_C.MAX_Q), getLinksColumn(links, SWWM_C.DIAM))
+
+        self.links = links
+        self.linkNames = links.index.to_numpy(dtype=object)
+        self.linkIds = {name: i for i, name in enumerate(self.linkNames)}
+
+        nodeCodes, nodeNames = pd.factorize(np.concatenate([links[SWWM_C.IN_NODE].to_numpy(dtype=object),
+                                                            links[SWWM_C.OUT_NODE].to_numpy(dtype=object)]))
+        self.nodeNames = np.asarray(nodeNames, dtype=object)
+        self.nodeIds = {name: i for i, name in enumerate(self.nodeNames)}
+        self.linkInNode = nodeCodes[:len(links)]
+        self.linkOutNode = nodeCodes[len(links):]
+
+        self.outOffsets, self.outLinks = buildAdjacency(self.linkInNode, linkOrder, len(self.nodeNames))
+        self.inOffsets, self.inLinks = buildAdjacency(self.linkOutNode, np.arange(len(links)), len(self.nodeNames))
+        self.components = getStronglyConnectedComponents(self.outOffsets, self.outLinks, self.linkOutNode)
+
+    def getLinksOut(self, node:int)-> np.ndarray:
+        """
+            Returns the links leaving a node, the preferred one first.
+        Args:
+            node (int): id of the node
+        Returns:
+            np.ndarray: ids of the links with the node as inlet
+        """
+        return self.outLinks[self.outOffsets[node]:self.outOffsets[node + 1]]
+
+    def getLinksIn(self, node:int)-> np.ndarray:
+        """
+            Returns the links discharging into a node, in the order of the links table.
+        Args:
+            node (int): id of the node
+        Returns:
+            np.ndarray: ids of the links with the node as outlet
+        """
+        return self.inLinks[self.inOffsets[node]:self.inOffsets[node + 1]]
+
+    def getNodeId(self, name:str)-> int:
+        """
+            Returns the id of a node, or -1 if no link is connected to it.
+        Args:
+            name (str): name of the node
+        Returns:
+            int: id of the node
+        """
+        return self.nodeIds.get(name, -1)
+
+    def getLinksNames(self, linkIds:list[int])-> list[str]:
+        """
+            Converts link ids into their names.
+        Args:
+            linkIds (list[int]): ids of the links
+        Returns:
+            list[str]: names of the links in the same order
+        """
+        return self.linkNames[np.asarray(linkIds, dtype=np.int64)].tolist()
+
+    def getLinksOutOfNodes(self, nodes:np.ndarray)-> np.ndarray:
+        """
+            Returns the links leaving any of the nodes given.
+        Args:
+            nodes (np.ndarray): ids of the nodes
+        Returns:
+            np.ndarray: ids of the links with one of the nodes as inlet, grouped by node
+        """
+        return gatherAdjacency(self.outOffsets, self.outLinks, nodes)
+
+    def getLinksIntoNodes(self, nodes:np.ndarray)-> np.ndarray:
+        """
+            Returns the links discharging into any of the nodes given.
+        Args:
+            nodes (np.ndarray): ids of the nodes
+        Returns:
+            np.ndarray: ids of the links with one of the nodes as outlet, grouped by node
+        """
+        return gatherAdjacency(self.inOffsets, self.inLinks, nodes)
+
+
+class Network(NetworkTopology):
+    """
+        Links of the network as columnar arrays aligned with the link ids, on top of their connectivity (see NetworkTopology).
+        The attributes used by the conversion are read from the arrays and the links table stays available in links for the 
+        functions working with DataFrames. Attributes missing from the links table are NaN.
+    """
+    __slots__ = ('lengths', 'geom1', 'maxQ', 'roughness', 'slopes', 'shapeCodes', 'shapeNames')
+
+    def __init__(self, links:pd.DataFrame):
+        """
+        Args:
+            links (pd.DataFrame): links of the network with the name as index and the inlet and outlet nodes, Length, Geom1, MaxQ, 
+                                  Roughness, Slope and Shape as columns
+        """
+        self.lengths = getLinksColumn(links, SWWM_C.LEN)
+        self.geom1 = getLinksColumn(links, SWWM_C.DIAM)
+        self.maxQ = getLinksColumn(links, SWWM_C.MAX_Q)
+        self.roughness = getLinksColumn(links, SWWM_C.ROUG)
+        self.slopes = getLinksColumn(links, STW_C.SLOPE)
+
+        shapes = links[SWWM_C.SHAPE] if SWWM_C.SHAPE in links else pd.Series(np.nan, index=links.index)
+        self.shapeCodes, shapeNames = pd.factorize(shapes)
+        self.shapeNames = np.asarray(shapeNames, dtype=object)
+
+        super().__init__(links, getPreferenceOrder(self.maxQ, self.geom1))
+
+    def getLinkIds(self, names:list[str])-> np.ndarray:
+        """
+            Converts link names into their ids.
+        Args:
+            names (list[str]): names of the links
+        Returns:
+            np.ndarray: ids of the links in the same order
+        """
+        return np.fromiter((self.linkIds[name] for name in names), dtype=np.int64, count=len(names))
+
+    def getLinksTable(self, linkIds:np.ndarray)-> pd.DataFrame:
+        """
+            Returns the rows of the links table of some links, e.g., to keep a path as a DataFrame.
+        Args:
+            linkIds (np.ndarray): ids of the links
+        Returns:
+            pd.DataFrame: copy of the links in the same order, index is the link name
+        """
+        return self.links.iloc[np.asarray(linkIds, dtype=np.int64)].copy()
+
+    def getLinksConnectedToPath(self, pathLinks:np.ndarray)-> tuple[np.ndarray,np.ndarray]:
+        """
+            Finds the links that are not in a path and discharge into the outlet node of one of its links.
+        Args:
+            pathLinks (np.ndarray): ids of the links of the path
+        Returns:
+            tuple[np.ndarray,np.ndarray]: ids of the connected links in the order of the links table. Id of the path link ending at the 
+                                          node where each of them discharges.
+        """
+        pathLinkOfNode = np.full(len(self.nodeNames), -1, dtype=np.int64)
+        pathLinkOfNode[self.linkOutNode[pathLinks]] = pathLinks
+
+        notInPath = np.ones(len(self.linkNames), dtype=bool)
+        notInPath[pathLinks] = False
+
+        connected = np.flatnonzero(notInPath & (pathLinkOfNode[self.linkOutNode] >= 0))
+
+        return connected, pathLinkOfNode[self.linkOutNode[connected]]
+
+
+def getNodesUpstream(topology:NetworkTopology, finalNode:int)-> np.ndarray:
+    """
+        Marks the nodes that have a path to the final node, walking the incoming links upstream from it one front of nodes at a time.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+        finalNode (int): id of the node downstream where the paths must finish
+    Returns:
+        np.ndarray: one boolean per node, True if the node drains to the final node (including the final node)
+    """
+    upstream = np.zeros(len(topology.nodeNames), dtype=bool)
+    if finalNode < 0:
+        return upstream
+
+    upstream[finalNode] = True
+    front = np.array([finalNode])
+    while front.size:
+        upstreamNodes = np.unique(topology.linkInNode[topology.getLinksIntoNodes(front)])
+        front = upstreamNodes[~upstream[upstreamNodes]]
+        upstream[front] = True
+
+    return upstream
+
+def getLoops(topology:NetworkTopology)-> list[list[str]]:
+    """
+        Returns the loops of the network, i.e., the strongly connected components with more than one node.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+    Returns:
+        list[list[str]]: names of the nodes of each loop
+    """
+    loopComponents = np.flatnonzero(np.bincount(topology.components) > 1)
+    return [topology.nodeNames[topology.components == component].tolist() for component in loopComponents]
+
+def reportLoops(topology:NetworkTopology):
+    """
+        Prints the loops of the network (see getLoops).
+    Args:
+        topology (NetworkTopology): connectivity of the network
+    """
+    loops = getLoops(topology)
+    print(len(loops), " loops were found in the network")
+    for nodes in loops:
+        print("Loop of ", len(nodes), " nodes: ", ", ".join(nodes))
+
+def condenseTopology(topology:NetworkTopology)-> NetworkTopology:
+    """
+        Builds the condensed network: each strongly connected component becomes a node named by its number and only the links between 
+        different components are kept, so the condensed network has no loops. Components without links to other components are left out.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+    Returns:
+        NetworkTopology: connectivity of the components, its links keep their names and attributes
+    """
+    inComponents = topology.components[topology.linkInNode]
+    outComponents = topology.components[topology.linkOutNode]
+    betweenComponents = inComponents != outComponents
+
+    condensedLinks = topology.links[betweenComponents].copy()
+    condensedLinks[SWWM_C.IN_NODE] = inComponents[betweenComponents]
+    condensedLinks[SWWM_C.OUT_NODE] = outComponents[betweenComponents]
+
+    return NetworkTopology(condensedLinks)
+
+def getTopologicalLevels(topology:NetworkTopology)-> list[np.ndarray]:
+    """
+        Orders the nodes from upstream to downstream (Kahn's algorithm processed one level at a time). All the nodes of a level
+        only receive links from the previous levels. Nodes that are in a loop, or downstream of one, are not in any level (see condenseTopology).
+    Args:
+        topology (NetworkTopology): connectivity of the network
+    Returns:
+        list[np.ndarray]: ids of the nodes of each level, the headwater nodes first
+    """
+    remainingIn = np.bincount(topology.linkOutNode, minlength=len(topology.nodeNames))
+    level = np.flatnonzero(remainingIn == 0)
+    levels = []
+
+    while level.size:
+        levels.append(level)
+        downstreamNodes, nLinks = np.unique(topology.linkOutNode[topology.getLinksOutOfNodes(level)], return_counts=True)
+        remainingIn[downstreamNodes] -= nLinks
+        level = downstreamNodes[remainingIn[downstreamNodes] == 0]
+
+    return levels
+
+def getSplitFractions(topology:NetworkTopology, linkWeights:np.ndarray=None)-> np.ndarray:
+    """
+        Returns the fraction of the flow of its inlet node carried by each link. At diverging nodes the flow is split in proportion
+        to the weights of the outgoing links (MaxQ by default), or evenly if none of them has a positive weight.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+        linkWeights (np.ndarray, optional): weight of each link (e.g., its mean flow). Defaults to the MaxQ of the links.
+    Returns:
+        np.ndarray: fraction of each link, the fractions of the links leaving a node add up to 1
+    """
+    if linkWeights is None:
+        linkWeights = topology.links[SWWM_C.MAX_Q].to_numpy(dtype=float)
+    weights = np.clip(np.nan_to_num(np.asarray(linkWeights, dtype=float)), 0, None)
+
+    nNodes = len(topology.nodeNames)
+    nodeWeights = np.bincount(topology.linkInNode, weights=weights, minlength=nNodes)[topology.linkInNode]
+    nodeLinks = np.bincount(topology.linkInNode, minlength=nNodes)[topology.linkInNode]
+
+    return np.divide(weights, nodeWeights, out=1 / nodeLinks, where=nodeWeights > 0)
+
+def accumulateAcyclic(topology:NetworkTopology, nodeValues:np.ndarray, linkWeights:np.ndarray=None)-> tuple[np.ndarray,np.ndarray]:
+    """
+        Accumulates values added at the nodes from upstream to downstream in one pass over the topological levels, each level being 
+        processed with array operations. Nodes that are not in any level (loops) are left as NaN.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+        nodeValues (np.ndarray): values added at each node with shape (nodes, variables)
+        linkWeights (np.ndarray, optional): weights used to split the values at diverging nodes (see getSplitFractions)
+    Returns:
+        tuple[np.ndarray,np.ndarray]: total upstream value of each node (including its own) and value carried by each link
+    """
+    nodeValues = np.asarray(nodeValues, dtype=float)
+    fractions = getSplitFractions(topology, linkWeights)
+
+    inflows = np.zeros_like(nodeValues)
+    nodeTotals = np.full_like(nodeValues, np.nan)
+    linkTotals = np.full((len(topology.linkNames),) + nodeValues.shape[1:], np.nan)
+
+    for level in getTopologicalLevels(topology):
+        nodeTotals[level] = nodeValues[level] + inflows[level]
+        links = topology.getLinksOutOfNodes(level)
+        linkTotals[links] = nodeTotals[topology.linkInNode[links]] * fractions[links].reshape((-1,) + (1,) * (nodeValues.ndim - 1))
+        np.add.at(inflows, topology.linkOutNode[links], linkTotals[links])
+
+    return nodeTotals, linkTotals
+
+def accumulateUpstream(topology:NetworkTopology, nodeValues:np.ndarray, linkWeights:np.ndarray=None)-> tuple[np.ndarray,np.ndarray]:
+    """
+        Accumulates values added at the nodes (e.g., area, dry weather flow) from upstream to downstream over the condensed network,
+        so loops are handled: all the nodes of a loop, and the links inside it, get the total of the loop.
+    Args:
+        topology (NetworkTopology): connectivity of the network
+        nodeValues (np.ndarray): values added at each node with shape (nodes, variables)
+        linkWeights (np.ndarray, optional): weights used to split the values at diverging nodes (see getSplitFractions)
+    Returns:
+        tuple[np.ndarray,np.ndarray]: total upstream value of each node (including its own) and value carried by each link
+    """
+    nodeValues = np.asarray(nodeValues, dtype=float)
+    condensed = condenseTopology(topology)
+    betweenComponents = topology.components[topology.linkInNode] != topology.components[topology.linkOutNode]
+    if linkWeights is not None:
+        linkWeights = np.asarray(linkWeights, dtype=float)[betweenComponents]
+
+    componentTotals = np.zeros((topology.components.max(initial=-1) + 1,) + nodeValues.shape[1:])
+    np.add.at(componentTotals, topology.components, nodeValues)
+
+    condensedComponents = condensed.nodeNames.astype(np.int64)
+    condensedTotals, condensedLinkTotals = accumulateAcyclic(condensed, componentTotals[condensedComponents], linkWeights)
+    componentTotals[condensedComponents] = condensedTotals
+
+    linkTotals = componentTotals[topology.components[topology.linkInNode]]
+    linkTotals[betweenComponents] = condensedLinkTotals
+
+    return componentTotals[topology.components], linkTotals
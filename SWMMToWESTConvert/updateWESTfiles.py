@@ -469,7 +469,7 @@ def connectBranchToCombiner(linksXML:ET.Element, lastBranchEle:str, iLink:int, X
     return linksXML, iLink, iComb, combName
 
 def createPathLinks(linksXML:ET.Element, namesDict:dict[str], catchments:list[dict], sewerSections:list[dict], iLink:int, 
-                    iCatch:int, iComb:int, branches:dict[str])->tuple[ET.Element,str,int,int,int]:
+                    iCatch:int, iComb:int, branches:dict[str,list[str]])->tuple[ET.Element,str,int,int,int]:
     """
         Creates all the links of a path. Loops the sewer sections adding links between the tanks composing them and 
         links the catchments with the same name of the sewer section before or after the tank according to its position property.
@@ -482,7 +482,8 @@ def createPathLinks(linksXML:ET.Element, namesDict:dict[str], catchments:list[di
         linki (int): Index of the next link to be created for the model. 
         iCatch (int): Index of the next catchment to be created for the model.
         iComb (int): Index of the next combiner to be created for the model.
-        branches (dict[str]): The relationship between the name of the branch and the name of the combiner at the end of it.
+        branches (dict[str,list[str]]): Names of the combiners at the end of the branches joining the path, with the name of the pipe of the path 
+                                        where they discharge as key. None if no branch joins the path.
     Returns:
         tuple[ET.Element,str,int,int,int]: Updated links element of the WEST's '.Layout.xml' file. Last element connected in the path. 
                                       Indexes of the next link, catchment and combiner.
@@ -490,12 +491,8 @@ def createPathLinks(linksXML:ET.Element, namesDict:dict[str], catchments:list[di
     #TODO check if the links exist already
     endConnection, catchiName, catchModelNames, iCatch, iComb = getNextCatchment(namesDict, catchments, iCatch, iComb)
 
-    #If its the trunk then gets the first branch
-    if branches is not None:
-        branchesR = dict(reversed(branches.items()))
-        branch = branchesR.popitem()
-    else:
-        branch = None
+    if branches is None:
+        branches = {}
 
     linkiIni = iLink
     lastElement = None
@@ -522,10 +519,9 @@ def createPathLinks(linksXML:ET.Element, namesDict:dict[str], catchments:list[di
         if (catchiName == sewerCatchiName)  and endConnection:
             linksXML, iLink, lastElement, endConnection, catchiName, catchModelNames, iCatch, iComb = connectCurrentCatchment(namesDict, catchments, linksXML, iLink, lastElement, catchModelNames, iCatch, iComb)
 
-        #Joins the branch
-        if (branch is not None) and (branch[0] == branchName):
-            linksXML, iLink, lastElement = addLink(linksXML, iLink, lastElement, branch[1], W_C.XML_INFLOW_SUFFIX2)
-            branch = branchesR.popitem() if len(branchesR) > 0 else None
+        #Joins the branches discharging at the end of the section
+        for combName in branches.get(branchName, []):
+            linksXML, iLink, lastElement = addLink(linksXML, iLink, lastElement, combName, W_C.XML_INFLOW_SUFFIX2)
 
     print("The number of created links was ", iLink-linkiIni)
 
@@ -644,9 +640,11 @@ def updateWESTLayoutFile(layoutXMLPath:str, layoutXMLPath_MOD:str, modelClasses:
         layoutXMLPath_MOD (str): Path to where the modified layout file will be saved.
         modelClasses (dict[str]): Classes to be set to each type of model. Using Constants as keys e.g. STW_C.SEWER_CLASS, STW_C.CATCH_CLASS.
         trunkModels (dict[list[dict]]): Two lists reprenting the trunk of the network. One list has all sewer sections (as dictionaries) and the other all catchments. 
-        branchesModels (dict[dict[list[dict]]]): The keys are the name of the pipe that connects the branch and the trunk, the values are the attributes of the elements
-                                           in the branch. Each branch dictionary has two elements one list of sewers, one list of the catchments (CONSTANTS as keys).
-        connAttributes (list): Attributes of the connectors. all connectors have the same properties.
+        branchesModels (dict[dict[list[dict]]]): The keys are the name of the pipe discharging the branch, the values are the attributes of the elements
+                                           in the branch. Each branch dictionary has the pipe of the path where it discharges (STW_C.TRUNK_PIPE_NAME, 
+                                           the key is used if it is missing), one list of sewers, one list of the catchments and, optionally, 
+                                           the dictionary of its sub-branches with the same structure (CONSTANTS as keys).
+        connAttributes (list): Attributes of the connectors of each path, with STW_C.TRUNK and the keys of the branches and sub-branches as keys.
     """        
     iLink, iCatch, iComb = 1, 1, 1
 
@@ -654,20 +652,12 @@ def updateWESTLayoutFile(layoutXMLPath:str, layoutXMLPath_MOD:str, modelClasses:
     root = tree.getroot()  
     linksXML = root.find('.//Links')
 
-    nTanks = branchesModels[list(branchesModels.keys())[-1]][STW_C.PATH][-1][STW_C.TANK_INDEXES][-1] #The last tank of the last branch
-    XMLsByType = getModelsByTypeAndSetClasses(root, modelClasses, len(branchesModels), nTanks)
-    combiners = {}
-    
-    for br in branchesModels.keys():
-
-        # Adds the properties of the elements within the branch
-        branch = branchesModels[br]
-
-        iLink, iCatch, iComb, root, linksXML, lastPathElement = addPathToLayoutFile(connAttributes[br], branch[STW_C.PATH], branch[STW_C.WCATCHMENTS], 
-                                                                                    iLink, iCatch, iComb, root, linksXML, XMLsByType)
-        linksXML, iLink, iComb, combName = connectBranchToCombiner(linksXML, lastPathElement, iLink, XMLsByType[STW_C.COMBINERS], iComb)
+    branchesList = getBranchesList(branchesModels)
+    nTanks = max(pipe[STW_C.TANK_INDEXES][-1] for path in [trunkModels] + branchesList for pipe in path[STW_C.PATH]) #tanks are numbered from 1
+    XMLsByType = getModelsByTypeAndSetClasses(root, modelClasses, len(branchesList), nTanks)
 
-        combiners[br] = combName
+    iLink, iCatch, iComb, root, linksXML, combiners = addBranchesToLayoutFile(branchesModels, connAttributes, iLink, iCatch, iComb, root, 
+                                                                              linksXML, XMLsByType)
         
     # Trunk
     iLink, iCatch, iComb, root, linksXML, lastPathElement = addPathToLayoutFile(connAttributes[STW_C.TRUNK], trunkModels[STW_C.PATH], trunkModels[STW_C.WCATCHMENTS], 
@@ -679,9 +669,60 @@ def updateWESTLayoutFile(layoutXMLPath:str, layoutXMLPath_MOD:str, modelClasses:
     ET.indent(tree, space="\t", level=0)
     tree.write(layoutXMLPath_MOD)
 
+def getBranchesList(branchesModels:dict[dict])->list[dict]:
+    """
+        Lists the models of all the branches, each branch followed by its sub-branches.
+    Args:
+        branchesModels (dict[dict]): Models of the branches (see updateWESTLayoutFile).
+    Returns:
+        list[dict]: Models of the branches and sub-branches.
+    """    
+    branchesList = []
+    for branch in branchesModels.values():
+        branchesList.append(branch)
+        branchesList.extend(getBranchesList(branch.get(STW_C.SUBBRANCHES, {})))
+
+    return branchesList
+
+def addBranchesToLayoutFile(branchesModels:dict[dict], connAttributes:dict[list[dict]], iLink:int, iCatch:int, iComb:int, root:ET.Element, 
+                            linksXML:ET.Element, XMLsByType:dict[str,dict[str,ET.Element]])->tuple[int,int,int,ET.Element,ET.Element,dict[str,list[str]]]:
+    """
+        Adds the branches to the layout and connects the end of each one to a combiner. The sub-branches of a branch are added before it, 
+        so their combiners are joined to the branch where they discharge.
+    Args:
+        branchesModels (dict[dict]): Models of the branches (see updateWESTLayoutFile).
+        connAttributes (dict[list[dict]]): Attributes of the connectors of each branch, with the keys of the branches as keys.
+        iLink (int): Index of the next link to create.
+        iCatch (int): Index of the next catchment to update.
+        iComb (int): Index of the next combiner to update
+        root (ET.Element): Root element of the layout XML file of the WEST model.
+        linksXML (ET.Element): Links element of the WEST's '.Layout.xml' file.
+        XMLsByType (dict[str,dict[str,ET.Element]]): The XMLs of the elements by type (see addPathToLayoutFile).
+    Returns:
+        tuple[int,int,int,ET.Element,ET.Element,dict[str,list[str]]]: Indexes of the next link, catchment, and combiner updated. 
+                                    Updated root and links element of the layout XML file of the WEST model.
+                                    Names of the combiners at the end of the branches, with the pipe where they discharge as key.
+    """    
+    combiners = {}
+
+    for br, branch in branchesModels.items():
+        subCombiners = None
+        if STW_C.SUBBRANCHES in branch:
+            iLink, iCatch, iComb, root, linksXML, subCombiners = addBranchesToLayoutFile(branch[STW_C.SUBBRANCHES], connAttributes, iLink, iCatch, 
+                                                                                         iComb, root, linksXML, XMLsByType)
+
+        # Adds the properties of the elements within the branch
+        iLink, iCatch, iComb, root, linksXML, lastPathElement = addPathToLayoutFile(connAttributes[br], branch[STW_C.PATH], branch[STW_C.WCATCHMENTS], 
+                                                                                    iLink, iCatch, iComb, root, linksXML, XMLsByType, subCombiners)
+        linksXML, iLink, iComb, combName = connectBranchToCombiner(linksXML, lastPathElement, iLink, XMLsByType[STW_C.COMBINERS], iComb)
+
+        combiners.setdefault(branch.get(STW_C.TRUNK_PIPE_NAME, br), []).append(combName)
+
+    return iLink, iCatch, iComb, root, linksXML, combiners
+
 def addPathToLayoutFile(connectors:list[dict], sewerSect:list[dict], catchments:list[dict], iLink:int, iCatch:int, iComb:int,
                          root:ET.Element, linksXML:ET.Element, XMLsByType:dict[str,dict[str,ET.Element]], 
-                         branches:dict[str,str]=None)->tuple[int,int,int,ET.Element,ET.Element,str]:
+                         branches:dict[str,list[str]]=None)->tuple[int,int,int,ET.Element,ET.Element,str]:
     """
         Creates or updates the properties of the elements on the path and create the links between all its elements.
     Args:
@@ -695,7 +736,8 @@ def addPathToLayoutFile(connectors:list[dict], sewerSect:list[dict], catchments:
         linksXML (ET.Element): Links element of the WEST's '.Layout.xml' file.
         XMLsByType (dict[str,dict[str,ET.Element]]): The XMLs of the elements by type. Key is the type of element e.g. STW_C.SEWERS. Then, keys are the
                                          index of element by type i.e., from 1 to the number of sewers in the Layout.xml file.
-        branches (dict[str,str], optional): The relationship between the name of the branch and the name of the combiner at the end of it. Defaults to None.
+        branches (dict[str,list[str]], optional): Names of the combiners at the end of the branches joining the path, with the pipe of the path 
+                                                  where they discharge as key. Defaults to None.
     Returns:
         tuple[int,int,int,ET.Element,ET.Element,str]: Indexes of the next link, catchment, and combiner updated. 
                                                     Updated root and links element of the layout XML file of the WEST model.
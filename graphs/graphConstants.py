@@ -10,6 +10,8 @@ PASCAL = "Pascal"
 DATE_LBL = 'Date'
 LONGDATE_LBL = "LongDate"
 
+CSV_CHUNK_ROWS = 100000 #Rows read at once from the csv files of results
+
 
 #Colors---------------
 PASCAL_C="#FFFF66"
@@ -45,33 +45,46 @@ def processMeassuredData(filePath:str, colsInLps:list[str], colsInm3h:list[str])
 
     return dfFlowsm3h
 
-def processSWMMOutFlowData(filePath:str, startDate:'Timestamp', endDate:'Timestamp', renameDict:dict[str,str]=None)->pd.DataFrame:
+def processSWMMOutFlowData(filePath:str, startDate:'Timestamp', endDate:'Timestamp', renameDict:dict[str,str]=None, 
+                           step:'Timedelta'=None)->pd.DataFrame:
     """
         Converts a csv file with flow values from SWMM into a dataframe with values within the evaluation time period. 
+        The file is read in chunks of GC.CSV_CHUNK_ROWS rows and only the rows in the period are kept, so the complete file is never in memory.
     Args:
-        filePath (str): Path to the file with the timeseries of flow values in m3/s (CMS) from SWMM.
+        filePath (str): Path to the file with the timeseries of flow values in m3/s (CMS) from SWMM, ordered by time.
         startDate (Timestamp): Start date of the evaluation period (inclusive). 
         endDate (Timestamp): End date of the evaluation period (exclusive).
         renameDict (dict[str,str], optional): Names of the columns as keys and the new column names as values. Defaults to None.
+        step (Timedelta, optional): Time between the values kept, starting at startDate. Defaults to None (all the values).
     Returns:
         pd.DataFrame: Clean dataframe with values in m3/h.
     """    
-    flowModelVals = pd.read_csv(filePath, delimiter = ',')
-    flowModelVals.columns = flowModelVals.columns.str.replace(' ', '') #Remove white spaces from columns names
-    
-    #Creates the datetime values to be the index----------------------
-    try:
-        flowModelVals[GC.LONGDATE_LBL] = flowModelVals[PSC.DATE_LBL] + " " + flowModelVals[PSC.TIME_LBL] #concat date and time columns
-    except KeyError as e:
-        raise  KeyError("The columns '" + PSC.DATE_LBL + "' and '" + PSC.TIME_LBL + "' do not exist in the CSV file. Please check the column names as these are used as index.") from e
-    
-    flowModelVals.drop(columns=[PSC.DATE_LBL, PSC.TIME_LBL],inplace=True) #removes redundant columns
-    flowModelVals[GC.LONGDATE_LBL]= pd.to_datetime(flowModelVals[GC.LONGDATE_LBL],format='%m/%d/%Y %H:%M:%S') # formats date
-    flowModelVals.set_index(GC.LONGDATE_LBL,inplace=True)
-    #-------------------------------------------------------------------
+    chunksInPeriod = []
+
+    for chunk in pd.read_csv(filePath, delimiter = ',', chunksize=GC.CSV_CHUNK_ROWS):
+        chunk.columns = chunk.columns.str.replace(' ', '') #Remove white spaces from columns names
+        
+        #Creates the datetime values to be the index----------------------
+        try:
+            chunk[GC.LONGDATE_LBL] = chunk[PSC.DATE_LBL] + " " + chunk[PSC.TIME_LBL] #concat date and time columns
+        except KeyError as e:
+            raise  KeyError("The columns '" + PSC.DATE_LBL + "' and '" + PSC.TIME_LBL + "' do not exist in the CSV file. Please check the column names as these are used as index.") from e
+        
+        chunk.drop(columns=[PSC.DATE_LBL, PSC.TIME_LBL],inplace=True) #removes redundant columns
+        chunk[GC.LONGDATE_LBL]= pd.to_datetime(chunk[GC.LONGDATE_LBL],format='%m/%d/%Y %H:%M:%S') # formats date
+        chunk.set_index(GC.LONGDATE_LBL,inplace=True)
+        #-------------------------------------------------------------------
+
+        inPeriod = (chunk.index >= startDate)&(chunk.index < endDate) # Removes values outside the evaluated period
+        if step is not None:
+            inPeriod &= ((chunk.index - startDate) % step) == pd.Timedelta(0)
+        chunksInPeriod.append(chunk[inPeriod])
+
+        if chunk.index[-1] >= endDate: #the rest of the file is after the evaluated period
+            break
 
+    flowModelVals = pd.concat(chunksInPeriod)
     flowModelValsm3h = flowModelVals*3600 # convert values to m3/h
-    flowModelValsm3h = flowModelValsm3h[(flowModelValsm3h.index >= startDate)&(flowModelValsm3h.index < endDate)] # Removes values outside the evaluated period
 
     if renameDict is not None:
         flowModelValsm3h.rename(columns=renameDict,inplace=True)
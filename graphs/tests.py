@@ -33,3 +33,16 @@ def test_sort_columns_by_number(sample_dataframe):
     # Verify that the columns are sorted as expected
     expected_columns = ['1 (In)', '1 (Out)', '4 (In)', '4 (Out)', '16 (Out)', '19 (In)', '19 (Out)']
     assert list(df_sorted.columns) == expected_columns
+
+# Pytest test case for reading only the evaluated period of SWMM results
+def test_processSWMMOutFlowData_period_and_step(tmp_path):
+    times = pd.date_range('2022-06-19', periods=48, freq='h')
+    csv = pd.DataFrame({'Date': times.strftime('%m/%d/%Y'), 'Time': times.strftime('%H:%M:%S'), 'Flow U004': range(48)})
+    filePath = tmp_path / "flows.csv"
+    csv.to_csv(filePath, index=False)
+
+    df = prd.processSWMMOutFlowData(str(filePath), pd.Timestamp('2022-06-19 10:00'), pd.Timestamp('2022-06-20 10:00'), 
+                                    step=pd.Timedelta(hours=6))
+
+    assert df.index.tolist() == list(pd.date_range('2022-06-19 10:00', periods=4, freq='6h'))
+    assert df['FlowU004'].tolist() == [10*3600, 16*3600, 22*3600, 28*3600]
@@ -1,22 +1,50 @@
+import os
+import sys
+import time
+
+import numpy as np
 import pandas as pd
 import pytest
 
 from SWMMToWESTConvert import aggregateNetwork as an
 from SWMMToWESTConvert import getNetworkFromSWMM as gnfs
+from SWMMToWESTConvert import networkTopology as nt
+from SWMMToWESTConvert import SWMMtoWESTConstants as STW_C
+from tests import syntheticNetwork as sn
 
 # Sample data for testing
 # You may need to adjust these sample data according to your actual data structure
 sample_idWRRF = "RA_606859"
 sample_outfile = "tests/DWF2022_TEST.out"
 sample_inpfile = "tests/DWF2022_TEST.inp"
-
-sample_links = gnfs.getsNetworksLinks(sample_inpfile)
 sample_idTrunkIni = "R007637"
 
+@pytest.fixture(scope="module")
+def sample_network():
+    # Read when a test needs it, so the other tests of the file run even if the .inp can not be read
+    return nt.Network(gnfs.getsNetworksLinks(sample_inpfile))
+
+@pytest.fixture(scope="module")
+def sample_results():
+    if not os.path.exists(sample_outfile):
+        pytest.skip(f"{sample_outfile} is not available")
+    with gnfs.SimulationResults(sample_outfile) as results:
+        yield results
+
+@pytest.fixture
+def synthetic_inp(tmp_path, monkeypatch):
+    # The synthetic elements and .out replace the ones read from the .inp and created by SWMM
+    outfile = sn.writeSyntheticOut(str(tmp_path))
+    monkeypatch.setattr(gnfs, 'getNetwork', lambda networkInp, idWRRF=None: (gnfs.pruneNetworkToNode(sn.getSyntheticElements(), idWRRF), outfile))
+    return str(tmp_path / 'synthetic.inp')
 
-def test_findTrunk_with_known_start_point():
+def getTanks(models:dict)->list[list[int]]:
+    return [pipe[STW_C.TANK_INDEXES] for pipe in models[STW_C.PATH]]
+
+
+def test_findTrunk_with_known_start_point(sample_results, sample_network):
     # Call the function with known start point
-    result = an.findTrunk(sample_idWRRF, sample_outfile, sample_links, idTrunkIni=sample_idTrunkIni)
+    result = an.findTrunk(sample_idWRRF, sample_results, sample_network, idTrunkIni=sample_idTrunkIni)
 
     # Define the expected result based on your test data
     # Adjust this according to your test case
@@ -25,9 +53,9 @@ def test_findTrunk_with_known_start_point():
     # Assert that the result matches the expected result
     pd.testing.assert_frame_equal(result, expected_result)
 
-def test_findTrunk_with_unknown_start_point():
+def test_findTrunk_with_unknown_start_point(sample_results, sample_network):
     # Call the function with unknown start point
-    result = an.findTrunk(sample_idWRRF, sample_outfile, sample_links)
+    result = an.findTrunk(sample_idWRRF, sample_results, sample_network)
 
     # Define the expected result based on your test data
     # Adjust this according to your test case
@@ -57,4 +85,237 @@ def test_empty_breaklinksIndexPath():
     pathWithLookPoints = pd.DataFrame({'col1': [1, 2, 3]}, index=[0, 2, 4])
     breaklinksIndexPath = []
     expected_result = pd.Series([4, 4, 4], index=[0, 2, 4])
-    assert (an.setAggregationNodes(pathWithLookPoints, breaklinksIndexPath) == expected_result).all()
\ No newline at end of file
+    assert (an.setAggregationNodes(pathWithLookPoints, breaklinksIndexPath) == expected_result).all()
+
+sample_flows = np.array([10.0, 3.0, 1.0, 0.0, 2.5]) #T1, B1, B2, B3 and B4
+sample_hasFlow = np.array([True, True, True, False, True])
+
+def test_evaluateRelativeBranchInfluence_several_branches():
+    relevant = an.evaluateRelativeBranchInfluence(sample_flows, np.array([1,2,4]), 0)
+
+    assert relevant.tolist() == [True, False, True]
+    assert an.evaluateRelativeBranchInfluence(sample_flows, 2, 4) #1 > 0.2 * 2.5
+
+@pytest.mark.parametrize("isTrunk, catchments", [(True, [False,True,False,False]), (False, [True,True,False,True])])
+def test_selectRelevantBranches(isTrunk, catchments):
+    relevant, pipesCatchments = an.selectRelevantBranches(sample_flows, sample_hasFlow, isTrunk, np.array([1,2,3,4]), np.zeros(4, dtype=int))
+
+    assert relevant.tolist() == [True,False,False,True] #B3 has no flow
+    assert pipesCatchments.tolist() == catchments
+
+def test_aggregatePathLookPoints_by_segment():
+    lookPoints = pd.DataFrame({'Name': ['P0','P1','P2','P3','P4'],
+                               'Area': [1.0, None, 2.0, 4.0, None],
+                               'AverageValue': [0.1, 0.2, None, None, 0.3],
+                               'TimePatterns': [None, 'PAT', 'PAT', None, None],
+                               'Baseline': [None, None, 1.0, None, 2.0],
+                               STW_C.MODELED_INPUT: [None, 'C1', 'C2', None, 'C4']})
+
+    pathElements = an.aggregatePathLookPoints(lookPoints, [1, 3])
+
+    assert pathElements.index.tolist() == ['P1','P3','P4']
+    assert pathElements['Area'].tolist() == [1.0, 6.0, 0.0]
+    assert pathElements['TimePatterns'].tolist()[:2] == ['PAT','PAT']
+    assert pathElements[STW_C.MODELED_INPUT].tolist() == ['C1','C2','C4']
+
+def test_getPathLookPoints_pipes_at_same_path_pipe():
+    pathDF = pd.DataFrame({'Name': ['P1','P2'], 'OutletNode': ['N1','N2']})
+    pipesCatchments = pd.DataFrame({'OutletNode': ['N1','N1','N2'], STW_C.TRUNK_PIPE_NAME: ['P1','P1','P2']},
+                                   index=pd.Index(['C1','C2','C3'], name=STW_C.DISCHARGE_PIPE_NAME))
+
+    lookPoints = an.getPathLookPoints(pathDF, pd.DataFrame(index=pd.Index([], name='OutletNode')), pipesCatchments)
+
+    assert lookPoints['Name'].tolist() == ['P1','P2'] #one row per pipe of the path
+    assert lookPoints[STW_C.MODELED_INPUT].tolist() == ['C1,C2','C3']
+
+def test_renumberTanks_with_subbranches():
+    branchesModels = {'T1': {STW_C.PATH: [{STW_C.TANK_INDEXES: [0, 1]}, {STW_C.TANK_INDEXES: [2]}], STW_C.WCATCHMENTS: [],
+                             STW_C.SUBBRANCHES: {'P1': {STW_C.PATH: [{STW_C.TANK_INDEXES: [3, 4]}], STW_C.WCATCHMENTS: []}}}}
+
+    an.renumberTanks(branchesModels, 7)
+
+    assert [pipe[STW_C.TANK_INDEXES] for pipe in branchesModels['T1'][STW_C.PATH]] == [[7, 8], [9]]
+    assert branchesModels['T1'][STW_C.SUBBRANCHES]['P1'][STW_C.PATH][0][STW_C.TANK_INDEXES] == [10, 11]
+
+def test_getModelsSize_counts_subbranches():
+    trunkModels = {STW_C.PATH: [{STW_C.TANK_INDEXES: [1, 2, 3]}], STW_C.WCATCHMENTS: [{}, {}]}
+    branchesModels = {'T1': {STW_C.PATH: [{STW_C.TANK_INDEXES: [4]}], STW_C.WCATCHMENTS: [{}],
+                             STW_C.SUBBRANCHES: {'P1': {STW_C.PATH: [{STW_C.TANK_INDEXES: [5, 6]}], STW_C.WCATCHMENTS: []}}},
+                      'T2': {STW_C.PATH: [{STW_C.TANK_INDEXES: [7]}], STW_C.WCATCHMENTS: [{}]}}
+
+    size = an.getModelsSize(trunkModels, branchesModels)
+
+    assert size == {STW_C.NUM_TANKS: 7, STW_C.NUM_CATCHMENTS: 4, STW_C.NUM_BRANCHES: 3, STW_C.NUM_SUBMODELS: 7 + 3*4 + 3}
+
+def test_fitsBudget():
+    evaluation = {STW_C.NUM_TANKS: 20, STW_C.NUM_CATCHMENTS: 5, STW_C.SWEEP_ERROR: None}
+
+    assert an.fitsBudget(evaluation, {STW_C.NUM_TANKS: 20, STW_C.NUM_CATCHMENTS: 8})
+    assert not an.fitsBudget(evaluation, {STW_C.NUM_CATCHMENTS: 4})
+    assert not an.fitsBudget({**evaluation, STW_C.SWEEP_ERROR: 'IndexError'}, {STW_C.NUM_TANKS: 50})
+
+def test_getBranchThresholds(synthetic_inp):
+    networkElements, lookPoints, network, results, predecessors = an.prepareAggregation(synthetic_inp, sn.ID_WRRF)
+
+    with results:
+        trunk = an.findTrunk(sn.ID_WRRF, results, network, predecessors=predecessors)
+        thresholds = an.getBranchThresholds(results, trunk, network)
+
+    #0 selects also the connected pipe with the smallest flow (BL2), CL1 comes from a leaf and can not be a branch
+    np.testing.assert_allclose(thresholds, [0, 4/15.1, 5/15.1], rtol=1e-3)
+
+@pytest.mark.parametrize("budget, expected", [({STW_C.NUM_TANKS: 45}, (0.0, 2)), ({STW_C.NUM_TANKS: 17}, (0.1, 2)),
+                                              ({STW_C.NUM_TANKS: 5}, (0.3, 1))])
+def test_tuneAggregationToBudget(monkeypatch, budget, expected):
+    #the model has one size per threshold with one tank per section, and grows with the tanks per section 
+    sizes = {0.0: 20, 0.1: 8, 0.3: 5, 0.5: 2}
+    def evaluateAggregation(*args):
+        percLimToBranch, maxTanks = args[-2:]
+        return {STW_C.NUM_TANKS: sizes[percLimToBranch] * maxTanks, STW_C.SWEEP_ERROR: None}
+
+    monkeypatch.setattr(an, 'findTrunk', lambda *args: None)
+    monkeypatch.setattr(an, 'getBranchThresholds', lambda *args: np.array(list(sizes)))
+    monkeypatch.setattr(an, 'evaluateAggregation', evaluateAggregation)
+    monkeypatch.setattr(STW_C, 'MAX_TANKS', 4)
+
+    assert an.tuneAggregationToBudget(None, None, None, [], {}, 'WRRF', None, None, budget) == expected
+
+def test_tuneAggregationToBudget_skips_errors(monkeypatch):
+    #0.1 can not be modelled and the model with 3 tanks per section is larger than the one with 4
+    sizes = {(0.0, 1): 20, (0.1, 1): None, (0.3, 1): 5, (0.3, 2): 8, (0.3, 3): 12, (0.3, 4): 9, (0.5, 1): 2}
+    def evaluateAggregation(*args):
+        size = sizes[tuple(args[-2:])]
+        return {STW_C.NUM_TANKS: size, STW_C.SWEEP_ERROR: 'IndexError' if size is None else None}
+
+    monkeypatch.setattr(an, 'findTrunk', lambda *args: None)
+    monkeypatch.setattr(an, 'getBranchThresholds', lambda *args: np.array([0.0, 0.1, 0.3, 0.5]))
+    monkeypatch.setattr(an, 'evaluateAggregation', evaluateAggregation)
+    monkeypatch.setattr(STW_C, 'MAX_TANKS', 4)
+
+    assert an.tuneAggregationToBudget(None, None, None, [], {}, 'WRRF', None, None, {STW_C.NUM_TANKS: 10}) == (0.3, 4)
+
+@pytest.mark.parametrize("numTanks, trunkTanks, branches", [(6, [[1], [2, 3]], ['AL3', 'BL2']), (4, [[1], [2]], ['AL3']), (1, [[1]], [])])
+def test_aggregateAndModelNetwork_budget(synthetic_inp, numTanks, trunkTanks, branches):
+    trunkModels, branchesModels = an.aggregateAndModelNetwork(synthetic_inp, sn.ID_WRRF, [], budget={STW_C.NUM_TANKS: numTanks})
+
+    assert getTanks(trunkModels) == trunkTanks
+    assert sorted(branchesModels) == branches
+    assert max(sum(getTanks(trunkModels) + sum((getTanks(branchesModels[branch]) for branch in branches), []), [])) == numTanks
+
+def test_modelBranchesInParallel_equals_serial(synthetic_inp, capsys):
+    networkElements, lookPoints, network, results, predecessors = an.prepareAggregation(synthetic_inp, sn.ID_WRRF)
+    patterns = networkElements[STW_C.T_PATTERNS]
+
+    with results:
+        branches, trunkModels, trunk, nTanks = an.getTrunkModels(network, lookPoints, results, [], patterns, sn.ID_WRRF, predecessors=predecessors)
+        capsys.readouterr()
+        serial = an.getBranchesModels(network, lookPoints, results, [], patterns, branches, nTanks, predecessors, maxDepth=2, nWorkers=1)
+        serialLog = capsys.readouterr().out
+        parallel = an.getBranchesModels(network, lookPoints, results, [], patterns, branches, nTanks, predecessors, maxDepth=2, nWorkers=2)
+        parallelLog = capsys.readouterr().out
+
+    assert STW_C.SUBBRANCHES in serial['AL3']
+    assert repr(parallel) == repr(serial) #same models, keys order and tanks numbering
+    assert parallelLog == serialLog
+
+def test_modelBranchesInParallel_prints_in_order(synthetic_inp, capsys, monkeypatch):
+    networkElements, lookPoints, network, results, predecessors = an.prepareAggregation(synthetic_inp, sn.ID_WRRF)
+    branches = pd.DataFrame(index=pd.Index(['AL3','BL2'], name=STW_C.DISCHARGE_PIPE_NAME))
+    def modelBranches(*args):
+        name = args[5].index[0]
+        time.sleep(0.5 if name == 'AL3' else 0) #the first branch ends last
+        print("modelling", name)
+        print("warning of", name, file=sys.stderr)
+        args[9].add(name)
+        return {name: {STW_C.PATH: []}}, 1
+    monkeypatch.setattr(an, 'modelBranches', modelBranches)
+    capsys.readouterr()
+
+    with results:
+        branchesModels, nTanks = an.modelBranchesInParallel(network, lookPoints, results, [], networkElements[STW_C.T_PATTERNS], branches, 
+                                                            0, predecessors, 1, 2)
+    captured = capsys.readouterr()
+
+    assert list(branchesModels) == ['AL3','BL2'] and nTanks == 2
+    assert captured.out == "modelling AL3\nmodelling BL2\n"
+    assert captured.err.index("warning of AL3") < captured.err.index("warning of BL2")
+
+@pytest.mark.parametrize("nWorkers", [1, 2])
+def test_sweepAggregation(synthetic_inp, nWorkers):
+    constants = STW_C.PERC_LIM_TO_BRANCH, STW_C.MAX_TANKS
+
+    sweep = an.sweepAggregation(synthetic_inp, sn.ID_WRRF, [], [0.0, 0.3, 0.5], [1, 4], nWorkers=nWorkers)
+
+    assert sweep[STW_C.SWEEP_ERROR].isna().all()
+    assert sweep[[STW_C.SWEEP_PERC_LIM, STW_C.SWEEP_MAX_TANKS]].values.tolist() == [[0.0, 1], [0.0, 4], [0.3, 1], [0.3, 4], [0.5, 1], [0.5, 4]]
+    assert sweep[STW_C.NUM_BRANCHES].tolist() == [2, 2, 1, 1, 0, 0] #AL3 and BL2, only AL3, none
+    assert sweep[STW_C.NUM_TANKS].tolist() == [5, 7, 4, 6, 1, 4] #the last section of the trunk has 3 tanks without limit
+    #the parameters are not left in the constants
+    assert (STW_C.PERC_LIM_TO_BRANCH, STW_C.MAX_TANKS) == constants
+
+def test_evaluateAggregations_keeps_errors(synthetic_inp, monkeypatch):
+    networkElements, lookPoints, network, results, predecessors = an.prepareAggregation(synthetic_inp, sn.ID_WRRF)
+    monkeypatch.setattr(an, 'getBranchesModels', lambda *args, **kwargs: 1/0)
+
+    with results:
+        evaluations = an.evaluateAggregations(network, lookPoints, results, [], networkElements[STW_C.T_PATTERNS], sn.ID_WRRF, None, 
+                                              predecessors, [(0.3, 1)], nWorkers=1)
+
+    assert evaluations[STW_C.SWEEP_ERROR].tolist() == ['ZeroDivisionError: division by zero']
+    assert evaluations[STW_C.NUM_TANKS].isna().all()
+
+def test_tuneAggregationToBudget_unknown_limit():
+    with pytest.raises(ValueError):
+        an.tuneAggregationToBudget(None, None, None, [], {}, 'WRRF', None, None, {'NumberPumps': 2})
+
+def test_aggregateAndModelNetwork_branches_at_same_node(synthetic_inp):
+    trunkModels, branchesModels = an.aggregateAndModelNetwork(synthetic_inp, sn.ID_WRRF, [])
+
+    assert getTanks(trunkModels) == [[1], [2, 3, 4]]
+    assert sorted(branchesModels) == ['AL3', 'BL2']
+    assert [branchesModels[branch][STW_C.TRUNK_PIPE_NAME] for branch in ['AL3', 'BL2']] == ['TL2', 'TL2']
+    assert getTanks(branchesModels['AL3']) == [[5], [6]]
+    assert getTanks(branchesModels['BL2']) == [[7]]
+    assert STW_C.SUBBRANCHES not in branchesModels['AL3']
+
+def test_aggregateAndModelNetwork_subbranches(synthetic_inp, monkeypatch):
+    monkeypatch.setattr(STW_C, 'MAX_BRANCH_DEPTH', 2)
+
+    trunkModels, branchesModels = an.aggregateAndModelNetwork(synthetic_inp, sn.ID_WRRF, [])
+
+    subBranches = branchesModels['AL3'][STW_C.SUBBRANCHES]
+    assert list(subBranches) == ['SL2']
+    assert subBranches['SL2'][STW_C.TRUNK_PIPE_NAME] == 'AL1'
+    #tanks are numbered depth first
+    assert getTanks(branchesModels['AL3']) == [[5], [6]]
+    assert getTanks(subBranches['SL2']) == [[7]]
+    assert getTanks(branchesModels['BL2']) == [[8]]
+
+def test_aggregateAndModelNetwork_min_branch_flow(synthetic_inp, monkeypatch):
+    monkeypatch.setattr(STW_C, 'MIN_BRANCH_FLOW', 4.5)
+
+    trunkModels, branchesModels = an.aggregateAndModelNetwork(synthetic_inp, sn.ID_WRRF, [])
+
+    assert list(branchesModels) == ['AL3']
+
+def test_aggregateAndModelNetwork_leaf_pipe_is_not_a_branch(synthetic_inp, monkeypatch):
+    monkeypatch.setattr(STW_C, 'PERC_LIM_TO_BRANCH', 0.0)
+
+    trunkModels, branchesModels = an.aggregateAndModelNetwork(synthetic_inp, sn.ID_WRRF, [])
+
+    assert sorted(branchesModels) == ['AL3', 'BL2'] #CL1 has no path upstream of C0
+    assert 'TL3 - TL5(Catch)[input]' in [catchment[STW_C.NAME_CATCH] for catchment in trunkModels[STW_C.WCATCHMENTS]]
+
+def test_modelBranches_models_each_branch_once(synthetic_inp):
+    networkElements, lookPoints, network, results, predecessors = an.prepareAggregation(synthetic_inp, sn.ID_WRRF)
+    patterns = networkElements[STW_C.T_PATTERNS]
+
+    with results:
+        branches, trunkModels, trunk, nTanks = an.getTrunkModels(network, lookPoints, results, [], patterns, sn.ID_WRRF, predecessors=predecessors)
+        repeated = pd.concat([branches, branches])
+        branchesModels, nTanksAll = an.modelBranches(network, lookPoints, results, [], patterns, repeated, nTanks, predecessors, 1, set())
+        withoutB, _ = an.modelBranches(network, lookPoints, results, [], patterns, branches, nTanks, predecessors, 1, {'BL2'})
+
+    assert sorted(branchesModels) == ['AL3', 'BL2']
+    assert nTanksAll == nTanks + 3
+    assert list(withoutB) == ['AL3']
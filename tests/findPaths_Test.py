@@ -0,0 +1,105 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from SWMMToWESTConvert import networkTopology as nt
+from SWMMToWESTConvert import findPaths as fp
+from SWMMToWESTConvert import SWMM_InpConstants as SWWM_C
+
+
+@pytest.fixture
+def sample_topology():
+    # N1 splits into L2 (small) and L3 (large), both reach N4 which drains into the outlet. 
+    # N5 drains into another outfall (OUT2) through the preferred link L8 and into OUT through L7.
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N0','N1','N1','N2','N3','N4','N5','N5'],
+                          SWWM_C.OUT_NODE: ['N1','N2','N3','N4','N4','OUT','N4','OUT2'],
+                          SWWM_C.MAX_Q: [1.0, 0.5, 2.0, 0.5, 2.0, 3.0, 0.1, 0.2],
+                          SWWM_C.DIAM: [0.5, 0.3, 0.3, 0.3, 0.6, 0.8, 0.2, 0.2]},
+                         index=pd.Index(['L1','L2','L3','L4','L5','L6','L7','L8'], name=SWWM_C.NAME))
+    return nt.NetworkTopology(links)
+
+@pytest.mark.parametrize("singlePass", [False, True])
+def test_getPathToWRRF(sample_topology, singlePass):
+    paths = fp.getPathToWRRF('OUT', sample_topology, ['N0','N2','N5'], singlePass)
+
+    assert paths == {'N0': ['L1','L3','L5','L6'], 'N2': ['L4','L6'], 'N5': ['L7','L6']}
+
+def test_getDominantSuccessors(sample_topology):
+    successors = fp.getDominantSuccessors(sample_topology.getNodeId('OUT'), sample_topology)
+    successorOf = {node: sample_topology.linkNames[link] if link >= 0 else None for node, link in zip(sample_topology.nodeNames, successors)}
+
+    assert successorOf == {'N0': 'L1', 'N1': 'L3', 'N2': 'L4', 'N3': 'L5', 'N4': 'L6', 'N5': 'L7', 'OUT': None, 'OUT2': None}
+
+def test_searchPath_backtracks_any_out_degree():
+    # N1 has three links: the two preferred ones end in an outfall and in a loop back to N1
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N1','N1','N1','N3','N4'],
+                          SWWM_C.OUT_NODE: ['N2','N3','N4','N1','OUT'],
+                          SWWM_C.MAX_Q: [3.0, 2.0, 1.0, 2.0, 1.0],
+                          SWWM_C.DIAM: [0.5, 0.5, 0.5, 0.5, 0.5]},
+                         index=pd.Index(['L1','L2','L3','L4','L5'], name=SWWM_C.NAME))
+    topology = nt.NetworkTopology(links)
+
+    assert fp.findPath('N1', 'OUT', topology) == ['L3','L5']
+    with pytest.raises(fp.PathNotFoundError):
+        fp.findPath('N2', 'OUT', topology)
+    with pytest.raises(fp.PathNotFoundError):
+        fp.searchPath(topology.getNodeId('N1'), topology.getNodeId('OUT'), topology, maxSteps=2)
+
+def test_getPathToWRRF_without_route(sample_topology):
+    paths = fp.getPathToWRRF('OUT', sample_topology, ['N0','OUT2'])
+
+    assert list(paths) == ['N0']
+
+def test_searchPath_skips_components_downstream():
+    # the preferred link of N1 leads to OUT, downstream of the final node N3
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N1','N1','N3'],
+                          SWWM_C.OUT_NODE: ['N3','OUT','OUT'],
+                          SWWM_C.MAX_Q: [1.0, 2.0, 3.0],
+                          SWWM_C.DIAM: 0.3}, index=pd.Index(['L1','L2','L3'], name=SWWM_C.NAME))
+    topology = nt.NetworkTopology(links)
+
+    assert fp.searchPath(topology.getNodeId('N1'), topology.getNodeId('N3'), topology, maxSteps=1) == [0]
+
+def test_getMainFlowPredecessors(sample_topology):
+    meanFlows = np.array([1.0, 0.2, 0.8, 0.2, 0.8, 1.0, np.nan, np.nan])
+
+    predecessors = fp.getMainFlowPredecessors(meanFlows, sample_topology)
+    predecessorOf = {node: predecessors[sample_topology.getNodeId(node)] for node in ['N0','N1','N4','OUT','OUT2']}
+
+    assert predecessorOf == {'N0': -1, 'N1': 0, 'N4': 4, 'OUT': 5, 'OUT2': -2} #L1, L5, L6 and only a link without flow
+
+class RankedResults:
+    # Results with only the flows used to rank the links
+    def __init__(self, meanFlows):
+        self.meanFlows = meanFlows
+
+    def getLinkRankingArrays(self, linkNames):
+        return self.meanFlows, ~np.isnan(self.meanFlows)
+
+def test_findMainFlowPath_links_without_flow(sample_topology):
+    results = RankedResults(np.array([1.0, 0.2, 0.8, 0.2, 0.8, 1.0, np.nan, np.nan]))
+
+    assert fp.findMainFlowPath('OUT', results, sample_topology).index.tolist() == ['L1','L3','L5','L6']
+    assert fp.findMainFlowPath('OUT2', results, sample_topology).empty #L8 is the only link and has no flow
+
+def test_findMainFlowPath_loop_with_links_without_flow():
+    # L2 closes a loop between N2 and N3, the other link discharging into N3 (L4) is not in the results
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N2','N2','N3','N4'],
+                          SWWM_C.OUT_NODE: ['OUT','N3','N2','N3'],
+                          SWWM_C.MAX_Q: 1.0, SWWM_C.DIAM: 0.3}, index=pd.Index(['L1','L2','L3','L4'], name=SWWM_C.NAME))
+    topology = nt.NetworkTopology(links)
+
+    path = fp.findMainFlowPath('OUT', RankedResults(np.array([3.0, 2.0, 2.0, np.nan])), topology)
+
+    assert path.index.tolist() == ['L3','L1']
+
+def test_DrainageTree(sample_topology):
+    t = sample_topology
+    path = np.array([t.linkIds['L1'], t.linkIds['L2'], t.linkIds['L4'], t.linkIds['L6']]) #forced through the smaller link L2
+    tree = fp.DrainageTree(t.getNodeId('OUT'), t, path)
+
+    assert tree.isUpstream(t.getNodeId('N0'), t.getNodeId('N2')) and tree.isUpstream(t.getNodeId('N4'), t.getNodeId('N4'))
+    assert not tree.isUpstream(t.getNodeId('N3'), t.getNodeId('N2')) and not tree.isUpstream(t.getNodeId('OUT2'), t.getNodeId('OUT'))
+    assert tree.getNearestPathLink(t.getNodeId('N3'), path) == 2 #N3 drains into the path at N4
+    assert tree.getNearestPathLink(t.getNodeId('N1'), path) == 0 #on the path, outlet of L1
+    assert tree.getNearestPathLink(t.getNodeId('OUT2'), path) == -1
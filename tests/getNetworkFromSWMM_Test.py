@@ -1,12 +1,18 @@
 import pytest
 import swmmio
+import numpy as np
 import pandas as pd
 import os
 import json
+import sqlite3
+from pyswmm import Output
+from swmm.toolkit.shared_enum import LinkAttribute, NodeAttribute, SubcatchAttribute
 
 
 from SWMMToWESTConvert import getNetworkFromSWMM as gnfs
 from SWMMToWESTConvert import SWMM_InpConstants as SWWM_C
+from SWMMToWESTConvert import SWMMtoWESTConstants as STW_C
+from tests.syntheticOut import writeSWMMOut
 
 """
     Test of the class getNetworkFromSWMM. Should be runned from the main directory using "pytest tests\getNetworkFromSWMM_Test.py"
@@ -110,3 +116,382 @@ def test_getNodesLeaves_empty_input():
     links = pd.DataFrame(columns=["InletNode", "OutletNode"])  # Empty DataFrame
 
     assert not gnfs.getNodesLeaves(links) #checks that is empty
+
+#----------------------------------------------------------------------------
+
+@pytest.fixture
+def sample_out(tmp_path):
+    # Writes a small .out with 1 subcatchment, 2 nodes and 3 links with random results
+    rng = np.random.default_rng(0)
+    linkValues = rng.random((48,3,5))
+    subcatchValues = rng.random((48,1,8))
+    nodeValues = rng.random((48,2,6))
+    path = writeSWMMOut(str(tmp_path / "sample.out"), ['S1'], ['J1','J2'], ['C1','C2','C3'], 44731.0, 3600,
+                        subcatchValues, nodeValues, linkValues)
+
+    return path, linkValues, nodeValues, subcatchValues
+
+def test_getFlowTimeSeries_values(sample_out):
+    path, linkValues, *_ = sample_out
+
+    result = gnfs.getFlowTimeSeries(['C3','C1'], path)
+
+    assert result.columns.tolist() == ['C3','C1']
+    assert result.shape == (48, 2)
+    assert np.allclose(result['C3'].to_numpy(), linkValues[:,2,0].astype(np.float32))
+    assert np.allclose(result['C1'].to_numpy(), linkValues[:,0,0].astype(np.float32))
+
+def test_getFlowTimeSeries_index_and_duplicates(sample_out):
+    path, *_ = sample_out
+
+    result = gnfs.getFlowTimeSeries(['C2','C2','C1'], path)
+
+    assert result.columns.tolist() == ['C2','C1'] #duplicates are read once
+    assert result.index[0] == pd.Timestamp('2022-06-19 01:00:00') #first report is one step after the start
+    assert result.index[-1] == pd.Timestamp('2022-06-21 00:00:00')
+
+def test_getFlowTimeSeries_unknown_link(sample_out):
+    path, *_ = sample_out
+
+    with pytest.raises(Exception):
+        gnfs.getFlowTimeSeries(['C1','NotALink'], path)
+
+#----------------------------------------------------------------------------
+
+def test_loadLinkFlowsCache_columns_are_views(sample_out, tmp_path):
+    path, linkValues, *_ = sample_out
+
+    flows, linkIndex, timeIndex = gnfs.loadLinkFlowsCache(path, str(tmp_path / "cache"))
+    column = flows[:, linkIndex['C2']]
+
+    assert np.shares_memory(column, flows) #slicing a link does not copy the values
+    assert np.allclose(column, linkValues[:,1,0].astype(np.float32))
+    assert len(timeIndex) == flows.shape[0]
+
+def test_loadLinkFlowsCache_rebuilds_when_stale(sample_out, tmp_path):
+    path, *_ = sample_out
+    cacheDir = str(tmp_path / "cache")
+    gnfs.loadLinkFlowsCache(path, cacheDir)
+
+    # Rewrites the .out with other flows
+    newValues = np.full((48,3,5), 7.0)
+    writeSWMMOut(path, ['S1'], ['J1','J2'], ['C1','C2','C3'], 44731.0, 3600, np.zeros((48,1,8)), np.zeros((48,2,6)), newValues)
+    os.utime(path, ns=(1, 1))
+
+    flows, linkIndex, _ = gnfs.loadLinkFlowsCache(path, cacheDir)
+    assert (flows[:, linkIndex['C1']] == 7.0).all()
+
+def test_getLinkFlowStatistics_stored_with_cache(sample_out, tmp_path, monkeypatch):
+    path, *_ = sample_out
+    cacheDir = str(tmp_path / "cache")
+    monkeypatch.setattr(STW_C, "USE_RESULTS_CACHE", True)
+
+    with gnfs.SimulationResults(path, cacheDir) as results:
+        stats = results.getLinkFlowStatistics()
+    cachePath = gnfs.getResultsCachePath(path, cacheDir)
+
+    assert sorted(os.listdir(cachePath)) == sorted([STW_C.CACHE_FLOWS_FILE, STW_C.CACHE_META_FILE, STW_C.CACHE_STATS_FILE]) #no temporary file left
+    with gnfs.SimulationResults(path, cacheDir) as results:
+        pd.testing.assert_frame_equal(results.getLinkFlowStatistics(), stats)
+
+def test_evictResultsCache_removes_least_recently_used(tmp_path):
+    cacheDir = tmp_path / "cache"
+    for i, name in enumerate(['old','new']):
+        entry = cacheDir / name
+        entry.mkdir(parents=True)
+        (entry / "linkFlows.npy").write_bytes(b'0' * 100)
+        os.utime(entry, (i, i))
+
+    gnfs.evictResultsCache(str(cacheDir), maxSize=150)
+
+    assert not (cacheDir / "old").exists()
+    assert (cacheDir / "new").exists()
+
+#----------------------------------------------------------------------------
+
+def test_getLinkFlowStatistics(sample_out, tmp_path):
+    path, linkValues, *_ = sample_out
+    flowsC1 = linkValues[:,0,0].astype(np.float32).astype(np.float64)
+
+    stats = gnfs.getLinkFlowStatistics(path, str(tmp_path / "cache"))
+
+    assert stats.index.tolist() == ['C1','C2','C3']
+    assert np.isclose(stats.loc['C1', STW_C.STAT_MEAN], flowsC1.mean())
+    assert np.isclose(stats.loc['C1', STW_C.STAT_MAX], flowsC1.max())
+    assert np.isclose(stats.loc['C1', STW_C.STAT_VOLUME], flowsC1.sum() * 3600)
+    # The first report is at 01:00, so the hour 0 values are the rows 23 and 47
+    assert np.isclose(stats.loc['C1', STW_C.STAT_HOUR_PREFIX + '0'], flowsC1[[23, 47]].mean())
+
+#----------------------------------------------------------------------------
+
+def test_readOutFileHeader(sample_out):
+    path, *_ = sample_out
+
+    header = gnfs.readOutFileHeader(path)
+
+    assert list(header[STW_C.OUT_LINKS]) == ['C1','C2','C3']
+    assert list(header[STW_C.OUT_NODES]) == ['J1','J2']
+    assert header[STW_C.OUT_N_VARS] == [8, 6, 5, 15]
+    assert header[STW_C.OUT_START] == pd.Timestamp('2022-06-19')
+    assert header[STW_C.OUT_PERIODS] == 48
+
+def test_getElementResultsView_is_strided_view(sample_out):
+    path, linkValues, *_ = sample_out
+    header = gnfs.readOutFileHeader(path)
+    results = gnfs.mapOutFileResults(path, header)
+
+    linksView = gnfs.getElementResultsView(results, header, STW_C.OUT_LINKS)
+
+    assert np.shares_memory(linksView, results)
+    assert np.array_equal(linksView[:, 1, LinkAttribute.FLOW_DEPTH.value], linkValues[:,1,1].astype(np.float32))
+
+def test_readOutFileHeader_not_an_out(tmp_path):
+    path = tmp_path / "empty.out"
+    path.write_bytes(b'0' * 64)
+
+    with pytest.raises(ValueError):
+        gnfs.readOutFileHeader(str(path))
+
+def assertSeriesSameAsPyswmm(path:str, elementType:str, attributes:'Enum'):
+    names = list(gnfs.readOutFileHeader(path)[elementType])
+
+    with Output(path) as out:
+        for attribute in attributes:
+            if attribute.name.startswith('POLLUT'):
+                continue
+            values, timeIndex = gnfs.getResultsSeriesArray(path, elementType, names, attribute)
+            
+            for i, name in enumerate(names):
+                if elementType == STW_C.OUT_LINKS:
+                    expected = out.link_series(name, attribute, 0, out.period - 1)
+                elif elementType == STW_C.OUT_NODES:
+                    expected = out.node_series(name, attribute, 0, out.period - 1)
+                else:
+                    expected = out.subcatch_series(name, attribute, 0, out.period - 1)
+                assert np.array_equal(values[:len(expected), i], list(expected.values()))
+                assert timeIndex[:len(expected)].to_pydatetime().tolist() == list(expected.keys())
+
+@pytest.mark.parametrize("elementType, attributes", [(STW_C.OUT_LINKS, LinkAttribute), (STW_C.OUT_NODES, NodeAttribute), 
+                                                     (STW_C.OUT_SUBCATCHMENTS, SubcatchAttribute)])
+def test_getResultsSeriesArray_same_as_pyswmm(sample_out, elementType, attributes):
+    path, *_ = sample_out
+
+    assertSeriesSameAsPyswmm(path, elementType, attributes)
+
+# tests/smallNetwork.out is written by the SWMM engine from tests/smallNetwork.inp 
+# (swmm.toolkit.solver.swmm_run('tests/smallNetwork.inp', 'smallNetwork.rpt', 'tests/smallNetwork.out'))
+@pytest.mark.parametrize("elementType, attributes", [(STW_C.OUT_LINKS, LinkAttribute), (STW_C.OUT_NODES, NodeAttribute), 
+                                                     (STW_C.OUT_SUBCATCHMENTS, SubcatchAttribute)])
+def test_getResultsSeriesArray_same_as_pyswmm_engine_out(elementType, attributes):
+    assertSeriesSameAsPyswmm("tests/smallNetwork.out", elementType, attributes)
+
+def test_readOutFileHeader_same_as_pyswmm_engine_out():
+    path = "tests/smallNetwork.out"
+
+    header = gnfs.readOutFileHeader(path)
+
+    with Output(path) as out:
+        assert list(header[STW_C.OUT_LINKS]) == list(out.links)
+        assert list(header[STW_C.OUT_NODES]) == list(out.nodes)
+        assert list(header[STW_C.OUT_SUBCATCHMENTS]) == list(out.subcatchments)
+        assert header[STW_C.OUT_PERIODS] == out.period
+        assert header[STW_C.OUT_REPORT_STEP] == out.report
+
+def test_getLinkFlowStatistics_same_as_pyswmm_engine_out():
+    path = "tests/smallNetwork.out"
+
+    stats = gnfs.getLinkFlowStatistics(path)
+
+    with Output(path) as out:
+        lastFlows = out.link_attribute(LinkAttribute.FLOW_RATE, out.period - 1) #link_series does not return the last period
+        for name in out.links:
+            flows = np.array(list(out.link_series(name, LinkAttribute.FLOW_RATE, 0, out.period - 1).values()) + [lastFlows[name]])
+            assert np.isclose(stats.loc[name, STW_C.STAT_MEAN], flows.mean(), rtol=1e-5)
+            assert np.isclose(stats.loc[name, STW_C.STAT_MAX], flows.max(), rtol=1e-5)
+
+@pytest.mark.skipif(not os.path.exists("tests/DWF2022_TEST.out"), reason="Needs the simulation results of the test network")
+def test_getLinksFlowArray_same_as_pyswmm_test_network():
+    path = "tests/DWF2022_TEST.out"
+    links = list(gnfs.readOutFileHeader(path)[STW_C.OUT_LINKS])
+
+    flows, _ = gnfs.getLinksFlowArray(links, path)
+
+    with Output(path) as out:
+        for i in range(len(links)):
+            expected = list(out.link_series(i, LinkAttribute.FLOW_RATE, 0, out.period - 1).values()) #by index, as pyswmm does not decode latin-1 names
+            assert np.array_equal(flows[:len(expected), i], expected)
+
+#----------------------------------------------------------------------------
+
+def test_getPeriodsSlice():
+    start = pd.Timestamp('2022-06-19')
+
+    assert gnfs.getPeriodsSlice(start, 3600, 48) == slice(0, 48, 1)
+    assert gnfs.getPeriodsSlice(start, 3600, 48, pd.Timestamp('2022-06-20 01:00'), pd.Timestamp('2022-06-20 05:30')) == slice(24, 29, 1)
+    assert gnfs.getPeriodsSlice(start, 3600, 48, pd.Timestamp('2022-06-10'), pd.Timestamp('2022-07-10'), pd.Timedelta(hours=2)) == slice(0, 48, 2)
+
+    with pytest.raises(ValueError):
+        gnfs.getPeriodsSlice(start, 3600, 48, step=pd.Timedelta(minutes=90))
+
+@pytest.mark.parametrize("useCache", [True, False])
+def test_getFlowTimeSeries_window_and_step(sample_out, useCache, monkeypatch):
+    path, linkValues, *_ = sample_out
+    monkeypatch.setattr(STW_C, "USE_RESULTS_CACHE", useCache)
+
+    result = gnfs.getFlowTimeSeries(['C2'], path, pd.Timestamp('2022-06-20 01:00'), pd.Timestamp('2022-06-20 13:00'), pd.Timedelta(hours=3))
+
+    assert result.index.tolist() == list(pd.date_range('2022-06-20 01:00', periods=4, freq='3h'))
+    assert np.allclose(result['C2'].to_numpy(), linkValues[24:36:3,1,0].astype(np.float32))
+
+def test_getGroupsHourlyFlows_same_as_series(sample_out, monkeypatch):
+    path, *_ = sample_out
+    monkeypatch.setattr(STW_C, "RESULTS_CHUNK_MEMORY", 100) #forces chunks of a few periods
+
+    result = gnfs.getGroupsHourlyFlows(path, {'C1,C2': ['C1','C2'], 'C3': ['C3']})
+
+    series = gnfs.getFlowTimeSeries(['C1','C2','C3'], path, gnfs.getDryWeatherStart(path))
+    expected = pd.DataFrame({'C1,C2': series['C1'] + series['C2'], 'C3': series['C3']})
+    expectedHourly = expected.groupby(expected.index.hour).mean()
+
+    assert result.index.tolist() == ['C1,C2','C3']
+    assert np.allclose(result[gnfs.getHourColumns()].to_numpy(), expectedHourly.to_numpy().T)
+    assert np.allclose(result[STW_C.STAT_MEAN].to_numpy(), expected.mean().to_numpy())
+
+def test_getGroupsHourlyFlows_missing_hours(sample_out):
+    path, *_ = sample_out
+
+    with pytest.raises(ValueError):
+        gnfs.getGroupsHourlyFlows(path, {'C1': ['C1']}, pd.Timestamp('2022-06-20 12:00'))
+
+#----------------------------------------------------------------------------
+
+def test_SimulationResults_opens_the_out_once(sample_out, tmp_path, monkeypatch):
+    path, linkValues, *_ = sample_out
+    calls = []
+    readHeader = gnfs.readOutFileHeader
+    monkeypatch.setattr(gnfs, "readOutFileHeader", lambda fileOut: calls.append(fileOut) or readHeader(fileOut))
+
+    with gnfs.SimulationResults(path, str(tmp_path / "cache")) as results:
+        results.getLinkFlowStatistics()
+        flows = results.getFlowTimeSeries(['C1','C2'])
+        results.getGroupsHourlyFlows({'C1': ['C1']})
+        results.getSeriesArray(STW_C.OUT_NODES, ['J2'], NodeAttribute.INVERT_DEPTH)
+
+    assert len(calls) == 1
+    assert np.allclose(flows['C2'].to_numpy(), linkValues[:,1,0].astype(np.float32))
+
+def test_SimulationResults_series_cache(sample_out):
+    path, linkValues, *_ = sample_out
+    results = gnfs.SimulationResults(path, maxMemory=2 * len(linkValues) * 8) #two series of float64
+
+    first, _ = results.getSeriesArray(STW_C.OUT_LINKS, ['C1','C2'], LinkAttribute.FLOW_RATE)
+    again, _ = results.getSeriesArray(STW_C.OUT_LINKS, ['C2','C1'], LinkAttribute.FLOW_RATE)
+    assert np.array_equal(first[:, ::-1], again)
+
+    results.getSeriesArray(STW_C.OUT_LINKS, ['C3'], LinkAttribute.FLOW_RATE)
+    cachedNames = [key[-1] for key in results.seriesCache]
+    assert cachedNames == ['C1','C3'] #C2 was the least recently used
+    assert results.seriesCacheBytes == 2 * len(linkValues) * 8
+
+def test_computeFlowStatistics_same_in_chunks(sample_out, monkeypatch):
+    path, *_ = sample_out
+    flows, timeIndex = gnfs.getLinksFlowArray(['C1','C2','C3'], path)
+    expected = gnfs.computeFlowStatistics(flows, timeIndex)
+
+    monkeypatch.setattr(STW_C, "RESULTS_CHUNK_MEMORY", 1) #one period at a time
+    assert gnfs.getChunkPeriods(8 * 3) == 1
+    
+    assert np.allclose(gnfs.computeFlowStatistics(flows, timeIndex), expected)
+    assert np.allclose(expected[:, 0], flows.mean(axis=0))
+
+#----------------------------------------------------------------------------
+
+@pytest.mark.parametrize("attribute", [NodeAttribute.TOTAL_INFLOW, NodeAttribute.LATERAL_INFLOW, NodeAttribute.INVERT_DEPTH])
+def test_getNodeTimeSeries(sample_out, attribute):
+    path, _, nodeValues, _ = sample_out
+
+    result = gnfs.getNodeTimeSeries(['J2','J1','J2'], path, attribute, pd.Timestamp('2022-06-20 00:00'))
+
+    assert result.columns.tolist() == ['J2','J1']
+    assert result.index[0] == pd.Timestamp('2022-06-20 00:00')
+    assert np.allclose(result['J2'].to_numpy(), nodeValues[23:,1,attribute.value].astype(np.float32))
+
+def test_getRunoffTimeSeries(sample_out):
+    path, _, _, subcatchValues = sample_out
+
+    with gnfs.SimulationResults(path) as results:
+        runoff = results.getRunoffTimeSeries(['S1'], step=pd.Timedelta(hours=2))
+        with pytest.raises(KeyError):
+            results.getRunoffTimeSeries(['NotASubcatchment'])
+
+    assert np.allclose(runoff['S1'].to_numpy(), subcatchValues[::2,0,SubcatchAttribute.RUNOFF_RATE.value].astype(np.float32))
+
+#----------------------------------------------------------------------------
+
+def writeResultsDB(path, conduits, pumps):
+    # Writes a PCSWMM like database with the maximum flow of conduits and pumps
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE Conduits_Results (Name TEXT, MaxFlow REAL, MaxVelocit REAL)")
+        connection.execute("CREATE TABLE Pumps_Results (Name TEXT, MaxFlow REAL, AvgFlow REAL)")
+        connection.executemany("INSERT INTO Conduits_Results VALUES (?, ?, 0)", conduits)
+        connection.executemany("INSERT INTO Pumps_Results VALUES (?, ?, 0)", pumps)
+    connection.close()
+    return path
+
+def test_readResultsTableFromDB(tmp_path):
+    dbFile = writeResultsDB(str(tmp_path / "sample.db"), [('C1', 0.5), ('C2', 0.0)], [('C3', 2.0)])
+
+    result = gnfs.readResultsTableFromDB(dbFile, STW_C.DB_LINK_TABLES, [STW_C.DB_MAX_FLOW])
+
+    assert result[STW_C.DB_MAX_FLOW].to_dict() == {'C1': 0.5, 'C2': 0.0, 'C3': 2.0}
+    with pytest.raises(ValueError):
+        gnfs.readResultsTableFromDB(dbFile, STW_C.DB_NODE_TABLES, [STW_C.DB_TOTAL_INFLOW])
+
+def test_getLinkRanking_from_DB(sample_out, tmp_path, monkeypatch):
+    path, *_ = sample_out
+    dbFile = writeResultsDB(str(tmp_path / "sample.db"), [('C1', 0.5), ('C2', 0.0)], [('C3', 2.0)])
+    monkeypatch.setattr(STW_C, "USE_RESULTS_DB", True)
+    monkeypatch.setattr(gnfs, "mapOutFileResults", lambda *args: None) #the results of the .out must not be needed
+
+    ranking = gnfs.SimulationResults(path, dbFile=dbFile).getLinkRanking()
+
+    assert ranking[STW_C.RANK_FLOW].to_dict() == {'C1': 0.5, 'C2': 0.0, 'C3': 2.0}
+    assert ranking[STW_C.HAS_FLOW].to_dict() == {'C1': True, 'C2': False, 'C3': True}
+
+@pytest.mark.parametrize("useDB, stale, complete", [(False, False, True), (True, True, True), (True, False, False)])
+def test_getLinkRanking_falls_back_to_out(sample_out, tmp_path, monkeypatch, useDB, stale, complete):
+    path, linkValues, *_ = sample_out
+    conduits = [('C1', 0.5), ('C2', 0.0)] + ([('C3', 2.0)] if complete else [])
+    dbFile = writeResultsDB(str(tmp_path / "sample.db"), conduits, [])
+    if stale:
+        os.utime(dbFile, ns=(1, 1))
+    monkeypatch.setattr(STW_C, "USE_RESULTS_DB", useDB)
+
+    ranking = gnfs.SimulationResults(path, str(tmp_path / "cache"), dbFile=dbFile).getLinkRanking()
+
+    assert np.allclose(ranking[STW_C.RANK_FLOW].to_numpy(), linkValues[:,:,0].astype(np.float32).mean(axis=0))
+
+def test_pruneNetworkToNode():
+    # N2 overflows to another outfall (OUT2), which also receives N3
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N1','N2','N2','N3'], SWWM_C.OUT_NODE: ['N2','WRRF','OUT2','OUT2'],
+                          SWWM_C.MAX_Q: 1.0, SWWM_C.DIAM: 0.3},
+                         index=pd.Index(['L1','L2','L3','L4'], name=SWWM_C.NAME))
+    nElements = {STW_C.LINKS: links,
+                 STW_C.LEAVES: gnfs.getNodesLeaves(links),
+                 STW_C.SUBCATCHMENTS: pd.DataFrame({SWWM_C.CATCH_OUT: ['N1','N3'], SWWM_C.AREA: [1.0, 2.0]}, index=['S1','S2']),
+                 STW_C.DWFS: pd.DataFrame({SWWM_C.INFLOW_MEAN: [0.1, 0.2]}, index=pd.Index(['N2','N3'], name=SWWM_C.INFLOW_NODE)),
+                 STW_C.DIRECTF: pd.DataFrame({SWWM_C.DFLOW_TIMES: ['TS1','TS2']}, index=pd.Index(['N1','N3'], name=SWWM_C.INFLOW_NODE)),
+                 STW_C.TIMESERIES: pd.DataFrame({'Value': [1, 2, 3]}, index=['TS1','TS1','TS2']),
+                 STW_C.T_PATTERNS: {}}
+
+    pruned = gnfs.pruneNetworkToNode(nElements, 'WRRF')
+
+    assert pruned[STW_C.LINKS].index.tolist() == ['L1','L2']
+    assert pruned[STW_C.LEAVES] == ['N1']
+    assert pruned[STW_C.SUBCATCHMENTS].index.tolist() == ['S1']
+    assert pruned[STW_C.DWFS].index.tolist() == ['N2']
+    assert pruned[STW_C.TIMESERIES]['Value'].tolist() == [1, 2]
+    assert nElements[STW_C.LINKS].shape[0] == 4 #the original elements are not modified
+
+    with pytest.raises(ValueError):
+        gnfs.pruneNetworkToNode(nElements, 'NotANode')
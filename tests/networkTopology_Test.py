@@ -0,0 +1,130 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from SWMMToWESTConvert import networkTopology as nt
+from SWMMToWESTConvert import SWMM_InpConstants as SWWM_C
+
+
+@pytest.fixture
+def sample_links():
+    # N1 splits into L2 (small) and L3 (large), both reach N4 which drains into the outlet
+    return pd.DataFrame({SWWM_C.IN_NODE: ['N0','N1','N1','N2','N3','N4'],
+                         SWWM_C.OUT_NODE: ['N1','N2','N3','N4','N4','OUT'],
+                         SWWM_C.MAX_Q: [1.0, 0.5, 2.0, 0.5, 2.0, 3.0],
+                         SWWM_C.DIAM: [0.5, 0.3, 0.3, 0.3, 0.6, 0.8]},
+                        index=pd.Index(['L1','L2','L3','L4','L5','L6'], name=SWWM_C.NAME))
+
+def test_NetworkTopology_adjacency(sample_links):
+    topology = nt.NetworkTopology(sample_links)
+    n1 = topology.getNodeId('N1')
+    n4 = topology.getNodeId('N4')
+
+    assert topology.getLinksNames(topology.getLinksOut(n1)) == ['L3','L2'] #largest MaxQ first
+    assert topology.getLinksNames(topology.getLinksIn(n4)) == ['L4','L5'] #order of the links table
+    assert topology.getLinksNames(topology.getLinksOut(topology.getNodeId('OUT'))) == []
+    assert topology.getNodeId('NotANode') == -1
+
+def test_getPreferenceOrder_ties_and_missing_values():
+    links = pd.DataFrame({SWWM_C.MAX_Q: [1.0, np.nan, 1.0, 1.0, 2.0],
+                          SWWM_C.DIAM: [0.3, 0.9, np.nan, 0.3, 0.1]}, index=['A','B','C','D','E'])
+
+    order = nt.getPreferenceOrder(links[SWWM_C.MAX_Q].to_numpy(), links[SWWM_C.DIAM].to_numpy())
+    expected = links.sort_values(by=[SWWM_C.MAX_Q,SWWM_C.DIAM], ascending=False).index.tolist()
+
+    assert links.index[order].tolist() == expected == ['E','A','D','C','B']
+
+def test_getTopologicalLevels(sample_links):
+    topology = nt.NetworkTopology(sample_links)
+    levels = [sorted(topology.nodeNames[level]) for level in nt.getTopologicalLevels(topology)]
+
+    assert levels == [['N0'], ['N1'], ['N2','N3'], ['N4'], ['OUT']]
+
+def test_getTopologicalLevels_leaves_loops_out():
+    links = pd.DataFrame({SWWM_C.IN_NODE: ['N0','N1','N2','N2'],
+                          SWWM_C.OUT_NODE: ['N1','N2','N1','OUT'],
+                          SWWM_C.MAX_Q: 1.0, SWWM_C.DIAM: 0.3}, index=['L1','L2','L3','L4'])
+    topology = nt.NetworkTopology(links)
+
+    assert np.concatenate(nt.getTopologicalLevels(topology)).tolist() == [topology.getNodeId('N0')]
+
+def test_accumulateUpstream_splits_by_MaxQ(sample_links):
+    topology = nt.NetworkTopology(sample_links)
+    nodeValues = np.zeros((len(topology.nodeNames), 2))
+    nodeValues[topology.getNodeId('N0')] = [10, 1]
+    nodeValues[topology.getNodeId('N2')] = [5, 0]
+
+    nodeTotals, linkTotals = nt.accumulateUpstream(topology, nodeValues)
+    linkOf = dict(zip(topology.linkNames, linkTotals.tolist()))
+
+    assert linkOf['L2'] == pytest.approx([2, 0.2]) and linkOf['L3'] == pytest.approx([8, 0.8]) #MaxQ 0.5 and 2
+    assert linkOf['L4'] == pytest.approx([7, 0.2])
+    assert nodeTotals[topology.getNodeId('OUT')] == pytest.approx([15, 1])
+
+def test_accumulateUpstream_even_split_without_weights(sample_links):
+    topology = nt.NetworkTopology(sample_links)
+    nodeValues = np.zeros(len(topology.nodeNames))
+    nodeValues[topology.getNodeId('N1')] = 4
+
+    _, linkTotals = nt.accumulateUpstream(topology, nodeValues, np.zeros(len(topology.linkNames)))
+
+    assert linkTotals[topology.linkIds['L2']] == linkTotals[topology.linkIds['L3']] == 2
+
+@pytest.fixture
+def looped_links():
+    # N1 -> N2 -> N3 -> N1 is a loop fed by N0 that drains into OUT through N3
+    return pd.DataFrame({SWWM_C.IN_NODE: ['N0','N1','N2','N3','N3'],
+                         SWWM_C.OUT_NODE: ['N1','N2','N3','N1','OUT'],
+                         SWWM_C.MAX_Q: 1.0, SWWM_C.DIAM: 0.3}, index=['L1','L2','L3','L4','L5'])
+
+def test_components_and_loops(looped_links):
+    topology = nt.NetworkTopology(looped_links)
+    componentOf = dict(zip(topology.nodeNames, topology.components))
+
+    assert componentOf['N1'] == componentOf['N2'] == componentOf['N3']
+    assert componentOf['N0'] < componentOf['N1'] < componentOf['OUT'] #topological order
+    assert [sorted(loop) for loop in nt.getLoops(topology)] == [['N1','N2','N3']]
+
+def test_condenseTopology_is_acyclic(looped_links):
+    condensed = nt.condenseTopology(nt.NetworkTopology(looped_links))
+
+    assert condensed.linkNames.tolist() == ['L1','L5']
+    assert sum(len(level) for level in nt.getTopologicalLevels(condensed)) == len(condensed.nodeNames) == 3
+
+def test_accumulateUpstream_through_loop(looped_links):
+    topology = nt.NetworkTopology(looped_links)
+    nodeValues = np.ones(len(topology.nodeNames))
+
+    nodeTotals, linkTotals = nt.accumulateUpstream(topology, nodeValues)
+
+    assert nodeTotals[topology.getNodeId('N2')] == 4 #N0 and the three nodes of the loop
+    assert linkTotals[topology.linkIds['L5']] == 4 and linkTotals[topology.linkIds['L3']] == 4
+    assert nodeTotals[topology.getNodeId('OUT')] == 5
+
+def test_Network_arrays_and_tables(sample_links):
+    links = sample_links.assign(**{SWWM_C.SHAPE: ['CIRCULAR','CIRCULAR','RECT_CLOSED','CIRCULAR','CIRCULAR','RECT_CLOSED']})
+    network = nt.Network(links)
+    path = network.getLinkIds(['L3','L5'])
+
+    assert path.tolist() == [2, 4]
+    assert network.maxQ[path].tolist() == [2.0, 2.0]
+    assert network.shapeNames[network.shapeCodes[path]].tolist() == ['RECT_CLOSED','CIRCULAR']
+    assert np.isnan(network.slopes).all() and np.isnan(network.roughness).all() #columns missing from the table
+    assert network.getLinksNames(network.getLinksOut(network.getNodeId('N1'))) == ['L3','L2'] #sorted from the arrays
+    pd.testing.assert_frame_equal(network.getLinksTable(path), links.loc[['L3','L5']])
+
+def test_Network_getLinksConnectedToPath(sample_links):
+    network = nt.Network(sample_links)
+
+    connected, trunkLinks = network.getLinksConnectedToPath(network.getLinkIds(['L1','L3','L5','L6']))
+
+    assert network.linkNames[connected].tolist() == ['L4'] #L2 discharges into N2, which is not on the path
+    assert network.linkNames[trunkLinks].tolist() == ['L5']
+
+def test_getNodesUpstream(sample_links):
+    topology = nt.NetworkTopology(sample_links)
+
+    upstream = nt.getNodesUpstream(topology, topology.getNodeId('N4'))
+
+    assert sorted(topology.nodeNames[upstream]) == ['N0','N1','N2','N3','N4']
+    assert not nt.getNodesUpstream(topology, -1).any()
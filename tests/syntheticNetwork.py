@@ -0,0 +1,83 @@
+"""
+    Builds the elements of a small SWMM network and writes its results (.out) to test the aggregation of a network without running a simulation.
+
+    The trunk T0 -> WRRF receives at T2 two branches (A and B, discharging at the same node) and at T3 a small pipe (C).
+    Branch A has a sub-branch (S) discharging at A1:
+
+        S0 -SL1- S1 -SL2- A1
+        A0 -AL1- A1 -AL2- A2 -AL3- T2
+                          B0 -BL1- B1 -BL2- T2
+        T0 -TL1- T1 -TL2- T2 -TL3- T3 -TL4- T4 -TL5- WRRF
+                                   C0 -CL1- T3
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import SWMMToWESTConvert.SWMM_InpConstants as SWWM_C
+import SWMMToWESTConvert.SWMMtoWESTConstants as STW_C
+from tests.syntheticOut import writeSWMMOut
+
+ID_WRRF = 'WRRF'
+
+#name, inlet, outlet, mean flow (m3/s)
+LINKS = [('TL1', 'T0', 'T1', 6.0), ('TL2', 'T1', 'T2', 6.0), ('TL3', 'T2', 'T3', 15.0), ('TL4', 'T3', 'T4', 15.1), ('TL5', 'T4', ID_WRRF, 15.1),
+         ('AL1', 'A0', 'A1', 3.0), ('AL2', 'A1', 'A2', 5.0), ('AL3', 'A2', 'T2', 5.0),
+         ('SL1', 'S0', 'S1', 2.0), ('SL2', 'S1', 'A1', 2.0),
+         ('BL1', 'B0', 'B1', 4.0), ('BL2', 'B1', 'T2', 4.0),
+         ('CL1', 'C0', 'T3', 0.1)]
+
+#links of 100 m except the last one of the trunk, so its section has several tanks in series
+LENGTHS = {'TL5': 1000.0}
+
+#subcatchments draining to every node that is not the WRRF and a dry weather flow with the same pattern at the upstream nodes
+NODES = sorted({node for _, inlet, outlet, _ in LINKS for node in (inlet, outlet)} - {ID_WRRF})
+DWF_NODES = ['T0', 'A0', 'S0', 'B0', 'C0']
+PATTERN = 'DWF1'
+
+
+def getSyntheticElements()->dict:
+    """
+        Returns the elements of the synthetic network as returned by getNetworkFromSWMM.getNetwork, without reading an .inp.
+    Returns:
+        dict: Dictionary with links, leaves, catchments, DWFs, timepatterns, directflows and timeseries of the network.
+    """
+    names = [name for name, _, _, _ in LINKS]
+    links = pd.DataFrame({SWWM_C.IN_NODE: [inlet for _, inlet, _, _ in LINKS], SWWM_C.OUT_NODE: [outlet for _, _, outlet, _ in LINKS],
+                          SWWM_C.LEN: [LENGTHS.get(name, 100.0) for name in names], SWWM_C.DIAM: 1.0, SWWM_C.MAX_Q: [2*flow for _, _, _, flow in LINKS], SWWM_C.ROUG: 0.013,
+                          SWWM_C.SHAPE: SWWM_C.CIRC, STW_C.SLOPE: 0.001}, index=pd.Index(names, name=SWWM_C.NAME))
+
+    nElements = {STW_C.LINKS: links,
+                 STW_C.LEAVES: sorted(set(links[SWWM_C.IN_NODE]) - set(links[SWWM_C.OUT_NODE])),
+                 STW_C.SUBCATCHMENTS: pd.DataFrame({SWWM_C.CATCH_OUT: NODES, SWWM_C.AREA: 1.5}, 
+                                                   index=pd.Index([f'SC_{node}' for node in NODES], name=SWWM_C.NAME)),
+                 STW_C.DWFS: pd.DataFrame({SWWM_C.INFLOW_MEAN: 0.01, SWWM_C.INFLOW_PATTERNS: PATTERN}, 
+                                          index=pd.Index(DWF_NODES, name=SWWM_C.INFLOW_NODE)),
+                 STW_C.T_PATTERNS: {PATTERN: ['1.0']*24},
+                 STW_C.DIRECTF: pd.DataFrame({SWWM_C.DFLOW_TIMES: [np.nan], SWWM_C.DFLOW_SFACTOR: [1], SWWM_C.DFLOW_BASELINE: [0.002]}, 
+                                             index=pd.Index(['T1'], name=SWWM_C.INFLOW_NODE)),
+                 STW_C.TIMESERIES: pd.DataFrame(columns=['Date', 'Time', 'Value'])}
+
+    return nElements
+
+def writeSyntheticOut(folder:str, nDays:int=3)->str:
+    """
+        Writes the .out (hourly results during nDays) of the synthetic network. The flow of each link is its mean flow
+        with a small variation along the day.
+    Args:
+        folder (str): folder where the file is created
+        nDays (int): days simulated
+    Returns:
+        str: path of the .out created
+    """
+    nPeriods = 24*nDays
+    meanFlows = np.array([flow for _, _, _, flow in LINKS])
+    daily = 1 + 0.1*np.sin(np.arange(nPeriods) * 2*np.pi/24)
+    linkValues = np.zeros((nPeriods, len(LINKS), 5))
+    linkValues[:, :, 0] = daily[:, None] * meanFlows[None, :]
+
+    subcatchments = [f'SC_{node}' for node in NODES]
+    return writeSWMMOut(os.path.join(folder, 'synthetic.out'), subcatchments, NODES + [ID_WRRF], [name for name, _, _, _ in LINKS],
+                 45000.0, 3600, np.zeros((nPeriods, len(subcatchments), 8)), np.zeros((nPeriods, len(NODES) + 1, 6)), linkValues)
@@ -0,0 +1,72 @@
+"""
+    Writes small SWMM5 binary result files (.out) to test the readers without running a simulation.
+"""
+
+import numpy as np
+
+MAGIC = 516114522
+VERSION = 51015
+FLOW_UNITS_CMS = 3
+N_SUBCATCH_VARS = 8
+N_NODE_VARS = 6
+N_LINK_VARS = 5
+N_SYS_VARS = 15
+
+
+def writeSWMMOut(path:str, subcatchments:list[str], nodes:list[str], links:list[str], startDate:float, reportStep:int,
+                 subcatchValues:np.ndarray, nodeValues:np.ndarray, linkValues:np.ndarray)->str:
+    """
+        Writes a SWMM5 binary output file without pollutants.
+    Args:
+        path (str): path of the .out to create
+        subcatchments (list[str]): names of the subcatchments
+        nodes (list[str]): names of the nodes
+        links (list[str]): names of the links
+        startDate (float): start date of the simulation as a SWMM date (days since 30/12/1899)
+        reportStep (int): report step in seconds
+        subcatchValues (np.ndarray): values with shape (periods, subcatchments, 8)
+        nodeValues (np.ndarray): values with shape (periods, nodes, 6)
+        linkValues (np.ndarray): values with shape (periods, links, 5)
+    Returns:
+        str: path of the .out created
+    """
+    nPeriods = linkValues.shape[0]
+
+    with open(path, 'wb') as f:
+        np.array([MAGIC, VERSION, FLOW_UNITS_CMS, len(subcatchments), len(nodes), len(links), 0], dtype='<i4').tofile(f)
+
+        idStart = f.tell()
+        for name in subcatchments + nodes + links:
+            encoded = name.encode()
+            np.array([len(encoded)], dtype='<i4').tofile(f)
+            f.write(encoded)
+
+        inputStart = f.tell()
+        np.array([1, 1], dtype='<i4').tofile(f) #subcatchment area
+        np.ones(len(subcatchments), dtype='<f4').tofile(f)
+        np.array([3, 0, 2, 3], dtype='<i4').tofile(f) #node type, invert and max depth
+        for _ in nodes:
+            np.array([0], dtype='<i4').tofile(f)
+            np.zeros(2, dtype='<f4').tofile(f)
+        np.array([5, 0, 4, 4, 3, 5], dtype='<i4').tofile(f) #link type, offsets, max depth and length
+        for _ in links:
+            np.array([0], dtype='<i4').tofile(f)
+            np.zeros(4, dtype='<f4').tofile(f)
+
+        for nVars in (N_SUBCATCH_VARS, N_NODE_VARS, N_LINK_VARS, N_SYS_VARS):
+            np.array([nVars] + list(range(nVars)), dtype='<i4').tofile(f)
+
+        np.array([startDate], dtype='<f8').tofile(f)
+        np.array([reportStep], dtype='<i4').tofile(f)
+
+        outputStart = f.tell()
+        for t in range(nPeriods):
+            np.array([startDate + (t + 1) * reportStep / 86400], dtype='<f8').tofile(f)
+            subcatchValues[t].astype('<f4').tofile(f)
+            nodeValues[t].astype('<f4').tofile(f)
+            linkValues[t].astype('<f4').tofile(f)
+            np.zeros(N_SYS_VARS, dtype='<f4').tofile(f)
+
+        np.array([idStart, inputStart, outputStart, nPeriods, 0, MAGIC], dtype='<i4').tofile(f)
+
+    return path
@@ -1,5 +1,6 @@
 import pytest
 import os
+import copy
 import xml.etree.ElementTree as ET
 
 from SWMMToWESTConvert import updateWESTfiles as uf
@@ -110,9 +111,9 @@ def names_Dict_Conf2():
 @pytest.fixture
 def elements():
 
-    sewers = [{'PipeName': 'Sew_1i - Sew_1f','tanksIndexes': [1,2,3,4]},
-              {'PipeName': 'Sew_2i - Sew_2f','tanksIndexes': [5,6,7]},
-              {'PipeName': 'Sew_3i - Sew_3f','tanksIndexes': [8,9,10]}]
+    sewers = [{'PipeName': 'Sew_1i - Sew_1f','TanksIndexes': [1,2,3,4]},
+              {'PipeName': 'Sew_2i - Sew_2f','TanksIndexes': [5,6,7]},
+              {'PipeName': 'Sew_3i - Sew_3f','TanksIndexes': [8,9,10]}]
     catchments = [{'CatchmentName': 'Sew_1i - Sew_1f(Catch)[previous]','EndNode': False},
                   {'CatchmentName': 'Sew_1i - Sew_1f(Catch)','EndNode': True},
                   {'CatchmentName': 'Sew_2i - Sew_2f(Catch)[input]','EndNode': True},
@@ -124,9 +125,9 @@ def elements():
 @pytest.fixture
 def elements1():
 
-    sewers = [{'PipeName': 'Sew_1i - Sew_1f','tanksIndexes': [1,2,3]},
-              {'PipeName': 'Sew_2i - Sew_2f','tanksIndexes': [4,5,6]},
-              {'PipeName': 'Sew_3i - Sew_3f','tanksIndexes': [7,8,9,10]}]
+    sewers = [{'PipeName': 'Sew_1i - Sew_1f','TanksIndexes': [1,2,3]},
+              {'PipeName': 'Sew_2i - Sew_2f','TanksIndexes': [4,5,6]},
+              {'PipeName': 'Sew_3i - Sew_3f','TanksIndexes': [7,8,9,10]}]
     catchments = [{'CatchmentName': 'Sew_1i - Sew_1f(Catch)','EndNode': True},
                   {'CatchmentName': 'Sew_2i - Sew_2f(Catch)[previous]','EndNode': False},
                   {'CatchmentName': 'Sew_2i - Sew_2f(Catch)[input]','EndNode': True},
@@ -138,10 +139,10 @@ def elements1():
 @pytest.fixture
 def elements2():
 
-    sewers = [{'PipeName': 'Sew_1i - Sew_1f','tanksIndexes': [1]},
-              {'PipeName': 'Sew_2i - Sew_2f','tanksIndexes': [2,3,4,5,6]},
-              {'PipeName': 'Sew_3i - Sew_3f','tanksIndexes': [7]},
-              {'PipeName': 'Sew_4i - Sew_4f','tanksIndexes': [8,9,10]}]
+    sewers = [{'PipeName': 'Sew_1i - Sew_1f','TanksIndexes': [1]},
+              {'PipeName': 'Sew_2i - Sew_2f','TanksIndexes': [2,3,4,5,6]},
+              {'PipeName': 'Sew_3i - Sew_3f','TanksIndexes': [7]},
+              {'PipeName': 'Sew_4i - Sew_4f','TanksIndexes': [8,9,10]}]
     catchments = [{'CatchmentName': 'Sew_2i - Sew_2f(Catch)[previous]','EndNode': False},
                   {'CatchmentName': 'Sew_2i - Sew_2f(Catch)[input]','EndNode': True},
                   {'CatchmentName': 'Sew_3i - Sew_3f(Catch)','EndNode': True},
@@ -153,9 +154,9 @@ def elements2():
 @pytest.fixture
 def pipeSectionsAndDict():
 
-    pipeSections = [{"PipeName": "UNI_5277 - UNI_602608", "tanksIndexes": [1, 2, 3]},
-                    {"PipeName": "UNI_602607 - UNI_18252", "tanksIndexes": [4, 5, 6]},
-                    {"PipeName": "UNI_18251 - DOM_35983", "tanksIndexes": [7, 8, 9]}]
+    pipeSections = [{"PipeName": "UNI_5277 - UNI_602608", "TanksIndexes": [1, 2, 3]},
+                    {"PipeName": "UNI_602607 - UNI_18252", "TanksIndexes": [4, 5, 6]},
+                    {"PipeName": "UNI_18251 - DOM_35983", "TanksIndexes": [7, 8, 9]}]
     
     namesDict = {
                     "UNI_5277 - UNI_602608(1)": "Icon1",
@@ -240,7 +241,7 @@ def initialXML():
 @pytest.fixture(scope='session')
 def dictForWEST():
 
-    listTrunk = [] 
+    listTrunk = {} 
     listSewersTrunk = []
     listCatchTrunk = []
     
@@ -256,8 +257,8 @@ def dictForWEST():
         catch = createMockCatchDict(name, area, end)
         listCatchTrunk.append(catch)
 
-    listTrunk.append(listSewersTrunk)
-    listTrunk.append(listCatchTrunk)
+    listTrunk['PathTankInSeries'] = listSewersTrunk
+    listTrunk['WESTCatchments'] = listCatchTrunk
 
     # --------------- Branches ----------------------------------------------
     branches = {}
@@ -313,7 +314,7 @@ def createMockSewerDict(name: str, valArea: str, listIndexes: list[int]):
               'AreaTank': valArea,
               'Volmax': 10,
               'k':0.2,
-              'tanksIndexes': listIndexes}
+              'TanksIndexes': listIndexes}
     
     return ssDict
 
@@ -452,7 +453,7 @@ def test_connectPipeSection(sample_Links,names_Dict):
     tree = sample_Links[1]
     linki = 3
     lastElement = "Icon22"
-    pipeSection = {"tanksIndexes":[1, 2, 3],"PipeName":"PipeSect1"}
+    pipeSection = {"TanksIndexes":[1, 2, 3],"PipeName":"PipeSect1"}
 
     result_linksXML, result_linki, result_lastElement = uf.connectPipeSection(names_Dict, linksXML, linki, lastElement, pipeSection)
 
@@ -473,7 +474,7 @@ def test_connectPipeSection_with_lastElement_none(sample_Links,names_Dict):
     tree = sample_Links[1]
     linki = 3
     lastElement = None
-    pipeSection = {"tanksIndexes":[1, 2, 3],"PipeName":"PipeSect1"}
+    pipeSection = {"TanksIndexes":[1, 2, 3],"PipeName":"PipeSect1"}
 
     result_linksXML, result_linki, result_lastElement = uf.connectPipeSection(names_Dict, linksXML, linki, lastElement, pipeSection)
 
@@ -656,7 +657,7 @@ def test_setPathElementsProp(initialXML,modelClasses,dictForWEST):
     root = tree.getroot()
     
     allXMLSubmodels = uf.getModelsByTypeAndSetClasses(root,modelClasses,3,24)
-    root, namesDict, iCatchN, iCombN = uf. setPathElementsProp(root, dictForWEST[0][0], dictForWEST[0][1], dictForWEST[2]['Trunk'], allXMLSubmodels, 1, 1)
+    root, namesDict, iCatchN, iCombN = uf. setPathElementsProp(root, dictForWEST[0]['PathTankInSeries'], dictForWEST[0]['WESTCatchments'], dictForWEST[2]['Trunk'], allXMLSubmodels, 1, 1)
     
     assert iCatchN == 5, f"The next index for catchment is not the expected"
     assert iCombN == 5, f"The next index for combiner is not the expected"
@@ -716,6 +717,41 @@ def test_connectBranchToCombiner(sample_Links):
     assert iCombN == 5, f"The index of the next combiner is not the expected"
     assert result_lastElement == "IconCombiner", f"The name of the combiner model is not correct"
 
+def test_updateWESTLayoutFile_with_subbranch(initialXML, dictForWEST, modelClasses):
+
+    initialXMLMOD = 'tests/updateWESTLayoutFileSubBranchTEST_Result.xml'
+
+    # Branch 3 discharges in the second pipe of branch 2 instead of the trunk. The layout consumes the catchments of the fixture
+    trunk, branches, connectors = copy.deepcopy(dictForWEST)
+    subBranch = branches.pop('pipe401')
+    subBranch['Name_trunkPipe'] = 'pipe801'
+    branches['pipe301']['SubBranches'] = {'pipe401': subBranch}
+
+    uf.updateWESTLayoutFile(initialXML, initialXMLMOD, modelClasses, trunk, branches, connectors)
+
+    root = ET.parse(initialXMLMOD).getroot()
+    linksXML = root.find('.//Links')
+    assert len(list(linksXML)) == 47, "Incorrect final number of links"
+
+    checkLink(linksXML,"Link7","Icon23","Icon24","CustomOrthogonalLine7") #sub-branch starts
+    checkLink(linksXML,"Link8","Icon24","Icon41","CustomOrthogonalLine8","1") 
+    checkLink(linksXML,"Link10","Icon33","Icon41","CustomOrthogonalLine10","2") # sub-branch finishes
+    checkLink(linksXML,"Link11","Icon41","Icon42","CustomOrthogonalLine11","1") # sub-branch to connector
+
+    checkLink(linksXML,"Link12","Icon17","Icon18","CustomOrthogonalLine12") #branch 2 starts
+    checkLink(linksXML,"Link16","Icon43","Icon19","CustomOrthogonalLine16") 
+    checkLink(linksXML,"Link19","Icon21","Icon22","CustomOrthogonalLine19") 
+    checkLink(linksXML,"Link20","Icon22","Icon42","CustomOrthogonalLine20","2") #connects sub-branch
+    checkLink(linksXML,"Link21","Icon42","Icon44","CustomOrthogonalLine21","1") # branch 2 to connector
+
+    checkLink(linksXML,"Link41","Icon10","Icon44","CustomOrthogonalLine41","2") #connects branch
+    checkLink(linksXML,"Link42","Icon44","Icon11","CustomOrthogonalLine42") 
+    checkLink(linksXML,"Link44","Icon12","Icon48","CustomOrthogonalLine44","1") 
+    checkLink(linksXML,"Link47","Icon48","Icon13","CustomOrthogonalLine47") # Trunk finishes
+
+    #Cleaning
+    os.remove(initialXMLMOD)
+
 def test_updateWESTLayoutFile(initialXML, dictForWEST,modelClasses):
 
     initialXMLMOD = 'tests/updateWESTLayoutFileTEST_Result.xml'